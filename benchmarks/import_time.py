@@ -0,0 +1,94 @@
+"""
+Measures how long a fresh interpreter takes to import lakera_lcguard and create a
+guard, and fails if it exceeds the import-time budget, e.g.
+
+    poetry run python -m benchmarks.import_time --budget 0.5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import List, Optional, Sequence
+
+# Seconds a cold start of the guard client may take. Importing LangChain alone takes
+# several times as long, so this also catches it being imported eagerly again.
+IMPORT_TIME_BUDGET = 0.5
+
+# Modules that the guard client must not import before they are used
+LAZY_MODULES = ["langchain", "langchain_core", "requests", "aiohttp"]
+
+_MEASUREMENT = """
+import json, sys, time
+start = time.perf_counter()
+from lakera_lcguard import LakeraLCGuard
+LakeraLCGuard(api_key="benchmark")
+seconds = time.perf_counter() - start
+loaded = sorted(
+    {name.split(".")[0] for name in sys.modules} & set(json.loads(sys.argv[1]))
+)
+print(json.dumps({"seconds": seconds, "loaded": loaded}))
+"""
+
+
+def measure_import_time(runs: int = 5) -> dict:
+    """
+    Imports lakera_lcguard and creates a guard in runs fresh interpreters.
+
+    Args:
+        runs: number of interpreters to measure
+    Returns:
+        the median and maximum seconds of the runs and the lazy modules that got
+        imported anyway
+    """
+    seconds: List[float] = []
+    loaded: set = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _MEASUREMENT, json.dumps(LAZY_MODULES)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        run = json.loads(output)
+        seconds.append(run["seconds"])
+        loaded.update(run["loaded"])
+    return {
+        "runs": runs,
+        "median": statistics.median(seconds),
+        "max": max(seconds),
+        "loaded": sorted(loaded),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Check the import time of lakera_lcguard against a budget."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=IMPORT_TIME_BUDGET,
+        help="maximum median seconds to import lakera_lcguard and create a guard",
+    )
+    args = parser.parse_args(argv)
+
+    result = measure_import_time(args.runs)
+    json.dump({**result, "budget": args.budget}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if result["loaded"]:
+        sys.exit(f"Importing lakera_lcguard imported {', '.join(result['loaded'])}.")
+    if result["median"] > args.budget:
+        sys.exit(
+            f"Importing lakera_lcguard took {result['median']:.3f} s, the budget is "
+            f"{args.budget:.3f} s."
+        )
+
+
+if __name__ == "__main__":
+    main()
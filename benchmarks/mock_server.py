@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional
+
+_EMAIL_ADDRESS = re.compile(r"\S+@\S+\.\w+")
+
+
+class _MockLakeraGuardHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST /v1/{endpoint} requests like Lakera Guard.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body get written separately, which would otherwise stall every
+    # response on a delayed ACK of the client
+    disable_nagle_algorithm = True
+    server: "_MockServer"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        request_body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+        mock = self.server.mock
+        mock._count_request()
+
+        delay = mock.latency + random.uniform(0.0, mock.jitter)
+        if delay:
+            time.sleep(delay)
+
+        inputs = request_body.get("input")
+        if not (isinstance(inputs, list) and inputs and isinstance(inputs[0], str)):
+            inputs = [inputs]
+        response = {
+            "model": "mock",
+            "results": [mock._get_result(endpoint, query) for query in inputs],
+            "dev_info": {},
+        }
+
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, mock: MockLakeraGuard) -> None:
+        super().__init__((mock.host, mock.port), _MockLakeraGuardHandler)
+        self.mock = mock
+
+
+class MockLakeraGuard:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        flag_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """
+        Local HTTP server that imitates the /v1/{endpoint} contract of Lakera Guard,
+        so that the overhead of the guard can be measured without network access.
+
+        Whether an input gets flagged only depends on the input, so that repeated
+        runs (and cached verdicts) agree. Inputs that contain "ignore" are always
+        flagged, the pii endpoint flags inputs with email addresses and returns
+        them as entities, and requests with a list of inputs get one result per
+        input.
+
+        Args:
+            latency: number of seconds every request takes
+            jitter: maximum number of seconds added randomly to the latency
+            flag_rate: share of the inputs that get flagged, between 0 and 1
+            host: host to listen on
+            port: port to listen on, 0 to pick a free port
+        Returns:
+            None
+        """
+        if not 0.0 <= flag_rate <= 1.0:
+            raise ValueError(f"flag_rate must be between 0 and 1, got {flag_rate}.")
+        self.latency = latency
+        self.jitter = jitter
+        self.flag_rate = flag_rate
+        self.host = host
+        self.port = port
+        self.request_count = 0
+
+        self._lock = threading.Lock()
+        self._server: Optional[_MockServer] = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        Base URL of the running server, e.g. for LakeraTransport(base_url=...).
+        """
+        if self._server is None:
+            raise RuntimeError("The mock server has not been started.")
+        return f"http://{self.host}:{self._server.server_address[1]}"
+
+    def start(self) -> MockLakeraGuard:
+        """
+        Starts serving requests in a background thread.
+
+        Returns:
+            the started server
+        """
+        self._server = _MockServer(self)
+        threading.Thread(
+            target=self._server.serve_forever, name="mock_lakera_guard", daemon=True
+        ).start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the server.
+
+        Returns:
+            None
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> MockLakeraGuard:
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def _count_request(self) -> None:
+        with self._lock:
+            self.request_count += 1
+
+    def _is_flagged(self, text: str) -> bool:
+        if "ignore" in text.lower():
+            return True
+        # Deterministic per input, uniformly distributed over the inputs
+        return zlib.crc32(text.encode()) / 0xFFFFFFFF < self.flag_rate
+
+    def _get_result(self, endpoint: str, query: Any) -> dict:
+        if isinstance(query, list):
+            text = "\n".join(str(message.get("content", "")) for message in query)
+        else:
+            text = str(query)
+
+        payload: dict = {}
+        if endpoint == "pii":
+            entities: List[dict] = [
+                {
+                    "start": match.start(),
+                    "end": match.end(),
+                    "entity_type": "EMAIL_ADDRESS",
+                    "text": match.group(),
+                }
+                for match in _EMAIL_ADDRESS.finditer(text)
+            ]
+            payload["pii"] = entities
+            flagged = bool(entities)
+        else:
+            flagged = self._is_flagged(text)
+
+        return {
+            "categories": {endpoint: flagged},
+            "category_scores": {endpoint: float(flagged)},
+            "flagged": flagged,
+            "payload": payload,
+        }
@@ -0,0 +1,435 @@
+"""
+Measures the throughput and latency of the guard against a local mock of Lakera
+Guard, e.g.
+
+    poetry run python -m benchmarks.run --latency 0.02 --output results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+from typing import Any, Callable, List, Optional, Sequence
+
+from langchain.agents import Tool
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+from benchmarks.mock_server import MockLakeraGuard
+from lakera_lcguard import (
+    InMemoryCache,
+    LakeraGuardWarning,
+    LakeraLCGuard,
+    LakeraTransport,
+)
+
+SCENARIOS = [
+    "detect",
+    "detect_cached",
+    "detect_batch",
+    "guarded_llm",
+    "guarded_chat_llm",
+    "chat_conversation",
+    "agent_executor",
+    "threaded_detect",
+    "async_detect",
+]
+
+
+def _summarize(
+    name: str, durations: List[float], seconds: float, **details: Any
+) -> dict:
+    """
+    Summarizes the durations of the operations of a scenario.
+
+    Args:
+        name: name of the scenario
+        durations: number of seconds each operation took
+        seconds: number of seconds the whole scenario took
+        details: further fields of the result, e.g. the concurrency
+    Returns:
+        the result of the scenario
+    """
+    ordered = sorted(durations)
+
+    def percentile(share: float) -> float:
+        return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+    return {
+        "name": name,
+        **details,
+        "operations": len(durations),
+        "seconds": seconds,
+        "throughput": len(durations) / seconds if seconds else 0.0,
+        "latency": {
+            "mean": statistics.fmean(ordered),
+            "p50": percentile(0.5),
+            "p90": percentile(0.9),
+            "p99": percentile(0.99),
+            "max": ordered[-1],
+        },
+    }
+
+
+def _measure(
+    name: str, operation: Callable[[int], Any], iterations: int, **details: Any
+) -> dict:
+    """
+    Runs an operation iterations times, one after the other.
+
+    Args:
+        name: name of the scenario
+        operation: the operation, called with the number of the iteration
+        iterations: number of times to run the operation
+        details: further fields of the result
+    Returns:
+        the result of the scenario
+    """
+    durations = []
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        operation_start = time.perf_counter()
+        operation(iteration)
+        durations.append(time.perf_counter() - operation_start)
+    return _summarize(name, durations, time.perf_counter() - start, **details)
+
+
+def _measure_threaded(
+    name: str,
+    operation: Callable[[int], Any],
+    iterations: int,
+    concurrency: int,
+    **details: Any,
+) -> dict:
+    """
+    Runs an operation iterations times, concurrency at a time in threads.
+
+    Args:
+        name: name of the scenario
+        operation: the operation, called with the number of the iteration
+        iterations: number of times to run the operation
+        concurrency: number of threads
+        details: further fields of the result
+    Returns:
+        the result of the scenario
+    """
+
+    def timed(iteration: int) -> float:
+        operation_start = time.perf_counter()
+        operation(iteration)
+        return time.perf_counter() - operation_start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        durations = list(executor.map(timed, range(iterations)))
+    return _summarize(
+        name,
+        durations,
+        time.perf_counter() - start,
+        concurrency=concurrency,
+        **details,
+    )
+
+
+async def _ameasure(
+    name: str,
+    operation: Callable[[int], Any],
+    iterations: int,
+    concurrency: int,
+    **details: Any,
+) -> dict:
+    """
+    Asynchronous version of _measure_threaded that runs the coroutines of
+    operation concurrency at a time on one event loop.
+
+    Args:
+        name: name of the scenario
+        operation: returns the coroutine of an operation, called with the number
+            of the iteration
+        iterations: number of times to run the operation
+        concurrency: number of concurrent coroutines
+        details: further fields of the result
+    Returns:
+        the result of the scenario
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(iteration: int) -> float:
+        async with semaphore:
+            operation_start = time.perf_counter()
+            await operation(iteration)
+            return time.perf_counter() - operation_start
+
+    start = time.perf_counter()
+    durations = await asyncio.gather(*(timed(i) for i in range(iterations)))
+    return _summarize(
+        name,
+        list(durations),
+        time.perf_counter() - start,
+        concurrency=concurrency,
+        **details,
+    )
+
+
+def _get_agent_executor(lakera_guard: LakeraLCGuard, steps: int) -> Any:
+    """
+    Creates a guarded AgentExecutor whose agent calls an echo tool steps times
+    before it finishes.
+
+    Args:
+        lakera_guard: the guard of the AgentExecutor
+        steps: number of tool calls per run
+    Returns:
+        the guarded AgentExecutor
+    """
+
+    def plan(inputs: dict) -> Any:
+        step = len(inputs["intermediate_steps"])
+        if step >= steps:
+            return AgentFinish({"output": "done"}, "done")
+        return AgentAction("echo", f"Observation of step {step}", "")
+
+    echo = Tool(name="echo", func=lambda text: text, description="Echoes its input.")
+    GuardedAgentExecutor = lakera_guard.get_guarded_agent_executor()
+    return GuardedAgentExecutor(
+        agent=RunnableLambda(plan), tools=[echo], max_iterations=steps + 1
+    )
+
+
+def run_benchmarks(
+    iterations: int = 100,
+    concurrency: int = 8,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    flag_rate: float = 0.0,
+    agent_steps: Sequence[int] = (1, 5, 10),
+    scenarios: Optional[Sequence[str]] = None,
+) -> dict:
+    """
+    Runs the benchmark scenarios against a local mock of Lakera Guard.
+
+    Args:
+        iterations: number of operations per scenario
+        concurrency: number of concurrent operations of the threaded and
+            asynchronous scenarios
+        latency: number of seconds every request to the mock takes
+        jitter: maximum number of seconds added randomly to the latency
+        flag_rate: share of the inputs that the mock flags
+        agent_steps: numbers of tool calls per run of the agent_executor scenario
+        scenarios: names of the scenarios to run, defaults to all SCENARIOS
+    Returns:
+        the configuration, the environment and the result of every scenario
+    """
+    scenarios = list(scenarios or SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios {sorted(unknown)}.")
+
+    try:
+        package_version = version("lakera-lcguard")
+    except PackageNotFoundError:
+        package_version = "unknown"
+
+    results: List[dict] = []
+    with MockLakeraGuard(latency, jitter, flag_rate) as mock, warnings.catch_warnings():
+        # Flagged inputs warn instead of raise, so that every operation completes
+        warnings.simplefilter("ignore", LakeraGuardWarning)
+        transport = LakeraTransport(base_url=mock.base_url, pool_size=concurrency)
+
+        def get_guard(**kwargs: Any) -> LakeraLCGuard:
+            return LakeraLCGuard(
+                api_key="benchmark", transport=transport, raise_error=False, **kwargs
+            )
+
+        lakera_guard = get_guard()
+
+        def prompt(iteration: int) -> str:
+            return f"What is the capital of country number {iteration}?"
+
+        def measure(name: str, operation: Callable[[int], Any], **details: Any) -> None:
+            requests_before = mock.request_count
+            result = _measure(name, operation, iterations, **details)
+            result["requests"] = mock.request_count - requests_before
+            results.append(result)
+
+        if "detect" in scenarios:
+            measure("detect", lambda i: lakera_guard.detect(prompt(i)))
+
+        if "detect_cached" in scenarios:
+            cached_guard = get_guard(cache=InMemoryCache())
+            measure("detect_cached", lambda i: cached_guard.detect(prompt(i % 10)))
+
+        if "detect_batch" in scenarios:
+            measure(
+                "detect_batch",
+                lambda i: lakera_guard.detect_batch(
+                    [prompt(i * 10 + j) for j in range(10)]
+                ),
+                batch_size=10,
+            )
+
+        if "guarded_llm" in scenarios:
+            llm = lakera_guard.get_guarded_llm(FakeListLLM)(responses=["Paris"])
+            measure("guarded_llm", lambda i: llm.invoke(prompt(i)))
+
+        if "guarded_chat_llm" in scenarios:
+            chat_llm = lakera_guard.get_guarded_chat_llm(FakeListChatModel)(
+                responses=["Paris"]
+            )
+            measure(
+                "guarded_chat_llm",
+                lambda i: chat_llm.invoke(
+                    [SystemMessage(content="Answer briefly."), HumanMessage(prompt(i))]
+                ),
+            )
+
+        if "chat_conversation" in scenarios:
+            # One turn per operation of a conversation that keeps growing, checked
+            # as a whole and incrementally
+            for name, conversation_guard in [
+                ("chat_conversation", lakera_guard),
+                (
+                    "chat_conversation_incremental",
+                    get_guard(max_context_messages=4, incremental=True),
+                ),
+            ]:
+                conversation_llm = conversation_guard.get_guarded_chat_llm(
+                    FakeListChatModel
+                )(responses=["Paris"])
+                conversation: List[BaseMessage] = [
+                    SystemMessage(content="Answer briefly.")
+                ]
+
+                def take_turn(i: int) -> None:
+                    conversation.append(HumanMessage(prompt(i)))
+                    conversation.append(conversation_llm.invoke(conversation))
+
+                measure(name, take_turn)
+
+        if "agent_executor" in scenarios:
+            for steps in agent_steps:
+                agent_executor = _get_agent_executor(lakera_guard, steps)
+                measure(
+                    f"agent_executor_{steps}_steps",
+                    lambda i: agent_executor.invoke({"input": prompt(i)}),
+                    steps=steps,
+                )
+
+        if "threaded_detect" in scenarios:
+            requests_before = mock.request_count
+            result = _measure_threaded(
+                "threaded_detect",
+                lambda i: lakera_guard.detect(prompt(i)),
+                iterations,
+                concurrency,
+            )
+            result["requests"] = mock.request_count - requests_before
+            results.append(result)
+
+        if "async_detect" in scenarios:
+
+            async def run_async() -> dict:
+                try:
+                    return await _ameasure(
+                        "async_detect",
+                        lambda i: lakera_guard.adetect(prompt(i)),
+                        iterations,
+                        concurrency,
+                    )
+                finally:
+                    await lakera_guard.aclose()
+
+            requests_before = mock.request_count
+            result = asyncio.run(run_async())
+            result["requests"] = mock.request_count - requests_before
+            results.append(result)
+
+    return {
+        "config": {
+            "iterations": iterations,
+            "concurrency": concurrency,
+            "latency": latency,
+            "jitter": jitter,
+            "flag_rate": flag_rate,
+            "agent_steps": list(agent_steps),
+        },
+        "environment": {
+            "lakera_lcguard": package_version,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the guard against a local mock of Lakera Guard."
+    )
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per mock request"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="maximum random extra seconds"
+    )
+    parser.add_argument(
+        "--flag-rate", type=float, default=0.0, help="share of flagged inputs"
+    )
+    parser.add_argument(
+        "--agent-steps", type=int, nargs="+", default=[1, 5, 10], metavar="STEPS"
+    )
+    parser.add_argument(
+        "--scenario",
+        dest="scenarios",
+        action="append",
+        choices=SCENARIOS,
+        help="scenario to run, can be given several times, defaults to all",
+    )
+    parser.add_argument(
+        "--output", help="file to write the JSON results to, defaults to stdout"
+    )
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        iterations=args.iterations,
+        concurrency=args.concurrency,
+        latency=args.latency,
+        jitter=args.jitter,
+        flag_rate=args.flag_rate,
+        agent_steps=args.agent_steps,
+        scenarios=args.scenarios,
+    )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    for result in report["results"]:
+        print(
+            f"{result['name']:<28} {result['throughput']:>10.1f} ops/s "
+            f"p50 {result['latency']['p50'] * 1000:>8.2f} ms "
+            f"p99 {result['latency']['p99'] * 1000:>8.2f} ms",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,70 @@
+from typing import TYPE_CHECKING, Any
+
 from lakera_lcguard.lakera_lcguard import (
+    GuardEndpoint,
     LakeraLCGuard,
     LakeraGuardError,
     LakeraGuardWarning,
 )
+from lakera_lcguard.audit import (
+    AuditRecord,
+    Auditor,
+    AuditSink,
+    CallbackAuditSink,
+    LoggingAuditSink,
+)
+from lakera_lcguard.bulk import Document, read_documents, scan_documents, scan_files
+from lakera_lcguard.circuit_breaker import CircuitBreaker, LakeraGuardUnavailableError
+from lakera_lcguard.cache import CacheBackend, InMemoryCache, RedisCache, SQLiteCache
+from lakera_lcguard.metrics import InMemoryMetrics, MetricsSink, PrometheusMetrics
+from lakera_lcguard.prefilter import PreFilter
+from lakera_lcguard.scheduler import (
+    RateLimitScheduler,
+    SchedulerTimeoutError,
+    scheduling,
+)
+from lakera_lcguard.transport import LakeraGuardServerError, LakeraTransport
+
+if TYPE_CHECKING:
+    from lakera_lcguard.runnable import LakeraGuardRunnable
+
+__all__ = [
+    "LakeraLCGuard",
+    "LakeraGuardError",
+    "LakeraGuardWarning",
+    "LakeraGuardUnavailableError",
+    "LakeraGuardServerError",
+    "GuardEndpoint",
+    "LakeraGuardRunnable",
+    "CircuitBreaker",
+    "Auditor",
+    "AuditRecord",
+    "AuditSink",
+    "LoggingAuditSink",
+    "CallbackAuditSink",
+    "CacheBackend",
+    "InMemoryCache",
+    "RedisCache",
+    "SQLiteCache",
+    "MetricsSink",
+    "InMemoryMetrics",
+    "PrometheusMetrics",
+    "PreFilter",
+    "RateLimitScheduler",
+    "SchedulerTimeoutError",
+    "scheduling",
+    "LakeraTransport",
+    "Document",
+    "read_documents",
+    "scan_documents",
+    "scan_files",
+]
+
+
+def __getattr__(name: str) -> Any:
+    # LakeraGuardRunnable needs LangChain, which only gets imported once it is used
+    if name == "LakeraGuardRunnable":
+        from lakera_lcguard.runnable import LakeraGuardRunnable
 
-__all__ = ["LakeraLCGuard", "LakeraGuardError", "LakeraGuardWarning"]
+        return LakeraGuardRunnable
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
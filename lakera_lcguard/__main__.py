@@ -0,0 +1,98 @@
+"""
+Command line interface of lakera_lcguard, e.g. to scan a document corpus for
+prompt injections before it gets ingested into a vector store:
+
+    python -m lakera_lcguard scan documents.jsonl --output results.jsonl \
+        --checkpoint scan.checkpoint --concurrency 16 --rate 100 --chunk-size 4000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Optional, Sequence
+
+from lakera_lcguard.bulk import scan_files
+from lakera_lcguard.circuit_breaker import LakeraGuardUnavailableError
+from lakera_lcguard.lakera_lcguard import LakeraLCGuard
+from lakera_lcguard.scheduler import RateLimitScheduler
+from lakera_lcguard.transport import LakeraTransport
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m lakera_lcguard")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan = subparsers.add_parser(
+        "scan",
+        help="scan JSONL and text files and write one result per document",
+        description="Scan the documents of JSONL files (one json object per line) "
+        "and text files with Lakera Guard and write one json result per document "
+        "to a JSONL file. The API key is read from LAKERA_GUARD_API_KEY.",
+    )
+    scan.add_argument("paths", nargs="+", help="JSONL or text files to scan")
+    scan.add_argument("--output", required=True, help="JSONL file of the results")
+    scan.add_argument(
+        "--checkpoint",
+        help="file to save the progress to, the scan resumes from it if it exists",
+    )
+    scan.add_argument("--checkpoint-every", type=int, default=1000)
+    scan.add_argument("--endpoint", action="append", help="endpoint(s) to check")
+    scan.add_argument("--concurrency", type=int, default=8)
+    scan.add_argument(
+        "--rate", type=float, help="maximum number of requests per second"
+    )
+    scan.add_argument(
+        "--chunk-size",
+        type=int,
+        default=4000,
+        help="documents longer than this many characters get checked in chunks",
+    )
+    scan.add_argument("--chunk-overlap", type=int, default=200)
+    scan.add_argument("--text-key", default="text")
+    scan.add_argument("--id-key", default="id")
+    scan.add_argument(
+        "--base-url", default=None, help="URL of a self-hosted Lakera Guard"
+    )
+    args = parser.parse_args(argv)
+
+    transport = LakeraTransport(
+        **({"base_url": args.base_url} if args.base_url else {}),
+        pool_size=args.concurrency,
+        scheduler=(
+            # min_rate can't be above the rate, e.g. for rates below 1
+            RateLimitScheduler(rate=args.rate, min_rate=min(1.0, args.rate))
+            if args.rate
+            else None
+        ),
+    )
+    chain_guard = LakeraLCGuard(
+        endpoint=args.endpoint or "prompt_injection",
+        transport=transport,
+        max_concurrency=args.concurrency,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+    )
+    try:
+        summary = scan_files(
+            chain_guard,
+            args.paths,
+            args.output,
+            checkpoint_path=args.checkpoint,
+            checkpoint_every=args.checkpoint_every,
+            concurrency=args.concurrency,
+            text_key=args.text_key,
+            id_key=args.id_key,
+        )
+    except LakeraGuardUnavailableError as e:
+        # The scan saved its progress, running it again resumes it
+        sys.exit(str(e))
+    finally:
+        transport.close()
+    json.dump(summary, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, List, Literal, Optional, Sequence, Tuple
+
+from lakera_lcguard.metrics import MetricsSink
+
+logger = logging.getLogger(__name__)
+
+OverflowPolicy = Literal["drop_newest", "drop_oldest", "block"]
+
+
+@dataclass
+class AuditRecord:
+    """
+    Outcome of a check made in audit mode, passed to the AuditSinks of an Auditor.
+    """
+
+    prompt: Any
+    lakera_guard_response: Optional[dict]
+    error: Optional[BaseException]
+    queued_seconds: float
+    check_seconds: float
+
+    @property
+    def flagged(self) -> bool:
+        """
+        Whether any endpoint flagged the input.
+        """
+        return self.lakera_guard_response is not None and any(
+            result["flagged"] for result in self.lakera_guard_response["results"]
+        )
+
+
+class AuditSink(ABC):
+    """
+    Receives the outcomes of the checks made in audit mode. Sinks get called from
+    the worker threads of the Auditor, so subclasses need to be thread-safe.
+    """
+
+    @abstractmethod
+    def record(self, audit_record: AuditRecord) -> None:
+        """
+        Records the outcome of a check.
+
+        Args:
+            audit_record: the input and the outcome of the check
+        Returns:
+            None
+        """
+
+
+class LoggingAuditSink(AuditSink):
+    def __init__(self, logger_name: str = __name__) -> None:
+        """
+        Logs flagged inputs and failed checks as warnings and cleared inputs at
+        debug level.
+
+        Args:
+            logger_name: name of the logger to log to
+        Returns:
+            None
+        """
+        self.logger = logging.getLogger(logger_name)
+
+    def record(self, audit_record: AuditRecord) -> None:
+        if audit_record.error is not None:
+            self.logger.warning(
+                "Lakera Guard audit check failed: %r", audit_record.error
+            )
+        elif audit_record.flagged:
+            self.logger.warning(
+                "Lakera Guard flagged an input in audit mode: %s",
+                audit_record.lakera_guard_response,
+            )
+        else:
+            self.logger.debug("Lakera Guard cleared an input in audit mode.")
+
+
+class CallbackAuditSink(AuditSink):
+    def __init__(self, callback: Callable[[AuditRecord], None]) -> None:
+        """
+        Passes the outcome of every check to a callback.
+
+        Args:
+            callback: gets called with the AuditRecord of every check
+        Returns:
+            None
+        """
+        self.callback = callback
+
+    def record(self, audit_record: AuditRecord) -> None:
+        self.callback(audit_record)
+
+
+class Auditor:
+    def __init__(
+        self,
+        sinks: Optional[Sequence[AuditSink]] = None,
+        max_queue_size: int = 1000,
+        workers: int = 2,
+        overflow_policy: OverflowPolicy = "drop_newest",
+        block_timeout: Optional[float] = None,
+        metrics: Optional[MetricsSink] = None,
+    ) -> None:
+        """
+        Runs the checks of a LakeraLCGuard in audit mode off the request path: the
+        checks go into a bounded queue that a pool of worker threads drains, and
+        their outcomes go to the sinks instead of blocking or raising.
+
+        If the queue is full, overflow_policy decides what happens to a new check:
+        "drop_newest" drops it, "drop_oldest" drops the oldest queued check to make
+        room for it and "block" makes the caller wait for room (backpressure), but
+        at most block_timeout seconds before it drops the new check. Every dropped
+        check is counted in dropped and the audit_dropped_total metric.
+
+        The worker threads are daemon threads, so call flush or close before the
+        process exits to not lose queued checks.
+
+        Args:
+            sinks: receive the outcome of every check, defaults to a
+                LoggingAuditSink
+            max_queue_size: maximum number of checks waiting for a worker
+            workers: number of worker threads that make the checks
+            overflow_policy: what happens to a new check if the queue is full
+            block_timeout: maximum number of seconds the "block" policy waits for
+                room in the queue, None to wait as long as it takes
+            metrics: sink for the counters of the checks by outcome and of the
+                dropped checks and for the histogram of the time checks spent in
+                the queue
+        Returns:
+            None
+        """
+        if max_queue_size < 1 or workers < 1:
+            raise ValueError(
+                f"max_queue_size and workers must be at least 1, got "
+                f"max_queue_size={max_queue_size} and workers={workers}."
+            )
+        self.sinks = list(sinks) if sinks is not None else [LoggingAuditSink()]
+        self.max_queue_size = max_queue_size
+        self.workers = workers
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.metrics = metrics
+        self.dropped = 0
+
+        # (prompt, check, time the check was queued)
+        self._queue: Deque[Tuple[Any, Callable[[Any], dict], float]] = deque()
+        # Checks that have been queued but not finished yet
+        self._unfinished = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of checks that have been queued but not finished yet.
+        """
+        with self._lock:
+            return self._unfinished
+
+    def _drop(self) -> None:
+        """
+        Counts a dropped check. Must be called with self._lock held.
+
+        Returns:
+            None
+        """
+        self.dropped += 1
+        if self.metrics is not None:
+            self.metrics.increment(
+                "audit_dropped_total", {"policy": self.overflow_policy}
+            )
+
+    def submit(self, prompt: Any, check: Callable[[Any], dict]) -> bool:
+        """
+        Queues a check without waiting for it (unless the queue is full and the
+        overflow policy is "block").
+
+        Args:
+            prompt: the input to check
+            check: makes the check and returns the response of Lakera Guard, e.g.
+                LakeraLCGuard.detect_with_response
+        Returns:
+            True if the check was queued, False if it was dropped
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The auditor has been closed.")
+            if not self._threads:
+                self._start_workers()
+
+            if len(self._queue) >= self.max_queue_size:
+                if self.overflow_policy == "drop_oldest":
+                    self._queue.popleft()
+                    self._unfinished -= 1
+                    self._drop()
+                elif self.overflow_policy == "block":
+                    self._not_full.wait_for(
+                        lambda: len(self._queue) < self.max_queue_size,
+                        self.block_timeout,
+                    )
+                if len(self._queue) >= self.max_queue_size:
+                    self._drop()
+                    return False
+
+            self._queue.append((prompt, check, time.perf_counter()))
+            self._unfinished += 1
+            self._not_empty.notify()
+            return True
+
+    async def asubmit(self, prompt: Any, check: Callable[[Any], dict]) -> bool:
+        """
+        Asynchronous version of submit that waits for room in the queue without
+        blocking the event loop.
+
+        Args:
+            prompt: the input to check
+            check: makes the check and returns the response of Lakera Guard
+        Returns:
+            True if the check was queued, False if it was dropped
+        """
+        if self.overflow_policy == "block":
+            return await asyncio.to_thread(self.submit, prompt, check)
+        return self.submit(prompt, check)
+
+    def _start_workers(self) -> None:
+        """
+        Starts the worker threads. Must be called with self._lock held.
+
+        Returns:
+            None
+        """
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"lakera_lcguard_audit_{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                self._not_empty.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                prompt, check, queued_at = self._queue.popleft()
+                self._not_full.notify()
+
+            start = time.perf_counter()
+            lakera_guard_response: Optional[dict] = None
+            error: Optional[BaseException] = None
+            try:
+                lakera_guard_response = check(prompt)
+            except Exception as e:
+                error = e
+            audit_record = AuditRecord(
+                prompt=prompt,
+                lakera_guard_response=lakera_guard_response,
+                error=error,
+                queued_seconds=start - queued_at,
+                check_seconds=time.perf_counter() - start,
+            )
+            self._record(audit_record)
+
+            with self._lock:
+                self._unfinished -= 1
+                if not self._unfinished:
+                    self._all_done.notify_all()
+
+    def _record(self, audit_record: AuditRecord) -> None:
+        """
+        Passes the outcome of a check to the sinks and the metrics.
+
+        Args:
+            audit_record: the input and the outcome of the check
+        Returns:
+            None
+        """
+        if self.metrics is not None:
+            if audit_record.error is not None:
+                outcome = "error"
+            else:
+                outcome = "flagged" if audit_record.flagged else "clear"
+            self.metrics.increment("audit_total", {"outcome": outcome})
+            self.metrics.observe("audit_queue_seconds", {}, audit_record.queued_seconds)
+        for sink in self.sinks:
+            try:
+                sink.record(audit_record)
+            except Exception:
+                # A failing sink must not stop the worker
+                logger.warning("Lakera Guard audit sink failed.", exc_info=True)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until all queued checks are finished.
+
+        Args:
+            timeout: maximum number of seconds to wait, None to wait as long as it
+                takes
+        Returns:
+            True if all checks are finished, False if the timeout passed first
+        """
+        with self._lock:
+            return self._all_done.wait_for(lambda: not self._unfinished, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Finishes the queued checks and stops the worker threads.
+
+        Args:
+            timeout: maximum number of seconds to wait for each worker thread,
+                None to wait as long as it takes
+        Returns:
+            None
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
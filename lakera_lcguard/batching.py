@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+KeyT = TypeVar("KeyT", bound=Hashable)
+ItemT = TypeVar("ItemT")
+ResultT = TypeVar("ResultT")
+
+
+class BatchDispatcher(Generic[KeyT, ItemT, ResultT]):
+    def __init__(
+        self,
+        send_batch: Callable[[KeyT, List[ItemT]], Optional[List[ResultT]]],
+        send_one: Callable[[KeyT, ItemT], ResultT],
+        window: float = 0.005,
+        max_batch_size: int = 32,
+        max_concurrency: int = 8,
+    ) -> None:
+        """
+        Coalesces items that get submitted concurrently (from any thread or event
+        loop) for the same key into batches and fans the results back out to the
+        callers. A batch gets sent once window seconds have passed since its first
+        item arrived or once it holds max_batch_size items, whichever comes first.
+
+        Args:
+            send_batch: sends the items of a batch in one request and returns one
+                result per item, or None if the items cannot be sent together
+            send_one: sends a single item, used for batches of one item and for
+                batches that send_batch could not send together
+            window: maximum number of seconds an item waits for other items
+            max_batch_size: maximum number of items of a batch
+            max_concurrency: maximum number of requests in flight at the same time
+        Returns:
+            None
+        """
+        if window < 0 or max_batch_size < 1:
+            raise ValueError(
+                f"window must be at least 0 and max_batch_size at least 1, got "
+                f"window={window} and max_batch_size={max_batch_size}."
+            )
+        self.send_batch = send_batch
+        self.send_one = send_one
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._pending: Dict[KeyT, List[Tuple[ItemT, Future]]] = {}
+        self._deadlines: Dict[KeyT, float] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # The workers only send requests and never wait for other items, so they
+        # can't deadlock with callers waiting for their results.
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="lakera_lcguard_batch"
+        )
+
+    def submit(self, key: KeyT, item: ItemT) -> Future:
+        """
+        Adds an item to the pending batch of its key.
+
+        Args:
+            key: items with the same key get sent together
+            item: the item to send
+        Returns:
+            future with the result of the item
+        """
+        future: Future = Future()
+        with self._condition:
+            pending = self._pending.setdefault(key, [])
+            if not pending:
+                self._deadlines[key] = time.monotonic() + self.window
+            pending.append((item, future))
+
+            if len(pending) >= self.max_batch_size:
+                self._flush(key)
+            elif self._thread is None:
+                # Started lazily, so that unused dispatchers don't hold a thread
+                self._thread = threading.Thread(
+                    target=self._run, name="lakera_lcguard_batcher", daemon=True
+                )
+                self._thread.start()
+            else:
+                self._condition.notify()
+        return future
+
+    def _run(self) -> None:
+        """
+        Sends the pending batches whose window has passed.
+
+        Returns:
+            None
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                for key, deadline in list(self._deadlines.items()):
+                    if deadline <= now:
+                        self._flush(key)
+                self._condition.wait(
+                    min(self._deadlines.values()) - now if self._deadlines else None
+                )
+
+    def _flush(self, key: KeyT) -> None:
+        """
+        Hands the pending batch of a key to the workers. Must be called with
+        self._condition held.
+
+        Args:
+            key: key of the batch
+        Returns:
+            None
+        """
+        batch = self._pending.pop(key)
+        del self._deadlines[key]
+        self._executor.submit(self._send, key, batch)
+
+    def _send(self, key: KeyT, batch: List[Tuple[ItemT, Future]]) -> None:
+        """
+        Sends a batch and sets the results of its futures.
+
+        Args:
+            key: key of the batch
+            batch: the items of the batch and their futures
+        Returns:
+            None
+        """
+        # Items whose callers have given up in the meantime don't get sent
+        batch = [
+            (item, future)
+            for item, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+
+        try:
+            results = (
+                self.send_batch(key, [item for item, _ in batch])
+                if len(batch) > 1
+                else None
+            )
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        if results is None:
+            # Send the items one by one, concurrently over the pooled connections
+            for item, future in batch:
+                self._executor.submit(self._send_one, key, item, future)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _send_one(self, key: KeyT, item: ItemT, future: Future) -> None:
+        try:
+            future.set_result(self.send_one(key, item))
+        except BaseException as e:
+            future.set_exception(e)
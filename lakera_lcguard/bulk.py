@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+from collections import deque
+from contextlib import closing
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Deque,
+    Generator,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+)
+
+from lakera_lcguard.circuit_breaker import LakeraGuardUnavailableError
+from lakera_lcguard.lakera_lcguard import _is_outage
+from lakera_lcguard.scheduler import scheduling
+
+if TYPE_CHECKING:
+    from lakera_lcguard.lakera_lcguard import LakeraLCGuard
+
+
+@dataclass
+class Document:
+    """
+    A document to scan, or a segment of a long text file.
+    """
+
+    id: str
+    text: str
+    # Offset of the segment in its file, 0 for documents of a JSONL file
+    offset: int = 0
+
+
+def read_documents(
+    path: str,
+    text_key: str = "text",
+    id_key: str = "id",
+    max_chars: int = 1_000_000,
+    overlap: int = 200,
+) -> Iterator[Document]:
+    """
+    Reads the documents of a file one at a time, so that files of any size can
+    be scanned with bounded memory.
+
+    Files ending in .jsonl contain one document per line, a json object with the
+    text under text_key and, optionally, an id under id_key. Any other file is a
+    single text document, which gets read in segments of at most max_chars
+    characters that overlap by overlap characters.
+
+    Args:
+        path: path of the file
+        text_key: key of the text of a document in a JSONL file
+        id_key: key of the id of a document in a JSONL file, documents without
+            an id get path:line as id
+        max_chars: maximum number of characters of a segment of a text file
+        overlap: number of characters shared by consecutive segments, so that
+            risks spanning a segment boundary are seen whole by one of them
+    Returns:
+        iterator over the documents of the file
+    """
+    if not 0 <= overlap < max_chars:
+        raise ValueError(
+            f"overlap must be at least 0 and less than max_chars, got "
+            f"overlap={overlap} and max_chars={max_chars}."
+        )
+    with open(path, encoding="utf-8") as file:
+        if path.endswith(".jsonl"):
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                yield Document(
+                    id=str(record.get(id_key, f"{path}:{line_number}")),
+                    text=record[text_key],
+                )
+            return
+
+        offset = 0
+        carry = ""
+        while True:
+            block = file.read(max_chars - len(carry))
+            if block:
+                text = carry + block
+                yield Document(id=path, text=text, offset=offset)
+            if len(block) < max_chars - len(carry):
+                return
+            carry = text[len(text) - overlap :] if overlap else ""
+            offset += len(text) - len(carry)
+
+
+def _scan_document(
+    chain_guard: LakeraLCGuard, document: Document, priority: Optional[str]
+) -> dict:
+    """
+    Scans a document and turns the outcome into a result line.
+
+    Args:
+        chain_guard: the guard to scan with
+        document: the document
+        priority: priority of the requests for the rate-limit scheduler
+    Returns:
+        the id, offset and response of Lakera Guard of the document, or the error
+        if Lakera Guard was unavailable; other errors, e.g. of an invalid API key,
+        get raised
+    """
+    result: dict = {"id": document.id, "offset": document.offset}
+    try:
+        with scheduling(priority):
+            lakera_guard_response = chain_guard.detect_with_response(document.text)
+    except Exception as e:
+        if not _is_outage(e) and not isinstance(e, LakeraGuardUnavailableError):
+            # Errors like an invalid API key would fail every other document too
+            raise
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    if lakera_guard_response.get("degraded"):
+        # The outage policy let the document through without checking it
+        result["error"] = "Lakera Guard is unavailable, the document was not checked"
+        return result
+    result["flagged"] = lakera_guard_response["results"][0]["flagged"]
+    result["lakera_guard_response"] = lakera_guard_response
+    return result
+
+
+def scan_documents(
+    chain_guard: LakeraLCGuard,
+    documents: Iterable[Document],
+    concurrency: int = 8,
+    priority: Optional[str] = "batch",
+) -> Generator[dict, None, None]:
+    """
+    Scans documents concurrently and yields their results in the order of the
+    documents. At most 2 * concurrency documents are in memory at a time, so the
+    documents can be read lazily from a corpus of any size.
+
+    Long documents get split into chunks if the guard has a chunk_size. To stay
+    within a rate limit, give the transport of the guard a RateLimitScheduler;
+    the scans are scheduled with the given priority, so that interactive checks
+    sharing the scheduler go first.
+
+    Args:
+        chain_guard: the guard to scan with
+        documents: the documents to scan
+        concurrency: maximum number of documents scanned at the same time
+        priority: priority of the requests for the rate-limit scheduler
+    Returns:
+        iterator over the results of the documents, with their id and offset and
+        either the response of Lakera Guard and whether it flagged the document
+        or the error if Lakera Guard was unavailable; errors that are not
+        outages, e.g. of an invalid API key, get raised
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="lakera_lcguard_scan"
+    )
+    pending: Deque[Future] = deque()
+    try:
+        for document in documents:
+            pending.append(
+                executor.submit(_scan_document, chain_guard, document, priority)
+            )
+            if len(pending) >= 2 * concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _load_checkpoint(checkpoint_path: Optional[str]) -> dict:
+    """
+    Loads the progress of an earlier scan.
+
+    Args:
+        checkpoint_path: path of the checkpoint file, None to not checkpoint
+    Returns:
+        the number of scanned and flagged documents and the length of the output
+        file at the checkpoint, all 0 for a new scan
+    """
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as file:
+            return json.load(file)
+    return {"documents": 0, "flagged": 0, "output_bytes": 0}
+
+
+def _save_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    """
+    Saves the progress of a scan, atomically so that a crash never leaves a
+    broken checkpoint behind.
+
+    Args:
+        checkpoint_path: path of the checkpoint file
+        checkpoint: the progress of the scan
+    Returns:
+        None
+    """
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    os.replace(temporary_path, checkpoint_path)
+
+
+def scan_files(
+    chain_guard: LakeraLCGuard,
+    paths: Sequence[str],
+    output_path: str,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_every: int = 1000,
+    concurrency: int = 8,
+    priority: Optional[str] = "batch",
+    text_key: str = "text",
+    id_key: str = "id",
+    max_chars: int = 1_000_000,
+) -> dict:
+    """
+    Scans the documents of JSONL and text files (see read_documents) and writes
+    one json result per document to a JSONL file (see scan_documents) as the
+    results come in.
+
+    With a checkpoint_path, the progress gets saved every checkpoint_every
+    documents and at the end. Running the same scan again resumes after the
+    last checkpoint: the documents scanned before it are skipped and results
+    written after it are discarded, so that every document gets exactly one
+    result line. Delete the checkpoint file to start over. Resuming fails with a
+    ValueError if the output file was deleted or truncated since the checkpoint.
+
+    If Lakera Guard is unavailable, the scan stops before the first document it
+    couldn't check, saves its progress and raises LakeraGuardUnavailableError,
+    so that running it again once Lakera Guard is back retries the document.
+    Errors that are not outages, e.g. of an invalid API key, get raised right
+    away.
+
+    Args:
+        chain_guard: the guard to scan with
+        paths: paths of the files to scan
+        output_path: path of the JSONL file the results get written to
+        checkpoint_path: path of the file the progress gets saved to, None to
+            not save progress
+        checkpoint_every: number of documents between two checkpoints
+        concurrency: maximum number of documents scanned at the same time
+        priority: priority of the requests for the rate-limit scheduler
+        text_key: key of the text of a document in a JSONL file
+        id_key: key of the id of a document in a JSONL file
+        max_chars: maximum number of characters of a segment of a text file
+    Returns:
+        the number of scanned and flagged documents, including those of the runs
+        that are resumed
+    """
+    checkpoint = _load_checkpoint(checkpoint_path)
+    if checkpoint["documents"] and (
+        not os.path.exists(output_path)
+        or os.path.getsize(output_path) < checkpoint["output_bytes"]
+    ):
+        # The results of the documents before the checkpoint would be lost
+        raise ValueError(
+            f"Cannot resume the scan: {output_path} is missing or shorter than at "
+            f"the checkpoint {checkpoint_path}. Restore the output file or delete "
+            f"the checkpoint file to start over."
+        )
+    documents = itertools.islice(
+        itertools.chain.from_iterable(
+            read_documents(path, text_key, id_key, max_chars) for path in paths
+        ),
+        checkpoint["documents"],
+        None,
+    )
+
+    failed_result = None
+    with open(output_path, "r+b" if checkpoint["documents"] else "wb") as output:
+        output.truncate(checkpoint["output_bytes"])
+        output.seek(checkpoint["output_bytes"])
+        results = scan_documents(chain_guard, documents, concurrency, priority)
+        # Closing the results stops the scans in progress after a failure
+        with closing(results):
+            for result in results:
+                if "error" in result:
+                    failed_result = result
+                    break
+                output.write(json.dumps(result).encode() + b"\n")
+                checkpoint["documents"] += 1
+                checkpoint["flagged"] += bool(result.get("flagged"))
+                if checkpoint_path is not None and (
+                    checkpoint["documents"] % checkpoint_every == 0
+                ):
+                    output.flush()
+                    checkpoint["output_bytes"] = output.tell()
+                    _save_checkpoint(checkpoint_path, checkpoint)
+        checkpoint["output_bytes"] = output.tell()
+
+    if checkpoint_path is not None:
+        _save_checkpoint(checkpoint_path, checkpoint)
+    if failed_result is not None:
+        raise LakeraGuardUnavailableError(
+            f"The scan stopped at document {failed_result['id']}: "
+            f"{failed_result['error']}. Run it again to resume it."
+        )
+    return {key: checkpoint[key] for key in ("documents", "flagged")}
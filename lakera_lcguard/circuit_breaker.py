@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Literal, Optional, Tuple
+
+CircuitState = Literal["closed", "open", "half_open"]
+OutagePolicy = Literal["fail_closed", "fail_open", "cache_only"]
+
+
+class LakeraGuardUnavailableError(RuntimeError):
+    """
+    Raised instead of calling Lakera Guard while the circuit breaker is open and
+    the outage policy fails closed.
+    """
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        slow_call_threshold: Optional[float] = None,
+        minimum_calls: int = 10,
+        window: float = 30.0,
+        recovery_timeout: float = 15.0,
+        half_open_max_calls: int = 1,
+    ) -> None:
+        """
+        Stops calling Lakera Guard while it is failing or slow, so that an outage of
+        the guard doesn't block every guarded model call on timeouts and retries.
+
+        The breaker is closed as long as the share of failed (or slow) calls among
+        the calls of the last window seconds stays below failure_rate_threshold.
+        Once it is exceeded, the breaker opens and rejects all calls for
+        recovery_timeout seconds. Then it is half open: up to half_open_max_calls
+        probe calls get through and the breaker closes again once a probe
+        succeeds, or opens again if a probe fails.
+
+        A breaker is thread-safe and can be shared by several LakeraLCGuards that
+        call the same Lakera Guard deployment.
+
+        Args:
+            failure_rate_threshold: share of failed calls (between 0 and 1) at
+                which the breaker opens
+            slow_call_threshold: calls taking longer than slow_call_threshold
+                seconds count as failed, None to only count errors
+            minimum_calls: minimum number of calls in the window before the
+                breaker can open
+            window: number of seconds of calls the failure rate is computed over
+            recovery_timeout: number of seconds the breaker stays open before it
+                lets probe calls through
+            half_open_max_calls: maximum number of concurrent probe calls while
+                the breaker is half open
+        Returns:
+            None
+        """
+        if not 0.0 < failure_rate_threshold <= 1.0:
+            raise ValueError(
+                f"failure_rate_threshold must be between 0 and 1, got "
+                f"{failure_rate_threshold}."
+            )
+        if minimum_calls < 1 or half_open_max_calls < 1:
+            raise ValueError(
+                f"minimum_calls and half_open_max_calls must be at least 1, got "
+                f"minimum_calls={minimum_calls} and "
+                f"half_open_max_calls={half_open_max_calls}."
+            )
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.minimum_calls = minimum_calls
+        self.window = window
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state: CircuitState = "closed"
+        self._opened_at = 0.0
+        self._probes = 0
+        # (time, failed) of the calls of the last window seconds
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        """
+        The current state of the breaker: "closed", "open" or "half_open".
+        """
+        with self._lock:
+            self._update_state(time.monotonic())
+            return self._state
+
+    def _update_state(self, now: float) -> None:
+        """
+        Moves an open breaker to half open once the recovery timeout has passed and
+        lets new probes through if the previous ones haven't been recorded within
+        the recovery timeout, e.g. because they were cancelled. Must be called with
+        self._lock held.
+
+        Args:
+            now: the current time
+        Returns:
+            None
+        """
+        if now - self._opened_at >= self.recovery_timeout:
+            if self._state == "open":
+                self._state = "half_open"
+                self._probes = 0
+            elif self._state == "half_open":
+                self._probes = 0
+                self._opened_at = now
+
+    def _open(self, now: float) -> None:
+        """
+        Opens the breaker. Must be called with self._lock held.
+
+        Args:
+            now: the current time
+        Returns:
+            None
+        """
+        self._state = "open"
+        self._opened_at = now
+        self._calls.clear()
+        self._failures = 0
+
+    def allow_request(self) -> bool:
+        """
+        Returns whether a call to Lakera Guard may be made now. Every allowed call
+        must be followed by record_success or record_failure.
+
+        Returns:
+            True if the call may be made, False if the breaker rejects it
+        """
+        with self._lock:
+            self._update_state(time.monotonic())
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and self._probes < self.half_open_max_calls:
+                if not self._probes:
+                    # The probes expire after the recovery timeout
+                    self._opened_at = time.monotonic()
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self, duration: float) -> None:
+        """
+        Records a call that got a response from Lakera Guard.
+
+        Args:
+            duration: number of seconds the call took
+        Returns:
+            None
+        """
+        slow = (
+            self.slow_call_threshold is not None and duration > self.slow_call_threshold
+        )
+        self._record(failed=slow)
+
+    def record_failure(self) -> None:
+        """
+        Records a call that failed, e.g. with a timeout or a server error.
+
+        Returns:
+            None
+        """
+        self._record(failed=True)
+
+    def _record(self, failed: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._update_state(now)
+            if self._state == "half_open":
+                if failed:
+                    self._open(now)
+                else:
+                    self._state = "closed"
+                return
+            if self._state == "open":
+                # A call that was allowed before the breaker opened
+                return
+
+            self._calls.append((now, failed))
+            self._failures += failed
+            while self._calls and self._calls[0][0] < now - self.window:
+                _, expired_failed = self._calls.popleft()
+                self._failures -= expired_failed
+
+            calls = len(self._calls)
+            if (
+                calls >= self.minimum_calls
+                and self._failures >= self.failure_rate_threshold * calls
+            ):
+                self._open(now)
+
+    def reset(self) -> None:
+        """
+        Closes the breaker and forgets the recorded calls.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._state = "closed"
+            self._calls.clear()
+            self._failures = 0
+            self._probes = 0
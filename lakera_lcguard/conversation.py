@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+
+class ConversationTracker:
+    def __init__(
+        self, max_conversations: int = 1024, max_fingerprinted_messages: int = 4096
+    ) -> None:
+        """
+        Remembers which conversations have been cleared by Lakera Guard, so that
+        when a conversation grows by a turn, only the new messages (and the context
+        they need) get checked instead of the whole history.
+
+        Conversations are identified by a fingerprint of their messages that chains
+        the fingerprint of the previous messages with the role and content of the
+        next one, so a cleared conversation is recognized as the prefix of its
+        continuations without storing any message content.
+
+        The fingerprints of the prefixes ending in the last fingerprinted messages
+        are kept with a reference to the message, so that a conversation that
+        grows by a turn only needs its new messages hashed.
+
+        Args:
+            max_conversations: maximum number of cleared conversations to remember,
+                the least recently used ones get forgotten first
+            max_fingerprinted_messages: maximum number of messages to keep the
+                prefix fingerprint of, the oldest ones get forgotten first
+        Returns:
+            None
+        """
+        if max_conversations < 1 or max_fingerprinted_messages < 1:
+            raise ValueError(
+                f"max_conversations and max_fingerprinted_messages must be at least "
+                f"1, got max_conversations={max_conversations} and "
+                f"max_fingerprinted_messages={max_fingerprinted_messages}."
+            )
+        self.max_conversations = max_conversations
+        self.max_fingerprinted_messages = max_fingerprinted_messages
+        self._cleared: OrderedDict[bytes, None] = OrderedDict()
+        # (fingerprint of the previous messages, id of the message) to the message,
+        # the hash state after it and its digest. The message is kept to tell it
+        # apart from a later object with the same id.
+        self._prefixes: Dict[Tuple[bytes, int], Tuple[BaseMessage, Any, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get_cleared_length(self, messages: Sequence[BaseMessage]) -> Tuple[int, bytes]:
+        """
+        Returns how many of the first messages of a conversation have already been
+        cleared.
+
+        Args:
+            messages: the messages of the conversation
+        Returns:
+            the length of the longest cleared prefix of the conversation and the
+            fingerprint of the whole conversation
+        """
+        fingerprint = hashlib.blake2b(digest_size=16)
+        digest = fingerprint.digest()
+        prefix_fingerprints: List[bytes] = []
+        for message in messages:
+            key = (digest, id(message))
+            prefix = self._prefixes.get(key)
+            if prefix is not None and prefix[0] is message:
+                _, fingerprint, digest = prefix
+            else:
+                # The cached hash states are never updated in place
+                fingerprint = fingerprint.copy()
+                content = str(message.content).encode()
+                fingerprint.update(f"{message.type}:{len(content)}:".encode())
+                fingerprint.update(content)
+                digest = fingerprint.digest()
+                with self._lock:
+                    self._prefixes[key] = (message, fingerprint, digest)
+                    if len(self._prefixes) > self.max_fingerprinted_messages:
+                        del self._prefixes[next(iter(self._prefixes))]
+            prefix_fingerprints.append(digest)
+
+        cleared_length = 0
+        with self._lock:
+            for length in range(len(prefix_fingerprints), 0, -1):
+                if prefix_fingerprints[length - 1] in self._cleared:
+                    self._cleared.move_to_end(prefix_fingerprints[length - 1])
+                    cleared_length = length
+                    break
+
+        return cleared_length, digest
+
+    def mark_cleared(self, fingerprint: Optional[bytes]) -> None:
+        """
+        Remembers that a conversation has been cleared.
+
+        Args:
+            fingerprint: the fingerprint of the conversation, None to do nothing
+        Returns:
+            None
+        """
+        if fingerprint is None:
+            return
+        with self._lock:
+            self._cleared[fingerprint] = None
+            self._cleared.move_to_end(fingerprint)
+            while len(self._cleared) > self.max_conversations:
+                self._cleared.popitem(last=False)
@@ -0,0 +1,550 @@
+"""
+LangChain integrations of LakeraLCGuard. LakeraLCGuard only imports this module (and
+LangChain) the first time one of its get_guarded_* methods gets called, so that the
+guard client itself starts up without LangChain.
+"""
+
+from __future__ import annotations
+
+from contextvars import ContextVar
+from functools import partial, wraps
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from langchain.agents import AgentExecutor
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForChainRun,
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForChainRun,
+    CallbackManagerForLLMRun,
+)
+from langchain.schema import BaseMessage
+from langchain.schema.agent import AgentAction, AgentFinish
+from langchain.tools import BaseTool
+from langchain_core.language_models import BaseChatModel, BaseLLM
+from langchain_core.outputs import (
+    ChatGenerationChunk,
+    ChatResult,
+    GenerationChunk,
+    LLMResult,
+)
+
+from lakera_lcguard.lakera_lcguard import LakeraLCGuard, _guarding, _is_checked
+
+BaseLLMT = TypeVar("BaseLLMT", bound=BaseLLM)
+BaseChatModelT = TypeVar("BaseChatModelT", bound=BaseChatModel)
+BaseToolT = TypeVar("BaseToolT", bound=BaseTool)
+
+# Intermediate steps of the current agent run and the steps whose observations have
+# already been checked. AgentExecutor creates the list of intermediate steps once
+# per run and only ever extends it, so its identity tells the runs apart, while the
+# context variable keeps concurrent runs (threads or tasks) apart.
+_cleared_steps: ContextVar[Optional[Tuple[list, list]]] = ContextVar(
+    "_cleared_steps", default=None
+)
+
+
+def _get_unchecked_steps(
+    intermediate_steps: List[Tuple[AgentAction, str]]
+) -> Tuple[bool, List[Tuple[AgentAction, str]]]:
+    """
+    Returns the intermediate steps of the current agent run whose observations have
+    not been checked yet.
+
+    Args:
+        intermediate_steps: the intermediate steps of the current agent run
+    Returns:
+        Whether this is the first step of a new run and the unchecked steps
+    """
+    cleared = _cleared_steps.get()
+    if cleared is None or cleared[0] is not intermediate_steps:
+        return True, intermediate_steps
+    # Steps are only cleared as long as they are still the same, so that a step
+    # that replaced a cleared one (e.g. after the list was shortened) gets checked
+    cleared_length = 0
+    for step, cleared_step in zip(intermediate_steps, cleared[1]):
+        if step is not cleared_step:
+            break
+        cleared_length += 1
+    return False, intermediate_steps[cleared_length:]
+
+
+# Set by the run of a guarded tool and marked by its _run once the observation has
+# been checked. A list, as LangChain calls _run in a copy of the context.
+_observation_checked: ContextVar[Optional[List[bool]]] = ContextVar(
+    "_observation_checked", default=None
+)
+
+
+def get_guarded_llm(
+    lakera_guard_instance: LakeraLCGuard,
+    type_of_llm: Type[BaseLLMT],
+    output_window: Optional[int] = None,
+    guard_output: bool = False,
+) -> Type[BaseLLMT]:
+    """
+    Creates a subclass of type_of_llm where the input to the LLM always gets
+    checked w.r.t. AI security risk specified in lakera_guard_instance.endpoint.
+    This includes streaming via stream() and astream(), where the input gets
+    checked before the first chunk is released.
+
+    Args:
+        lakera_guard_instance: the LakeraLCGuard that does the checks
+        type_of_llm: any type of LangChain's LLMs
+        output_window: if set, the output of streamed generations also gets
+            checked every output_window characters while it streams, each time
+            the new output with the last chunk_overlap characters before it
+        guard_output: if True, the output of the LLM gets checked as well. All
+            generations of a call get checked concurrently, and the complete
+            output of a streamed generation gets checked while the caller reads
+            its last chunks.
+    Returns:
+        Guarded subclass of type_of_llm
+    """
+
+    class GuardedLLM(type_of_llm):  # type: ignore
+        @property
+        def _llm_type(self) -> str:
+            return "guarded_" + super()._llm_type
+
+        def _generate(
+            self,
+            prompts: List[str],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+        ) -> LLMResult:
+            generate = partial(super()._generate, prompts, stop, run_manager, **kwargs)
+            if _is_checked(prompts):
+                return generate()
+
+            with _guarding(prompts, run_manager):
+                result = lakera_guard_instance._guard_generation(prompts, generate)
+                if guard_output:
+                    lakera_guard_instance._check_output(result)
+                return result
+
+        async def _agenerate(
+            self,
+            prompts: List[str],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+        ) -> LLMResult:
+            with _guarding(prompts, run_manager):
+                result = await lakera_guard_instance._aguard_generation(
+                    prompts,
+                    partial(super()._agenerate, prompts, stop, run_manager, **kwargs),
+                )
+                if guard_output:
+                    await lakera_guard_instance._acheck_output(result)
+                return result
+
+        # Only guard streaming if type_of_llm implements it, otherwise LangChain
+        # falls back to (guarded) generation.
+        if type_of_llm._stream is not BaseLLM._stream:
+
+            def _stream(
+                self,
+                prompt: str,
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any,
+            ) -> Iterator[GenerationChunk]:
+                stream = partial(super()._stream, prompt, stop, run_manager, **kwargs)
+                if _is_checked(prompt):
+                    return stream()
+                return lakera_guard_instance._guard_stream(
+                    [prompt], stream, output_window, run_manager, guard_output
+                )
+
+        # Without a native _astream, LangChain runs the (guarded) _stream.
+        if type_of_llm._astream is not BaseLLM._astream:
+
+            async def _astream(
+                self,
+                prompt: str,
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                **kwargs: Any,
+            ) -> AsyncIterator[GenerationChunk]:
+                astream = partial(super()._astream, prompt, stop, run_manager, **kwargs)
+                if _is_checked(prompt):
+                    chunks = astream()
+                else:
+                    chunks = lakera_guard_instance._aguard_stream(
+                        [prompt], astream, output_window, run_manager, guard_output
+                    )
+                async for chunk in chunks:
+                    yield chunk
+
+    return GuardedLLM
+
+
+def get_guarded_chat_llm(
+    lakera_guard_instance: LakeraLCGuard,
+    type_of_chat_llm: Type[BaseChatModelT],
+    output_window: Optional[int] = None,
+    guard_output: bool = False,
+) -> Type[BaseChatModelT]:
+    """
+    Creates a subclass of type_of_chat_llm in which the input to the ChatLLM always
+      gets checked w.r.t. AI security risk specified in
+      lakera_guard_instance.endpoint. This includes streaming via stream() and
+      astream(), where the input gets checked before the first chunk is released.
+
+    Args:
+        lakera_guard_instance: the LakeraLCGuard that does the checks
+        type_of_llm: any type of LangChain's ChatLLMs
+        output_window: if set, the output of streamed generations also gets
+            checked every output_window characters while it streams, each time
+            the new output with the last chunk_overlap characters before it
+        guard_output: if True, the output of the ChatLLM, including the
+            arguments of its tool calls, gets checked as well. All generations
+            of a call get checked concurrently, and the complete output of a
+            streamed generation gets checked while the caller reads its last
+            chunks.
+    Returns:
+        Guarded subclass of type_of_llm
+    """
+
+    class GuardedChatLLM(type_of_chat_llm):  # type: ignore
+        @property
+        def _llm_type(self) -> str:
+            return "guarded_" + super()._llm_type
+
+        def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+        ) -> ChatResult:
+            if _is_checked(messages):
+                return super()._generate(messages, stop, run_manager, **kwargs)
+
+            with _guarding(messages, run_manager):
+                result = lakera_guard_instance._guard_generation(
+                    [messages],
+                    partial(super()._generate, messages, stop, run_manager, **kwargs),
+                )
+                if guard_output:
+                    lakera_guard_instance._check_output(result)
+                return result
+
+        async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+        ) -> ChatResult:
+            with _guarding(messages, run_manager):
+                result = await lakera_guard_instance._aguard_generation(
+                    [messages],
+                    partial(super()._agenerate, messages, stop, run_manager, **kwargs),
+                )
+                if guard_output:
+                    await lakera_guard_instance._acheck_output(result)
+                return result
+
+        # Only guard streaming if type_of_chat_llm implements it, otherwise
+        # LangChain falls back to (guarded) generation.
+        if type_of_chat_llm._stream is not BaseChatModel._stream:
+
+            def _stream(
+                self,
+                messages: List[BaseMessage],
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any,
+            ) -> Iterator[ChatGenerationChunk]:
+                stream = partial(super()._stream, messages, stop, run_manager, **kwargs)
+                if _is_checked(messages):
+                    return stream()
+                return lakera_guard_instance._guard_stream(
+                    [messages], stream, output_window, run_manager, guard_output
+                )
+
+        # Without a native _astream, LangChain runs the (guarded) _stream.
+        if type_of_chat_llm._astream is not BaseChatModel._astream:
+
+            async def _astream(
+                self,
+                messages: List[BaseMessage],
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                **kwargs: Any,
+            ) -> AsyncIterator[ChatGenerationChunk]:
+                astream = partial(
+                    super()._astream, messages, stop, run_manager, **kwargs
+                )
+                if _is_checked(messages):
+                    chunks = astream()
+                else:
+                    chunks = lakera_guard_instance._aguard_stream(
+                        [messages],
+                        astream,
+                        output_window,
+                        run_manager,
+                        guard_output,
+                    )
+                async for chunk in chunks:
+                    yield chunk
+
+    return GuardedChatLLM
+
+
+def get_guarded_agent_executor(
+    lakera_guard_instance: LakeraLCGuard,
+) -> Type[AgentExecutor]:
+    """
+    Creates a subclass of the AgentExecutor in which the input to the LLM that the
+    AgentExecutor is initialized with gets checked w.r.t. AI security risk specified
+    in lakera_guard_instance.endpoint.
+
+    Args:
+        lakera_guard_instance: the LakeraLCGuard that does the checks
+    Returns:
+        Guarded AgentExecutor subclass
+    """
+
+    class GuardedAgentExecutor(AgentExecutor):
+        def _call(
+            self,
+            inputs: Dict[str, str],
+            run_manager: Optional[CallbackManagerForChainRun] = None,
+        ) -> Dict[str, Any]:
+            # The cleared steps of a run must not outlive it
+            token = _cleared_steps.set(None)
+            try:
+                return super()._call(inputs, run_manager)
+            finally:
+                _cleared_steps.reset(token)
+
+        async def _acall(
+            self,
+            inputs: Dict[str, str],
+            run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+        ) -> Dict[str, str]:
+            token = _cleared_steps.set(None)
+            try:
+                return await super()._acall(inputs, run_manager)
+            finally:
+                _cleared_steps.reset(token)
+
+        def _take_next_step(
+            self,
+            name_to_tool_map: Dict[str, BaseTool],
+            color_mapping: Dict[str, str],
+            inputs: Dict[str, str],
+            intermediate_steps: List[Tuple[AgentAction, str]],
+            run_manager: CallbackManagerForChainRun | None = None,
+        ) -> Union[AgentFinish, List[Tuple[AgentAction, str]]]:
+            # The inputs stay the same during a run and observations that have
+            # been cleared in a previous step (or by a guarded tool) don't need
+            # to be checked again.
+            new_run, unchecked_steps = _get_unchecked_steps(intermediate_steps)
+            to_check = list(inputs.values()) if new_run else []
+            to_check.extend(
+                _get_unguarded_observations(
+                    lakera_guard_instance, unchecked_steps, name_to_tool_map
+                )
+            )
+
+            with _guarding(None, run_manager):
+                lakera_guard_instance.detect_batch(to_check)
+            _cleared_steps.set((intermediate_steps, list(intermediate_steps)))
+
+            return super()._take_next_step(
+                name_to_tool_map,
+                color_mapping,
+                inputs,
+                intermediate_steps,
+                run_manager,
+            )
+
+        async def _atake_next_step(
+            self,
+            name_to_tool_map: Dict[str, BaseTool],
+            color_mapping: Dict[str, str],
+            inputs: Dict[str, str],
+            intermediate_steps: List[Tuple[AgentAction, str]],
+            run_manager: AsyncCallbackManagerForChainRun | None = None,
+        ) -> Union[AgentFinish, List[Tuple[AgentAction, str]]]:
+            new_run, unchecked_steps = _get_unchecked_steps(intermediate_steps)
+            to_check = list(inputs.values()) if new_run else []
+            to_check.extend(
+                _get_unguarded_observations(
+                    lakera_guard_instance, unchecked_steps, name_to_tool_map
+                )
+            )
+
+            with _guarding(None, run_manager):
+                await lakera_guard_instance.adetect_batch(to_check)
+            _cleared_steps.set((intermediate_steps, list(intermediate_steps)))
+
+            return await super()._atake_next_step(
+                name_to_tool_map,
+                color_mapping,
+                inputs,
+                intermediate_steps,
+                run_manager,
+            )
+
+    return GuardedAgentExecutor
+
+
+def _get_unguarded_observations(
+    lakera_guard_instance: LakeraLCGuard,
+    steps: List[Tuple[AgentAction, str]],
+    name_to_tool_map: Dict[str, BaseTool],
+) -> List[str]:
+    """
+    Returns the observations of agent steps that haven't been checked by a tool
+    guarded with lakera_guard_instance when the tool produced them.
+
+    Args:
+        lakera_guard_instance: the LakeraLCGuard that does the checks
+        steps: intermediate steps of an agent run
+        name_to_tool_map: the tools of the agent by name
+    Returns:
+        the observations that still need to be checked
+    """
+    return [
+        observation
+        for action, observation in steps
+        if getattr(name_to_tool_map.get(action.tool), "_lakera_guard", None)
+        is not lakera_guard_instance
+    ]
+
+
+def _get_observation_text(tool: BaseTool, observation: Any) -> str:
+    """
+    Returns the text of a tool observation that the model will see.
+
+    Args:
+        tool: the tool that produced the observation
+        observation: the return value of the tool's _run or _arun
+    Returns:
+        the text to check
+    """
+    if tool.response_format == "content_and_artifact" and isinstance(
+        observation, tuple
+    ):
+        observation = observation[0]
+    return observation if isinstance(observation, str) else str(observation)
+
+
+def _get_run_output_text(output: Any) -> str:
+    """
+    Returns the text of the output of a tool's run or arun that the model will see.
+
+    Args:
+        output: the observation or, if the tool was called with a tool call, the
+            ToolMessage
+    Returns:
+        the text to check
+    """
+    content = getattr(output, "content", output)
+    return content if isinstance(content, str) else str(content)
+
+
+def _mark_observation_checked() -> None:
+    """
+    Marks the observation of the run of the current guarded tool as checked.
+
+    Returns:
+        None
+    """
+    checked = _observation_checked.get()
+    if checked is not None:
+        checked[0] = True
+
+
+def get_guarded_tool_type(
+    lakera_guard_instance: LakeraLCGuard, type_of_tool: Type[BaseToolT]
+) -> Type[BaseToolT]:
+    """
+    Creates a subclass of type_of_tool whose observations get checked w.r.t. AI
+    security risk specified in lakera_guard_instance.endpoint as soon as the tool
+    produces them.
+
+    Args:
+        lakera_guard_instance: the LakeraLCGuard that does the checks
+        type_of_tool: any type of LangChain's tools
+    Returns:
+        Guarded subclass of type_of_tool
+    """
+    if type_of_tool in lakera_guard_instance._guarded_tool_types:
+        return lakera_guard_instance._guarded_tool_types[type_of_tool]
+
+    class GuardedTool(type_of_tool):  # type: ignore
+        _lakera_guard = lakera_guard_instance
+
+        def run(self, *args: Any, **kwargs: Any) -> Any:
+            checked = [False]
+            token = _observation_checked.set(checked)
+            try:
+                observation = super().run(*args, **kwargs)
+            finally:
+                _observation_checked.reset(token)
+            if not checked[0]:
+                # The observation didn't come from _run, e.g. it is the message of
+                # handle_tool_error or handle_validation_error, which can echo the
+                # input of the tool
+                text = _get_run_output_text(observation)
+                if text.strip():
+                    lakera_guard_instance.detect(text)
+            return observation
+
+        async def arun(self, *args: Any, **kwargs: Any) -> Any:
+            checked = [False]
+            token = _observation_checked.set(checked)
+            try:
+                observation = await super().arun(*args, **kwargs)
+            finally:
+                _observation_checked.reset(token)
+            if not checked[0]:
+                text = _get_run_output_text(observation)
+                if text.strip():
+                    await lakera_guard_instance.adetect(text)
+            return observation
+
+        # wraps keeps the signature of type_of_tool._run, from which LangChain
+        # decides whether to pass run_manager and config.
+        @wraps(type_of_tool._run)
+        def _run(self, *args: Any, **kwargs: Any) -> Any:
+            observation = super()._run(*args, **kwargs)
+            text = _get_observation_text(self, observation)
+            if text.strip():
+                lakera_guard_instance.detect(text)
+            _mark_observation_checked()
+            return observation
+
+        # Without a native _arun, LangChain runs the (guarded) _run.
+        if type_of_tool._arun is not BaseTool._arun:
+
+            @wraps(type_of_tool._arun)
+            async def _arun(self, *args: Any, **kwargs: Any) -> Any:
+                observation = await super()._arun(*args, **kwargs)
+                text = _get_observation_text(self, observation)
+                if text.strip():
+                    await lakera_guard_instance.adetect(text)
+                _mark_observation_checked()
+                return observation
+
+    GuardedTool.__name__ = GuardedTool.__qualname__ = "Guarded" + type_of_tool.__name__
+    return lakera_guard_instance._guarded_tool_types.setdefault(
+        type_of_tool, GuardedTool
+    )
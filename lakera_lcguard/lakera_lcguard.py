@@ -1,27 +1,78 @@
 from __future__ import annotations
 
+import asyncio
+import copy
+import hashlib
+import json
 import os
+import sys
+import time
 import warnings
-from typing import Any, Dict, List, Optional, Tuple, Type, Union, Literal, TypeVar
-
-import requests
-from langchain.agents import AgentExecutor
-from langchain.schema import BaseMessage, PromptValue
-from langchain.tools import BaseTool
-from langchain_core.agents import AgentStep
-from langchain.callbacks.manager import (
-    CallbackManagerForLLMRun,
-    CallbackManagerForChainRun,
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TYPE_CHECKING,
+    Tuple,
+    Type,
+    Union,
+    Literal,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    # LangChain only gets imported once it is used, see lakera_lcguard.integrations
+    from langchain.agents import AgentExecutor
+    from langchain.schema import BaseMessage, PromptValue
+    from langchain.tools import BaseTool
+    from langchain_core.agents import AgentStep
+    from langchain.schema.agent import AgentFinish, AgentAction
+    from langchain_core.language_models import BaseChatModel, BaseLLM
+    from langchain_core.runnables import Runnable, RunnableConfig
+    from langchain_core.outputs import (
+        ChatGenerationChunk,
+        ChatResult,
+        Generation,
+        GenerationChunk,
+        LLMResult,
+    )
+    from requests import Session
+
+from lakera_lcguard.audit import Auditor
+from lakera_lcguard.batching import BatchDispatcher
+from lakera_lcguard.cache import CacheBackend
+from lakera_lcguard.circuit_breaker import (
+    CircuitBreaker,
+    LakeraGuardUnavailableError,
+    OutagePolicy,
+)
+from lakera_lcguard.conversation import ConversationTracker
+from lakera_lcguard.metrics import MetricsSink
+from lakera_lcguard.prefilter import PreFilter, PreFilterDecision
+from lakera_lcguard.redaction import RedactionStrategy, redact_text, restore_text
+from lakera_lcguard.scheduler import SchedulerTimeoutError, get_scheduling, scheduling
+from lakera_lcguard.transport import (
+    LakeraGuardServerError,
+    LakeraTransport,
+    RequestStats,
+    default_transport,
 )
-from langchain.schema.agent import AgentFinish, AgentAction
-from langchain_core.language_models import BaseChatModel, BaseLLM
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_core.outputs import ChatResult, LLMResult
 
 # from langchain.callbacks.manager import CallbackManagerForChainRun
 
-GuardInput = Union[str, List[BaseMessage], PromptValue]
-NextStepOutput = List[Union[AgentFinish, AgentAction, AgentStep]]
+GuardInput = Union[str, List["BaseMessage"], "PromptValue"]
+NextStepOutput = List[Union["AgentFinish", "AgentAction", "AgentStep"]]
 GuardChatMessages = list[dict[str, str]]
 Endpoints = Literal[
     "prompt_injection",
@@ -31,8 +82,232 @@ Endpoints = Literal[
     "sentiment",
     "unknown_links",
 ]
-BaseLLMT = TypeVar("BaseLLMT", bound=BaseLLM)
-BaseChatModelT = TypeVar("BaseChatModelT", bound=BaseChatModel)
+GuardMode = Literal["sequential", "parallel", "audit"]
+BaseLLMT = TypeVar("BaseLLMT", bound="BaseLLM")
+BaseChatModelT = TypeVar("BaseChatModelT", bound="BaseChatModel")
+BaseToolT = TypeVar("BaseToolT", bound="BaseTool")
+T = TypeVar("T")
+ChunkT = TypeVar("ChunkT", "GenerationChunk", "ChatGenerationChunk")
+OutputT = TypeVar("OutputT", "LLMResult", "ChatResult")
+
+# Context of the new messages of incremental checks without max_context_messages,
+# so that the cost of a turn doesn't grow with the conversation
+_INCREMENTAL_CONTEXT_MESSAGES = 6
+
+# Lakera Guard roles of the supported message types, filled in with the first
+# message and extended with their subclasses (e.g. AIMessageChunk) the first time
+# they are seen
+_MESSAGE_ROLES: Dict[type, str] = {}
+
+
+def __getattr__(name: str) -> Session:
+    """
+    Keeps the module-level requests session of earlier versions importable. It
+    is the pooled session of the default transport, created on first access so
+    that requests only gets imported once it is used.
+
+    Args:
+        name: name of the module attribute
+    Returns:
+        the session of default_transport for "session"
+    """
+    if name == "session":
+        warnings.warn(
+            "lakera_lcguard.lakera_lcguard.session is deprecated, use "
+            "lakera_lcguard.transport.default_transport.session or pass a "
+            "LakeraTransport to LakeraLCGuard instead.",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return default_transport.session
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _get_unflagged_response() -> dict:
+    """
+    Returns a response in the format of Lakera Guard's API that doesn't flag the
+    input, for checks that didn't call Lakera Guard.
+
+    Returns:
+        the response as dict
+    """
+    return {
+        "model": None,
+        "results": [
+            {
+                "categories": {},
+                "category_scores": {},
+                "flagged": False,
+                "payload": {},
+            }
+        ],
+        "dev_info": {},
+    }
+
+
+def _get_generation_text(generation: Generation) -> str:
+    """
+    Returns the text of a generation to check, including the tool calls of a chat
+    generation, whose arguments an agent is about to act on.
+
+    Args:
+        generation: a generation of an LLMResult or ChatResult
+    Returns:
+        the text of the generation followed by its tool calls
+    """
+    texts = [generation.text]
+    # Only the generations of ChatResults have a message
+    message = getattr(generation, "message", None)
+    if message is not None:
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            texts.extend(
+                f"{tool_call['name']}({json.dumps(tool_call['args'])})"
+                for tool_call in tool_calls
+            )
+        else:
+            # Tool and function calls that LangChain couldn't parse
+            for tool_call in message.additional_kwargs.get("tool_calls") or []:
+                function = tool_call.get("function") or {}
+                texts.append(f"{function.get('name')}({function.get('arguments')})")
+            function_call = message.additional_kwargs.get("function_call")
+            if function_call:
+                texts.append(
+                    f"{function_call.get('name')}({function_call.get('arguments')})"
+                )
+    return "\n".join(text for text in texts if text)
+
+
+def _get_tool_call_chunk_text(chunk: Any) -> str:
+    """
+    Returns the parts of tool calls contained in a streamed chunk.
+
+    Args:
+        chunk: a chunk of a streamed model call
+    Returns:
+        the names and argument fragments of the tool calls of the chunk
+    """
+    message = getattr(chunk, "message", None)
+    tool_call_chunks = getattr(message, "tool_call_chunks", None) or []
+    return "".join(
+        (tool_call_chunk.get("name") or "") + (tool_call_chunk.get("args") or "")
+        for tool_call_chunk in tool_call_chunks
+    )
+
+
+def _get_messages(prompt: Any) -> Any:
+    """
+    Returns the messages of a PromptValue and any other input unchanged. A
+    PromptValue can only exist if LangChain is in use, so this doesn't import it.
+
+    Args:
+        prompt: input of _generate, _agenerate, _stream or _astream
+    Returns:
+        the messages of the input if it is a PromptValue, else the input
+    """
+    prompt_values = sys.modules.get("langchain_core.prompt_values")
+    if prompt_values is not None and isinstance(prompt, prompt_values.PromptValue):
+        return prompt.to_messages()
+    return prompt
+
+
+def _get_runnable_config() -> Optional[RunnableConfig]:
+    """
+    Returns the config of the enclosing LangChain runnable. There can't be one if
+    LangChain isn't in use, so this doesn't import it.
+
+    Returns:
+        the config of the enclosing runnable, None if there is none
+    """
+    config = sys.modules.get("langchain_core.runnables.config")
+    return None if config is None else config.var_child_runnable_config.get()
+
+
+def _is_outage(error: Exception) -> bool:
+    """
+    Returns whether a failed request means that Lakera Guard is unavailable, as
+    opposed to it rejecting the request, e.g. because of an invalid API key.
+
+    Args:
+        error: the error of the failed request
+    Returns:
+        True for connection errors, timeouts and server errors
+    """
+    if isinstance(error, (LakeraGuardServerError, ConnectionError, TimeoutError)):
+        return True
+    # requests and aiohttp can't have raised the error if they aren't imported
+    requests = sys.modules.get("requests")
+    if requests is not None and isinstance(
+        error, (requests.ConnectionError, requests.Timeout)
+    ):
+        return True
+    aiohttp = sys.modules.get("aiohttp")
+    return aiohttp is not None and isinstance(error, aiohttp.ClientConnectionError)
+
+
+def _get_role(message: Any) -> str:
+    """
+    Returns the Lakera Guard role of a message.
+
+    Args:
+        message: a message of a LangChain ChatLLM input
+    Returns:
+        "user", "system" or "assistant"
+    """
+    if not _MESSAGE_ROLES:
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        _MESSAGE_ROLES.update(
+            {HumanMessage: "user", SystemMessage: "system", AIMessage: "assistant"}
+        )
+    role = _MESSAGE_ROLES.get(type(message))
+    if role is None:
+        for message_type, message_role in list(_MESSAGE_ROLES.items()):
+            if isinstance(message, message_type):
+                role = _MESSAGE_ROLES[type(message)] = message_role
+                break
+    if role is None or not isinstance(message.content, str):
+        raise TypeError("Input type not supported by Lakera Guard.")
+    return role
+
+
+class GuardEndpoint:
+    def __init__(
+        self,
+        endpoint: Endpoints,
+        additional_json_properties: Optional[dict] = None,
+        raise_error: Optional[bool] = None,
+    ) -> None:
+        """
+        Configuration of one endpoint of a LakeraLCGuard that guards against several
+        AI security risks at once.
+
+        Args:
+            endpoint: which AI security risk you want to guard against, see also
+                classifier endpoints available here: https://platform.lakera.ai/docs/api
+            additional_json_properties: add additional key-value pairs to the body of
+                the API request to this endpoint apart from 'input', None to use the
+                additional_json_properties of the LakeraLCGuard
+            raise_error: whether to raise an error or a warning if this endpoint
+                detects AI security risk, None to use the raise_error of the
+                LakeraLCGuard
+        Returns:
+            None
+        """
+        self.endpoint = endpoint
+        self.additional_json_properties = additional_json_properties
+        self.raise_error = raise_error
+
+    def __repr__(self) -> str:
+        return (
+            f"GuardEndpoint(endpoint={self.endpoint!r}, "
+            f"additional_json_properties={self.additional_json_properties!r}, "
+            f"raise_error={self.raise_error!r})"
+        )
+
+
+# Checks are only batched with checks of the same endpoint, priority and tenant
+BatchKey = Tuple[GuardEndpoint, Tuple[Optional[str], Optional[str]]]
 
 
 class LakeraGuardError(RuntimeError):
@@ -65,16 +340,227 @@ class LakeraGuardWarning(RuntimeWarning):
         self.lakera_guard_response = lakera_guard_response
 
 
-session = requests.Session()  # Allows persistent connection (create only once)
+# Input that a guarded _generate or _agenerate has already checked. LangChain's
+# default async implementations run the sync _generate in an executor (with a copy of
+# the context) and some models implement _generate via _stream, which must not send
+# the same input to Lakera Guard a second time.
+_checked_input: ContextVar[Any] = ContextVar("_checked_input", default=None)
+
+
+def _is_checked(prompt: Any) -> bool:
+    """
+    Returns whether a guarded _generate or _agenerate up the call stack has already
+    checked the input (or the list of prompts it belongs to).
+
+    Args:
+        prompt: input of _generate, _agenerate, _stream or _astream
+    Returns:
+        Whether the input has already been checked
+    """
+    checked_input = _checked_input.get()
+    return checked_input is prompt or (
+        isinstance(checked_input, list)
+        and any(checked is prompt for checked in checked_input)
+    )
+
+
+# Run manager of the guarded LLM, ChatLLM or AgentExecutor run that the current checks
+# belong to, which receives a custom "lakera_guard_request" event per request.
+_run_manager: ContextVar[Optional[Any]] = ContextVar("_run_manager", default=None)
+
+
+@contextmanager
+def _guarding(checked_input: Any, run_manager: Optional[Any]) -> Iterator[None]:
+    """
+    Marks the input as checked by the guarded run of run_manager for the calls
+    (and checks) made within the with block.
+
+    Args:
+        checked_input: the input of the guarded _generate or _agenerate
+        run_manager: run manager of the guarded run, None if there is none
+    Returns:
+        None
+    """
+    checked_input_token = _checked_input.set(checked_input)
+    try:
+        with _reporting_to(run_manager):
+            yield
+    finally:
+        _checked_input.reset(checked_input_token)
+
+
+@contextmanager
+def _reporting_to(run_manager: Optional[Any]) -> Iterator[None]:
+    """
+    Reports the requests made (or submitted) within the with block to the callbacks
+    of run_manager.
+
+    Args:
+        run_manager: run manager of the guarded run, None if there is none
+    Returns:
+        None
+    """
+    token = _run_manager.set(run_manager)
+    try:
+        yield
+    finally:
+        _run_manager.reset(token)
+
+
+def _split_into_chunks(
+    text: str, chunk_size: int, chunk_overlap: int
+) -> List[Tuple[int, str]]:
+    """
+    Splits a long text into chunks of at most chunk_size characters that overlap by
+    up to chunk_overlap characters. Chunks end at a paragraph, line or word
+    boundary if there is one, so that words don't get cut in half.
+
+    Args:
+        text: the text to split
+        chunk_size: maximum number of characters of a chunk
+        chunk_overlap: number of characters shared by consecutive chunks, so that
+            risks spanning a chunk boundary are seen whole by one of the chunks
+    Returns:
+        list of the chunks and their offsets in text
+    """
+    chunks = []
+    start = 0
+    while True:
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # The chunk must reach beyond the overlap, otherwise we don't progress
+            for separator in ("\n\n", "\n", " "):
+                boundary = text.rfind(separator, start + chunk_overlap + 1, end)
+                if boundary != -1:
+                    end = boundary + len(separator)
+                    break
+        chunks.append((start, text[start:end]))
+        if end == len(text):
+            return chunks
+
+        next_start = end - chunk_overlap
+        boundary = text.find(" ", next_start, end)
+        start = boundary + 1 if chunk_overlap and boundary != -1 else next_start
+
+
+def _merge_chunk_responses(
+    text: str, chunks: List[Tuple[int, str]], lakera_guard_responses: List[dict]
+) -> dict:
+    """
+    Merges the API responses of the chunks of a text into the response for the whole
+    text.
+
+    The text is flagged if any chunk is flagged, a category is detected if it is
+    detected in any chunk and category scores are the maximum over the chunks.
+    Offsets of detected entities (e.g. PII) are mapped back to the whole text and
+    entities that were cut by or repeated in the overlap of two chunks are merged.
+
+    Args:
+        text: the text that was split
+        chunks: the chunks and their offsets in text, see _split_into_chunks
+        lakera_guard_responses: the API responses in the order of chunks
+    Returns:
+        the merged API response as dict
+    """
+    results = [response["results"][0] for response in lakera_guard_responses]
+    categories: Dict[str, Any] = {}
+    category_scores: Dict[str, Any] = {}
+    payload: Dict[str, Any] = {}
+    for (offset, _), result in zip(chunks, results):
+        for category, detected in (result.get("categories") or {}).items():
+            categories[category] = categories.get(category, False) or detected
+        for category, score in (result.get("category_scores") or {}).items():
+            category_scores[category] = max(category_scores.get(category, score), score)
+        for key, value in (result.get("payload") or {}).items():
+            if isinstance(value, list):
+                payload.setdefault(key, []).extend(
+                    (
+                        dict(
+                            entity,
+                            start=entity["start"] + offset,
+                            end=entity["end"] + offset,
+                        )
+                        if isinstance(entity, dict) and "start" in entity
+                        else entity
+                    )
+                    for entity in value
+                )
+            else:
+                payload.setdefault(key, value)
+
+    for key, entities in payload.items():
+        if not isinstance(entities, list) or not all(
+            isinstance(entity, dict) and "start" in entity for entity in entities
+        ):
+            continue
+        merged_entities: List[dict] = []
+        for entity in sorted(entities, key=lambda entity: entity["start"]):
+            previous = next(
+                (
+                    merged
+                    for merged in reversed(merged_entities)
+                    if merged.get("entity_type") == entity.get("entity_type")
+                    and merged["end"] >= entity["start"]
+                ),
+                None,
+            )
+            if previous is None:
+                merged_entities.append(dict(entity))
+                continue
+            previous["end"] = max(previous["end"], entity["end"])
+            if "text" in previous:
+                previous["text"] = text[previous["start"] : previous["end"]]
+        payload[key] = merged_entities
+
+    merged_response = {
+        "model": lakera_guard_responses[0].get("model"),
+        "results": [
+            {
+                "categories": categories,
+                "category_scores": category_scores,
+                "flagged": any(result["flagged"] for result in results),
+                "payload": payload,
+            }
+        ],
+        "dev_info": lakera_guard_responses[0].get("dev_info"),
+        "chunks": [
+            {
+                "start": offset,
+                "end": offset + len(chunk),
+                "results": response["results"],
+            }
+            for (offset, chunk), response in zip(chunks, lakera_guard_responses)
+        ],
+    }
+    if any(response.get("degraded") for response in lakera_guard_responses):
+        merged_response["degraded"] = True
+    return merged_response
 
 
 class LakeraLCGuard:
     def __init__(
         self,
         api_key: str = "",
-        endpoint: Endpoints = "prompt_injection",
+        endpoint: Union[
+            Endpoints, Sequence[Union[Endpoints, GuardEndpoint]]
+        ] = "prompt_injection",
         additional_json_properties: dict = dict(),
         raise_error: bool = True,
+        max_concurrency: int = 8,
+        mode: GuardMode = "sequential",
+        cache: Optional[CacheBackend] = None,
+        transport: Optional[LakeraTransport] = None,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: int = 200,
+        batch_window: Optional[float] = None,
+        max_batch_size: int = 32,
+        metrics: Optional[MetricsSink] = None,
+        max_context_messages: Optional[int] = None,
+        incremental: bool = False,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        outage_policy: OutagePolicy = "fail_closed",
+        prefilter: Optional[PreFilter] = None,
+        auditor: Optional[Auditor] = None,
     ) -> None:
         """
         Contains different methods that help with guarding LLMs and agents in LangChain.
@@ -83,10 +569,71 @@ class LakeraLCGuard:
             api_key: API key for Lakera Guard
             endpoint: which AI security risk you want to guard against, see also
                 classifier endpoints available here: https://platform.lakera.ai/docs/api
+                To guard against several risks at once, pass a list of endpoints
+                and/or GuardEndpoint configurations; they get checked concurrently
+                and detect_with_response returns their merged result.
             additional_json_properties: add additional key-value pairs to the body of
                 the API request apart from 'input', e.g. domain_whitelist for pii
             raise_error: whether to raise an error or a warning if the classifier
                 endpoint detects AI security risk
+            max_concurrency: maximum number of concurrent requests to Lakera Guard
+                when several inputs are checked at once, e.g. the prompts of a batch
+            mode: how guarded LLMs and ChatLLMs combine the guard check with the
+                model call. "sequential" only calls the model once the input has
+                been cleared. "parallel" starts the model call at the same time as
+                the guard check and only releases its result once the input has been
+                cleared; the generation is cancelled (async) or discarded (sync) if
+                the input is flagged. "audit" never blocks or raises: the checks
+                get queued to the auditor and run in the background, and their
+                outcomes go to the sinks of the auditor.
+            cache: cache for the verdicts of Lakera Guard, so that repeated inputs
+                (system prompts, retrieved documents, ...) are only sent once, e.g.
+                InMemoryCache, SQLiteCache (shared by the processes on a host) or
+                RedisCache (shared by all hosts)
+            transport: HTTP transport to call the Lakera Guard API with, configures
+                the base URL, connection pool, timeouts and retries. By default,
+                all instances share a transport for https://api.lakera.ai
+            chunk_size: if set, text inputs longer than chunk_size characters are
+                split into chunks that get checked concurrently and their results
+                merged, with offsets of detected entities (e.g. PII) referring to
+                the whole input. Useful for long documents and agent observations.
+            chunk_overlap: number of characters shared by consecutive chunks, so
+                that risks spanning a chunk boundary are not missed
+            batch_window: if set, requests to the same endpoint that are made
+                concurrently (by any threads or coroutines) within batch_window
+                seconds are coalesced and sent to Lakera Guard together, which
+                trades up to batch_window seconds of latency for throughput
+            max_batch_size: maximum number of requests sent together, a batch is
+                sent right away once it is full
+            metrics: sink for the metrics of the checks, e.g. InMemoryMetrics or
+                PrometheusMetrics: counters of the requests per endpoint and
+                outcome, of cache hits and of retries, histograms of the time spent
+                converting inputs, on the network and parsing responses and of the
+                request and response sizes
+            max_context_messages: if set, the prompt_injection endpoint only gets
+                the last max_context_messages messages of a conversation instead of
+                the whole history. The other endpoints only get the last user
+                message anyway.
+            incremental: whether to remember the conversations that have been
+                cleared, so that when a conversation grows, the messages that have
+                already been cleared are not checked again. The prompt_injection
+                endpoint gets the new messages plus up to max_context_messages
+                messages in total (6 if max_context_messages is not set), the
+                other endpoints are only called if there is a new user message,
+                and conversations without new messages are not sent at all.
+            circuit_breaker: if set, stops calling Lakera Guard while it is failing
+                or slow, so that checks don't wait for timeouts and retries during
+                an outage, and probes for its recovery
+            outage_policy: what a check does if Lakera Guard can't be reached or
+                the circuit breaker is open. "fail_closed" raises the error (or
+                LakeraGuardUnavailableError), "fail_open" lets the input through
+                with a LakeraGuardWarning, and "cache_only" only lets inputs
+                through whose verdict is in the cache and raises otherwise.
+            prefilter: if set, decides trivially benign inputs, known attack
+                strings and messages from trusted sources locally, without calling
+                Lakera Guard, see PreFilter
+            auditor: queue and worker pool of the checks in "audit" mode, defaults
+                to an Auditor that logs flagged inputs and reports to metrics
         Returns:
             None
         """
@@ -95,7 +642,7 @@ class LakeraLCGuard:
         # evaluated once when the class is imported. This would mean that if the
         # user sets the environment variable (e.g. via load_dotenv()) after importing
         # the class , the class would not use the environment variable.
-        self.api_key = api_key or os.environ.get("LAKERA_GUARD_API_KEY")
+        self.api_key: str = api_key or os.environ.get("LAKERA_GUARD_API_KEY", "")
         if not self.api_key:
             raise ValueError(
                 "No Lakera Guard API key provided. Either provide it in the "
@@ -104,35 +651,147 @@ class LakeraLCGuard:
         self.endpoint = endpoint
         self.additional_json_properties = additional_json_properties
         self.raise_error = raise_error
+        self.endpoints = self._resolve_endpoints(endpoint)
+        self.max_concurrency = max_concurrency
+        self.mode = mode
+        self.cache = cache
+        self.transport = transport or default_transport
+        if chunk_size is not None and not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(
+                f"chunk_overlap must be at least 0 and smaller than chunk_size, got "
+                f"chunk_size={chunk_size} and chunk_overlap={chunk_overlap}."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.metrics = metrics
+        if max_context_messages is not None and max_context_messages < 1:
+            raise ValueError(
+                f"max_context_messages must be at least 1, got {max_context_messages}."
+            )
+        if incremental and max_context_messages is None:
+            max_context_messages = _INCREMENTAL_CONTEXT_MESSAGES
+        self.max_context_messages = max_context_messages
+        self.incremental = incremental
+        self._conversations: Optional[ConversationTracker] = (
+            ConversationTracker() if incremental else None
+        )
+        if outage_policy == "cache_only" and cache is None:
+            raise ValueError('The outage_policy "cache_only" requires a cache.')
+        self.circuit_breaker = circuit_breaker
+        self.outage_policy = outage_policy
+        self.prefilter = prefilter
+        if mode == "audit" and auditor is None:
+            auditor = Auditor(metrics=metrics)
+        self.auditor = auditor
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._batch_dispatcher: Optional[
+            BatchDispatcher[BatchKey, Union[str, GuardChatMessages], dict]
+        ] = None
+        if batch_window is not None:
+            self._batch_dispatcher = BatchDispatcher(
+                self._send_scheduled_batch,
+                self._send_scheduled_request,
+                window=batch_window,
+                max_batch_size=max_batch_size,
+                max_concurrency=max_concurrency,
+            )
+        # Endpoints that turned out not to accept several inputs in one request
+        self._single_input_endpoints: set = set()
+        # Guarded subclass of every type of tool passed to get_guarded_tool
+        self._guarded_tool_types: Dict[type, type] = {}
+        # Threads are only started once inputs are checked concurrently
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="lakera_lcguard"
+        )
+        # Runs single API requests of an input, e.g. to the different endpoints. It
+        # is separate from self._executor, whose workers wait for these requests.
+        self._request_executor = ThreadPoolExecutor(
+            max_workers=max_concurrency * len(self.endpoints),
+            thread_name_prefix="lakera_lcguard_request",
+        )
+        # Runs the API requests of the chunks of a long input. Its workers never wait
+        # for other requests, so it is safe to use from both executors above.
+        self._chunk_executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="lakera_lcguard_chunk"
+        )
+
+    def _resolve_endpoints(
+        self,
+        endpoint: Union[Endpoints, Sequence[Union[Endpoints, GuardEndpoint]]],
+    ) -> List[GuardEndpoint]:
+        """
+        Resolves the endpoint argument into one GuardEndpoint per endpoint with the
+        defaults of this LakeraLCGuard filled in.
+
+        Args:
+            endpoint: endpoint argument of the constructor
+        Returns:
+            list of fully specified GuardEndpoint configurations
+        """
+        configs = [endpoint] if isinstance(endpoint, str) else list(endpoint)
+        if not configs:
+            raise ValueError("Provide at least one Lakera Guard endpoint.")
+
+        guard_endpoints = []
+        for config in configs:
+            if isinstance(config, str):
+                config = GuardEndpoint(config)
+            guard_endpoints.append(
+                GuardEndpoint(
+                    config.endpoint,
+                    self.additional_json_properties
+                    if config.additional_json_properties is None
+                    else config.additional_json_properties,
+                    self.raise_error
+                    if config.raise_error is None
+                    else config.raise_error,
+                )
+            )
+
+        names = [guard_endpoint.endpoint for guard_endpoint in guard_endpoints]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Lakera Guard endpoints must be unique, got {names}.")
 
-    def _call_lakera_guard(self, query: Union[str, GuardChatMessages]) -> dict:
+        return guard_endpoints
+
+    def _build_request_body(
+        self,
+        query: Union[str, GuardChatMessages, List[Union[str, GuardChatMessages]]],
+        guard_endpoint: GuardEndpoint,
+    ) -> dict:
         """
-        Makes an API request to the Lakera Guard API endpoint specified in
-        self.endpoint.
+        Builds the body of the API request to a Lakera Guard API endpoint.
 
         Args:
             query: User prompt or list of message containing system, user
-                and assistant roles.
+                and assistant roles, or a list of user prompts.
+            guard_endpoint: the endpoint to call
         Returns:
-            The endpoints's API response as dict
+            The request body as dict
         """
         request_input = {"input": query}
+        additional_json_properties = guard_endpoint.additional_json_properties or {}
 
-        if "input" in self.additional_json_properties:
+        if "input" in additional_json_properties:
             raise ValueError(
                 'You cannot specify the "input" argument in additional_json_properties.'
             )
 
-        request_body = self.additional_json_properties | request_input
+        return additional_json_properties | request_input
 
-        response = session.post(
-            f"https://api.lakera.ai/v1/{self.endpoint}",
-            json=request_body,
-            headers={"Authorization": f"Bearer {self.api_key}"},
-        )
-        response_body = response.json()
+    def _parse_response_body(
+        self, response_body: dict, guard_endpoint: GuardEndpoint
+    ) -> dict:
+        """
+        Checks the body of an API response of Lakera Guard for errors.
 
-        # Error handling
+        Args:
+            response_body: the endpoint's API response as dict
+            guard_endpoint: the endpoint that was called
+        Returns:
+            The endpoints's API response as dict
+        """
         if "error" in response_body:
             if response_body["error"] == "Unauthorized":
                 raise ValueError(
@@ -142,7 +801,8 @@ class LakeraLCGuard:
                 raise ValueError(
                     str(response_body)
                     + (
-                        f" Provided properties {str(self.additional_json_properties)} "
+                        " Provided properties "
+                        f"{str(guard_endpoint.additional_json_properties)} "
                         "in 'additional_json_properties' are not valid."
                     )
                 )
@@ -153,187 +813,2016 @@ class LakeraLCGuard:
 
         return response_body
 
-    def _convert_to_lakera_guard_input(
-        self, prompt: GuardInput
-    ) -> Union[str, list[dict[str, str]]]:
+    def _get_cache_key(
+        self, query: Union[str, GuardChatMessages], guard_endpoint: GuardEndpoint
+    ) -> str:
         """
-        Formats the input into LangChain's LLMs or ChatLLMs to be compatible as Lakera
-        Guard input.
+        Computes the cache key of a request to Lakera Guard from the endpoint, the
+        additional_json_properties and the normalized input.
 
         Args:
-            prompt: Object that follows LangChain's LLM or ChatLLM input format
+            query: User prompt or list of message containing system, user
+                and assistant roles.
+            guard_endpoint: the endpoint to call
         Returns:
-            Object that follows Lakera Guard's input format
+            The SHA-256 hex digest identifying the request
         """
-        if isinstance(prompt, str):
-            return prompt
-        else:
-            if isinstance(prompt, PromptValue):
-                prompt = prompt.to_messages()
-            if isinstance(prompt, List):
-                user_message = ""
-                formatted_input = []
-                for message in prompt:
-                    if not isinstance(
-                        message, (HumanMessage, SystemMessage, AIMessage)
-                    ) or not isinstance(message.content, str):
-                        raise TypeError("Input type not supported by Lakera Guard.")
-
-                    role = "assistant"
-                    if isinstance(message, SystemMessage):
-                        role = "system"
-                    elif isinstance(message, HumanMessage):
-                        user_message = message.content
-                        role = "user"
-
-                    formatted_input.append({"role": role, "content": message.content})
-
-                if self.endpoint != "prompt_injection":
-                    return user_message
-                return formatted_input
-            else:
-                return str(prompt)
+        normalized_request = json.dumps(
+            [
+                guard_endpoint.endpoint,
+                guard_endpoint.additional_json_properties or {},
+                query,
+            ],
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(normalized_request.encode()).hexdigest()
 
-    def detect(self, prompt: GuardInput) -> GuardInput:
+    def _call_lakera_guard(
+        self,
+        query: Union[str, GuardChatMessages],
+        guard_endpoint: GuardEndpoint,
+        stats: Optional[RequestStats] = None,
+    ) -> dict:
         """
-        If input contains AI security risk specified in self.endpoint, raises either
-        LakeraGuardError or LakeraGuardWarning depending on self.raise_error True or
-        False. Otherwise, lets input through.
+        Makes an API request to a Lakera Guard API endpoint, coalesced with
+        concurrent requests if batching is enabled.
 
         Args:
-            prompt: input to check regarding AI security risk
+            query: User prompt or list of message containing system, user
+                and assistant roles.
+            guard_endpoint: the endpoint to call
+            stats: gets filled in with the sizes, retries and timings of the request
         Returns:
-            prompt unchanged
+            The endpoints's API response as dict
         """
-        formatted_input = self._convert_to_lakera_guard_input(prompt)
+        if self._batch_dispatcher is not None:
+            # The request is shared with other inputs, only its latency is known
+            start = time.perf_counter()
+            try:
+                return self._batch_dispatcher.submit(
+                    (guard_endpoint, get_scheduling()), query
+                ).result()
+            finally:
+                if stats is not None:
+                    stats.network_seconds = time.perf_counter() - start
 
-        lakera_guard_response = self._call_lakera_guard(formatted_input)
+        return self._send_request(query, guard_endpoint, stats)
 
-        if lakera_guard_response["results"][0]["flagged"]:
-            if self.raise_error:
-                raise LakeraGuardError(
-                    f"Lakera Guard detected {self.endpoint}.", lakera_guard_response
-                )
-            else:
-                warnings.warn(
-                    LakeraGuardWarning(
-                        f"Lakera Guard detected {self.endpoint}.",
-                        lakera_guard_response,
+    def _send_request(
+        self,
+        query: Union[str, GuardChatMessages],
+        guard_endpoint: GuardEndpoint,
+        stats: Optional[RequestStats] = None,
+    ) -> dict:
+        """
+        Sends an API request for a single input to a Lakera Guard API endpoint.
+
+        Args:
+            query: User prompt or list of message containing system, user
+                and assistant roles.
+            guard_endpoint: the endpoint to call
+            stats: gets filled in with the sizes, retries and timings of the request
+        Returns:
+            The endpoints's API response as dict
+        """
+        stats = stats or RequestStats()
+        request_body = self._build_request_body(query, guard_endpoint)
+
+        response_body = self.transport.post(
+            guard_endpoint.endpoint, request_body, self.api_key, stats
+        )
+
+        start = time.perf_counter()
+        try:
+            return self._parse_response_body(response_body, guard_endpoint)
+        finally:
+            stats.parsing_seconds += time.perf_counter() - start
+
+    def _send_scheduled_request(
+        self, key: BatchKey, query: Union[str, GuardChatMessages]
+    ) -> dict:
+        """
+        Sends a single input of a batch with the priority and tenant of its caller,
+        as the workers of the batch dispatcher don't run in the caller's context.
+
+        Args:
+            key: the endpoint and the priority and tenant of the input
+            query: the input
+        Returns:
+            The endpoints's API response as dict
+        """
+        guard_endpoint, (priority, tenant) = key
+        with scheduling(priority, tenant):
+            return self._send_request(query, guard_endpoint)
+
+    def _send_scheduled_batch(
+        self, key: BatchKey, queries: List[Union[str, GuardChatMessages]]
+    ) -> Optional[List[dict]]:
+        """
+        Sends the inputs of a batch with the priority and tenant of their callers.
+
+        Args:
+            key: the endpoint and the priority and tenant of the inputs
+            queries: the inputs of the coalesced requests
+        Returns:
+            one API response per input, None if the inputs cannot be sent together
+        """
+        guard_endpoint, (priority, tenant) = key
+        with scheduling(priority, tenant):
+            return self._send_batch_request(guard_endpoint, queries)
+
+    def _send_batch_request(
+        self,
+        guard_endpoint: GuardEndpoint,
+        queries: List[Union[str, GuardChatMessages]],
+    ) -> Optional[List[dict]]:
+        """
+        Sends one API request for several text inputs to a Lakera Guard API endpoint
+        and splits its response into one response per input.
+
+        Args:
+            guard_endpoint: the endpoint to call
+            queries: the inputs of the coalesced requests
+        Returns:
+            one API response per input, None if the inputs cannot be sent together
+        """
+        if guard_endpoint.endpoint in self._single_input_endpoints or not all(
+            isinstance(query, str) for query in queries
+        ):
+            return None
+
+        request_body = self._build_request_body(queries, guard_endpoint)
+        # Outages and other failed requests fail the checks of the batch, they
+        # don't say anything about the endpoint's support for several inputs
+        response_body = self.transport.post(
+            guard_endpoint.endpoint, request_body, self.api_key
+        )
+
+        if "error" in response_body and response_body["error"] != "Invalid Request":
+            # Raises, e.g. for an invalid API key
+            self._parse_response_body(response_body, guard_endpoint)
+
+        results = response_body.get("results")
+        if not (isinstance(results, list) and len(results) == len(queries)):
+            # The endpoint rejected the list of inputs, remember that and send the
+            # inputs one by one
+            self._single_input_endpoints.add(guard_endpoint.endpoint)
+            return None
+
+        return [
+            self._parse_response_body(
+                response_body | {"results": [result]}, guard_endpoint
+            )
+            for result in results
+        ]
+
+    async def _acall_lakera_guard(
+        self,
+        query: Union[str, GuardChatMessages],
+        guard_endpoint: GuardEndpoint,
+        stats: Optional[RequestStats] = None,
+    ) -> dict:
+        """
+        Makes an asynchronous API request to a Lakera Guard API endpoint.
+
+        Args:
+            query: User prompt or list of message containing system, user
+                and assistant roles.
+            guard_endpoint: the endpoint to call
+            stats: gets filled in with the sizes, retries and timings of the request
+        Returns:
+            The endpoints's API response as dict
+        """
+        stats = stats or RequestStats()
+        if self._batch_dispatcher is not None:
+            start = time.perf_counter()
+            try:
+                return await asyncio.wrap_future(
+                    self._batch_dispatcher.submit(
+                        (guard_endpoint, get_scheduling()), query
                     )
                 )
+            finally:
+                stats.network_seconds = time.perf_counter() - start
 
-        return prompt
+        request_body = self._build_request_body(query, guard_endpoint)
 
-    def detect_with_response(self, prompt: GuardInput) -> dict:
+        response_body = await self.transport.apost(
+            guard_endpoint.endpoint, request_body, self.api_key, stats
+        )
+
+        start = time.perf_counter()
+        try:
+            return self._parse_response_body(response_body, guard_endpoint)
+        finally:
+            stats.parsing_seconds += time.perf_counter() - start
+
+    def _convert_to_lakera_guard_input(
+        self,
+        prompt: GuardInput,
+        endpoint: Optional[str] = None,
+        cleared_length: Optional[int] = None,
+    ) -> Optional[Union[str, list[dict[str, str]]]]:
         """
-        Returns detection result of AI security risk specified in self.endpoint
-        with regard to the input.
+        Formats the input into LangChain's LLMs or ChatLLMs to be compatible as Lakera
+        Guard input.
 
         Args:
-            input: input to check regarding AI security risk
+            prompt: Object that follows LangChain's LLM or ChatLLM input format
+            endpoint: endpoint the input is meant for, defaults to the first
+                endpoint of this LakeraLCGuard
+            cleared_length: number of messages at the start of the conversation
+                that have already been cleared, None if that's not tracked
         Returns:
-            detection result of AI security risk specified in self.endpoint
+            Object that follows Lakera Guard's input format, None if there is
+            nothing new to check for the endpoint
         """
-        formatted_input = self._convert_to_lakera_guard_input(prompt)
+        if isinstance(prompt, str):
+            return prompt
+        prompt = _get_messages(prompt)
+        if not isinstance(prompt, list):
+            return str(prompt)
 
-        lakera_guard_response = self._call_lakera_guard(formatted_input)
+        endpoint = endpoint or self.endpoints[0].endpoint
+        prefilter = self.prefilter
+        if prefilter is not None and not prefilter.applies_to(endpoint):
+            prefilter = None
 
-        return lakera_guard_response
+        if endpoint != "prompt_injection":
+            # Only the last user message gets checked, and only if it is new
+            lowest_index = cleared_length or 0
+            for index in range(len(prompt) - 1, lowest_index - 1, -1):
+                if _get_role(prompt[index]) == "user":
+                    break
+            else:
+                index = -1
+            if cleared_length is not None and index < cleared_length:
+                return None
+            if (
+                index >= 0
+                and prefilter is not None
+                and prefilter.is_trusted("user", prompt[index])
+            ):
+                self._count_prefiltered(endpoint, "allow", "trusted")
+                return None
+            return str(prompt[index].content) if index >= 0 else ""
+
+        start = 0
+        if self.max_context_messages is not None:
+            start = max(0, len(prompt) - self.max_context_messages)
+        if cleared_length is not None:
+            if cleared_length >= len(prompt):
+                return None
+            # Messages that haven't been cleared are always checked
+            start = min(start, cleared_length)
+
+        # Only the messages that get sent need their role
+        messages = [
+            {"role": role, "content": str(message.content)}
+            for role, message in (
+                (_get_role(message), message) for message in prompt[start:]
+            )
+            if prefilter is None or not prefilter.is_trusted(role, message)
+        ]
+        if len(messages) < len(prompt) - start:
+            self._count_prefiltered(endpoint, "allow", "trusted")
+            if not messages:
+                return None
+        return messages
 
-    def get_guarded_llm(self, type_of_llm: Type[BaseLLMT]) -> Type[BaseLLMT]:
+    def _get_cleared_length(
+        self, prompt: GuardInput
+    ) -> Tuple[Optional[int], Optional[bytes]]:
         """
-        Creates a subclass of type_of_llm where the input to the LLM always gets
-        checked w.r.t. AI security risk specified in self.endpoint.
+        Returns how many messages at the start of a conversation have already been
+        cleared, if this LakeraLCGuard is incremental.
 
         Args:
-            type_of_llm: any type of LangChain's LLMs
+            prompt: input to check regarding AI security risk
         Returns:
-            Guarded subclass of type_of_llm
+            the number of cleared messages and the fingerprint of the conversation,
+            both None if the input is not a conversation or not tracked
         """
-        lakera_guard_instance = self
+        if self._conversations is None or isinstance(prompt, str):
+            return None, None
+        prompt = _get_messages(prompt)
+        if not isinstance(prompt, list):
+            return None, None
+        return self._conversations.get_cleared_length(prompt)
 
-        class GuardedLLM(type_of_llm):  # type: ignore
-            @property
-            def _llm_type(self) -> str:
-                return "guarded_" + super()._llm_type
+    def _mark_cleared(
+        self, fingerprint: Optional[bytes], lakera_guard_response: dict
+    ) -> None:
+        """
+        Remembers that a conversation has been cleared if no endpoint flagged it and
+        all endpoints could be called.
 
-            def _generate(
-                self,
-                prompts: List[str],
-                **kwargs: Any,
-            ) -> LLMResult:
-                for prompt in prompts:
-                    lakera_guard_instance.detect(prompt)
+        Args:
+            fingerprint: the fingerprint of the conversation, None if not tracked
+            lakera_guard_response: the (merged) API response as dict
+        Returns:
+            None
+        """
+        if (
+            self._conversations is not None
+            and not lakera_guard_response["results"][0]["flagged"]
+            and not lakera_guard_response.get("degraded")
+        ):
+            self._conversations.mark_cleared(fingerprint)
 
-                return super()._generate(prompts, **kwargs)
+    def _count_prefiltered(
+        self, endpoint: str, decision: PreFilterDecision, rule: str
+    ) -> None:
+        """
+        Counts a decision of the pre-filter made while converting an input, i.e.
+        that trusted messages were left out.
 
-        return GuardedLLM
+        Args:
+            endpoint: the endpoint the decision was made for
+            decision: "allow" or "deny"
+            rule: the rule that decided
+        Returns:
+            None
+        """
+        if self.prefilter is not None:
+            self.prefilter.count(decision, rule)
+        if self.metrics is not None:
+            self.metrics.increment(
+                "prefiltered_total",
+                {"endpoint": endpoint, "decision": decision, "rule": rule},
+            )
 
-    def get_guarded_chat_llm(
-        self, type_of_chat_llm: Type[BaseChatModelT]
-    ) -> Type[BaseChatModelT]:
+    def _get_prefiltered_response(
+        self,
+        formatted_input: Union[str, GuardChatMessages],
+        guard_endpoint: GuardEndpoint,
+    ) -> Optional[dict]:
         """
-        Creates a subclass of type_of_chat_llm in which the input to the ChatLLM always
-          gets checked w.r.t. AI security risk specified in self.endpoint.
+        Returns the response of the pre-filter if it can decide the input locally.
 
         Args:
-            type_of_llm: any type of LangChain's ChatLLMs
+            formatted_input: input in Lakera Guard's input format
+            guard_endpoint: the endpoint the input is meant for
         Returns:
-            Guarded subclass of type_of_llm
+            a response that flags a known attack string or doesn't flag a
+            trivially benign input, None if Lakera Guard needs to decide
         """
-        lakera_guard_instance = self
+        prefilter = self.prefilter
+        if prefilter is None or not prefilter.applies_to(guard_endpoint.endpoint):
+            return None
+        texts = (
+            [formatted_input]
+            if isinstance(formatted_input, str)
+            else [message["content"] for message in formatted_input]
+        )
+        decision = prefilter.check(texts)
+        if decision is None:
+            return None
 
-        class GuardedChatLLM(type_of_chat_llm):  # type: ignore
-            @property
-            def _llm_type(self) -> str:
-                return "guarded_" + super()._llm_type
+        decision_name, rule = decision
+        if self.metrics is not None:
+            self.metrics.increment(
+                "prefiltered_total",
+                {
+                    "endpoint": guard_endpoint.endpoint,
+                    "decision": decision_name,
+                    "rule": rule,
+                },
+            )
+        lakera_guard_response = {
+            **_get_unflagged_response(),
+            "prefiltered": {"decision": decision_name, "rule": rule},
+        }
+        if decision_name == "deny":
+            lakera_guard_response["results"] = [
+                {
+                    "categories": {guard_endpoint.endpoint: True},
+                    "category_scores": {guard_endpoint.endpoint: 1.0},
+                    "flagged": True,
+                    "payload": {},
+                }
+            ]
+        return lakera_guard_response
 
-            def _generate(
-                self,
-                messages: List[BaseMessage],
-                stop: Optional[List[str]] = None,
-                run_manager: Optional[CallbackManagerForLLMRun] = None,
-                **kwargs: Any,
-            ) -> ChatResult:
-                lakera_guard_instance.detect(messages)
-                return super()._generate(messages, stop, run_manager, **kwargs)
+    def _get_skipped_response(self, guard_endpoint: GuardEndpoint) -> dict:
+        """
+        Returns the response of an endpoint that wasn't called because the
+        conversation has no new messages for it.
 
-        return GuardedChatLLM
+        Args:
+            guard_endpoint: the endpoint that wasn't called
+        Returns:
+            a response that doesn't flag the input
+        """
+        if self.metrics is not None:
+            self.metrics.increment(
+                "skipped_total", {"endpoint": guard_endpoint.endpoint}
+            )
+        return {**_get_unflagged_response(), "skipped": True}
 
-    def get_guarded_agent_executor(self) -> Type[AgentExecutor]:
+    def _handle_outage(
+        self, guard_endpoint: GuardEndpoint, error: Optional[Exception]
+    ) -> dict:
         """
-        Creates a subclass of the AgentExecutor in which the input to the LLM that the
-        AgentExecutor is initialized with gets checked w.r.t. AI security risk specified
-        in self.endpoint.
+        Applies the outage policy to a check that didn't get a verdict from Lakera
+        Guard (and not from the cache either).
 
+        Args:
+            guard_endpoint: the endpoint that couldn't be called
+            error: the error of the failed request, None if the circuit breaker
+                rejected the request
         Returns:
-            Guarded AgentExecutor subclass
+            a response that doesn't flag the input if the policy fails open,
+            otherwise raises
         """
-        lakera_guard_instance = self
-
-        class GuardedAgentExecutor(AgentExecutor):
-            def _take_next_step(
-                self,
-                name_to_tool_map: Dict[str, BaseTool],
-                color_mapping: Dict[str, str],
-                inputs: Dict[str, str],
-                intermediate_steps: List[Tuple[AgentAction, str]],
-                run_manager: CallbackManagerForChainRun | None = None,
-            ) -> Union[AgentFinish, List[Tuple[AgentAction, str]]]:
-                for val in inputs.values():
-                    lakera_guard_instance.detect(val)
-
-                res = super()._take_next_step(
-                    name_to_tool_map,
-                    color_mapping,
-                    inputs,
-                    intermediate_steps,
-                    run_manager,
+        if self.metrics is not None:
+            self.metrics.increment(
+                "unavailable_total",
+                {
+                    "endpoint": guard_endpoint.endpoint,
+                    "reason": "circuit_open" if error is None else "error",
+                    "policy": self.outage_policy,
+                },
+            )
+
+        if self.outage_policy == "fail_open":
+            lakera_guard_response = {**_get_unflagged_response(), "degraded": True}
+            warnings.warn(
+                LakeraGuardWarning(
+                    f"Lakera Guard is unavailable, the input was not checked for "
+                    f"{guard_endpoint.endpoint}.",
+                    lakera_guard_response,
                 )
+            )
+            return lakera_guard_response
+
+        if error is not None:
+            raise error
+        raise LakeraGuardUnavailableError(
+            f"Lakera Guard is unavailable (circuit breaker open), the input could "
+            f"not be checked for {guard_endpoint.endpoint}."
+        )
 
-                for act in intermediate_steps:
-                    lakera_guard_instance.detect(act[1])
+    def _get_flagged_endpoints(
+        self, lakera_guard_response: dict
+    ) -> List[GuardEndpoint]:
+        """
+        Returns the endpoints that flagged the input.
+
+        Args:
+            lakera_guard_response: the (merged) API response as dict
+        Returns:
+            list of the endpoints that detected AI security risk
+        """
+        if len(self.endpoints) == 1:
+            if lakera_guard_response["results"][0]["flagged"]:
+                return self.endpoints
+            return []
+
+        endpoint_responses = lakera_guard_response["endpoints"]
+        return [
+            guard_endpoint
+            for guard_endpoint in self.endpoints
+            if endpoint_responses[guard_endpoint.endpoint]["results"][0]["flagged"]
+        ]
 
-                return res
+    def _raise_if_flagged(self, lakera_guard_response: dict) -> None:
+        """
+        Raises LakeraGuardError if an endpoint with raise_error True flagged the
+        input.
 
-        return GuardedAgentExecutor
+        Args:
+            lakera_guard_response: the (merged) API response as dict
+        Returns:
+            None
+        """
+        flagged = [
+            guard_endpoint.endpoint
+            for guard_endpoint in self._get_flagged_endpoints(lakera_guard_response)
+            if guard_endpoint.raise_error
+        ]
+        if flagged:
+            raise LakeraGuardError(
+                f"Lakera Guard detected {', '.join(flagged)}.", lakera_guard_response
+            )
+
+    def _warn_if_flagged(self, lakera_guard_response: dict) -> None:
+        """
+        Raises LakeraGuardWarning if an endpoint with raise_error False flagged the
+        input.
+
+        Args:
+            lakera_guard_response: the (merged) API response as dict
+        Returns:
+            None
+        """
+        flagged = [
+            guard_endpoint.endpoint
+            for guard_endpoint in self._get_flagged_endpoints(lakera_guard_response)
+            if not guard_endpoint.raise_error
+        ]
+        if flagged:
+            warnings.warn(
+                LakeraGuardWarning(
+                    f"Lakera Guard detected {', '.join(flagged)}.",
+                    lakera_guard_response,
+                )
+            )
+
+    def _handle_lakera_guard_response(self, lakera_guard_response: dict) -> None:
+        """
+        Raises either LakeraGuardError or LakeraGuardWarning depending on the
+        raise_error setting of the endpoints that flagged the input.
+
+        Args:
+            lakera_guard_response: the (merged) API response as dict
+        Returns:
+            None
+        """
+        self._raise_if_flagged(lakera_guard_response)
+        self._warn_if_flagged(lakera_guard_response)
+
+    def _merge_responses(self, lakera_guard_responses: List[dict]) -> dict:
+        """
+        Merges the API responses of several endpoints into one response.
+
+        The merged result of an input is flagged if any endpoint flagged it and
+        contains the categories, category scores and payloads of all endpoints. The
+        full response of each endpoint is available under "endpoints".
+
+        Args:
+            lakera_guard_responses: the API responses in the order of self.endpoints
+        Returns:
+            the merged API response as dict
+        """
+        merged_results = []
+        for results in zip(
+            *(response["results"] for response in lakera_guard_responses)
+        ):
+            merged_result: Dict[str, Any] = {
+                "categories": {},
+                "category_scores": {},
+                "flagged": any(result["flagged"] for result in results),
+                "payload": {},
+            }
+            for result in results:
+                for key in ("categories", "category_scores", "payload"):
+                    merged_result[key].update(result.get(key) or {})
+            merged_results.append(merged_result)
+
+        merged_response = {
+            "model": lakera_guard_responses[0].get("model"),
+            "results": merged_results,
+            "dev_info": lakera_guard_responses[0].get("dev_info"),
+            "endpoints": {
+                guard_endpoint.endpoint: response
+                for guard_endpoint, response in zip(
+                    self.endpoints, lakera_guard_responses
+                )
+            },
+        }
+        # Some endpoints could not be called and failed open
+        if any(response.get("degraded") for response in lakera_guard_responses):
+            merged_response["degraded"] = True
+        return merged_response
+
+    def detect(self, prompt: GuardInput) -> GuardInput:
+        """
+        If input contains AI security risk specified in self.endpoint, raises either
+        LakeraGuardError or LakeraGuardWarning depending on self.raise_error True or
+        False. Otherwise, lets input through.
+
+        Args:
+            prompt: input to check regarding AI security risk
+        Returns:
+            prompt unchanged
+        """
+        if self.auditor is not None and self.mode == "audit":
+            self.auditor.submit(prompt, self.detect_with_response)
+            return prompt
+
+        lakera_guard_response = self.detect_with_response(prompt)
+
+        self._handle_lakera_guard_response(lakera_guard_response)
+
+        return prompt
+
+    def detect_with_response(self, prompt: GuardInput) -> dict:
+        """
+        Returns detection result of AI security risk specified in self.endpoint
+        with regard to the input.
+
+        Args:
+            input: input to check regarding AI security risk
+        Returns:
+            detection result of AI security risk specified in self.endpoint
+        """
+        cleared_length, fingerprint = self._get_cleared_length(prompt)
+
+        if len(self.endpoints) == 1:
+            lakera_guard_response = self._detect_with_endpoint(
+                prompt, self.endpoints[0], cleared_length
+            )
+            self._mark_cleared(fingerprint, lakera_guard_response)
+            return lakera_guard_response
+
+        # The first endpoint gets checked in the calling thread
+        first_endpoint, *other_endpoints = self.endpoints
+        futures = [
+            self._submit(
+                self._request_executor,
+                self._detect_with_endpoint,
+                prompt,
+                guard_endpoint,
+                cleared_length,
+            )
+            for guard_endpoint in other_endpoints
+        ]
+        try:
+            lakera_guard_responses = [
+                self._detect_with_endpoint(prompt, first_endpoint, cleared_length)
+            ] + [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+        lakera_guard_response = self._merge_responses(lakera_guard_responses)
+        self._mark_cleared(fingerprint, lakera_guard_response)
+        return lakera_guard_response
+
+    def _detect_with_endpoint(
+        self,
+        prompt: GuardInput,
+        guard_endpoint: GuardEndpoint,
+        cleared_length: Optional[int] = None,
+    ) -> dict:
+        """
+        Returns the detection result of one endpoint with regard to the input.
+
+        Args:
+            prompt: input to check regarding AI security risk
+            guard_endpoint: the endpoint to call
+            cleared_length: number of messages at the start of the conversation
+                that have already been cleared, None if that's not tracked
+        Returns:
+            the endpoint's API response as dict
+        """
+        formatted_input = self._convert_for_endpoint(
+            prompt, guard_endpoint, cleared_length
+        )
+        if formatted_input is None:
+            return self._get_skipped_response(guard_endpoint)
+        prefiltered_response = self._get_prefiltered_response(
+            formatted_input, guard_endpoint
+        )
+        if prefiltered_response is not None:
+            return prefiltered_response
+
+        chunks = self._get_chunks(formatted_input)
+        if chunks is None:
+            return self._detect_query(formatted_input, guard_endpoint)
+
+        # The first chunk gets checked in the calling thread
+        futures = [
+            self._submit(
+                self._chunk_executor, self._detect_query, chunk, guard_endpoint
+            )
+            for _, chunk in chunks[1:]
+        ]
+        try:
+            lakera_guard_responses = [
+                self._detect_query(chunks[0][1], guard_endpoint)
+            ] + [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return _merge_chunk_responses(
+            str(formatted_input), chunks, lakera_guard_responses
+        )
+
+    def _convert_for_endpoint(
+        self,
+        prompt: GuardInput,
+        guard_endpoint: GuardEndpoint,
+        cleared_length: Optional[int] = None,
+    ) -> Optional[Union[str, GuardChatMessages]]:
+        """
+        Formats the input for an endpoint and records how long that took.
+
+        Args:
+            prompt: input to check regarding AI security risk
+            guard_endpoint: the endpoint the input is meant for
+            cleared_length: number of messages at the start of the conversation
+                that have already been cleared, None if that's not tracked
+        Returns:
+            Object that follows Lakera Guard's input format, None if there is
+            nothing new to check for the endpoint
+        """
+        start = time.perf_counter()
+        formatted_input = self._convert_to_lakera_guard_input(
+            prompt, guard_endpoint.endpoint, cleared_length
+        )
+        if self.metrics is not None:
+            self.metrics.observe(
+                "conversion_seconds",
+                {"endpoint": guard_endpoint.endpoint},
+                time.perf_counter() - start,
+            )
+        return formatted_input
+
+    def _record_request(
+        self,
+        guard_endpoint: GuardEndpoint,
+        lakera_guard_response: Optional[dict],
+        stats: Optional[RequestStats],
+    ) -> dict:
+        """
+        Records the metrics of a request to Lakera Guard and returns the event that
+        describes it.
+
+        Args:
+            guard_endpoint: the endpoint that was called
+            lakera_guard_response: the endpoint's API response, None if the request
+                failed
+            stats: sizes, retries and timings of the request, None if the response
+                came from the cache
+        Returns:
+            the event data of the request
+        """
+        if lakera_guard_response is None:
+            outcome = "error"
+        elif lakera_guard_response["results"][0]["flagged"]:
+            outcome = "flagged"
+        else:
+            outcome = "clear"
+        event: Dict[str, Any] = {
+            "endpoint": guard_endpoint.endpoint,
+            "outcome": outcome,
+            "cached": stats is None,
+        }
+        if stats is not None:
+            event.update(
+                network_seconds=stats.network_seconds,
+                parsing_seconds=stats.parsing_seconds,
+                request_bytes=stats.request_bytes,
+                response_bytes=stats.response_bytes,
+                retries=stats.retries,
+                queue_seconds=stats.queue_seconds,
+            )
+
+        if self.metrics is not None:
+            labels = {"endpoint": guard_endpoint.endpoint}
+            self.metrics.increment("requests_total", {**labels, "outcome": outcome})
+            if self.cache is not None:
+                self.metrics.increment(
+                    "cache_total",
+                    {**labels, "result": "hit" if stats is None else "miss"},
+                )
+            if stats is not None:
+                self.metrics.observe("network_seconds", labels, stats.network_seconds)
+                self.metrics.observe("parsing_seconds", labels, stats.parsing_seconds)
+                if self.transport.scheduler is not None:
+                    self.metrics.observe("queue_seconds", labels, stats.queue_seconds)
+                if stats.request_bytes:
+                    self.metrics.observe("request_bytes", labels, stats.request_bytes)
+                    self.metrics.observe("response_bytes", labels, stats.response_bytes)
+                if stats.retries:
+                    self.metrics.increment("retries_total", labels, stats.retries)
+
+        return event
+
+    def _dispatch_event(self, event: dict) -> None:
+        """
+        Sends the event of a request to the callbacks of the guarded run or, outside
+        of one, e.g. in a streamed model call or in a RunnableLambda, to the
+        callbacks of the enclosing runnable, if any.
+
+        Args:
+            event: the event data of the request
+        Returns:
+            None
+        """
+        run_manager = _run_manager.get()
+        if run_manager is None:
+            config = _get_runnable_config()
+            if config is None:
+                return
+            from langchain_core.runnables.config import get_callback_manager_for_config
+
+            callback_manager = get_callback_manager_for_config(config)
+            if callback_manager.parent_run_id is not None:
+                callback_manager.on_custom_event(
+                    "lakera_guard_request",
+                    event,
+                    run_id=callback_manager.parent_run_id,
+                )
+            return
+        from langchain_core.callbacks import (
+            AsyncCallbackManagerForChainRun,
+            AsyncCallbackManagerForLLMRun,
+            CallbackManager,
+        )
+
+        if isinstance(
+            run_manager,
+            (AsyncCallbackManagerForLLMRun, AsyncCallbackManagerForChainRun),
+        ):
+            run_manager = run_manager.get_sync()
+        CallbackManager(
+            run_manager.handlers,
+            parent_run_id=run_manager.parent_run_id,
+            tags=run_manager.tags,
+            metadata=run_manager.metadata,
+        ).on_custom_event("lakera_guard_request", event, run_id=run_manager.run_id)
+
+    async def _adispatch_event(self, event: dict) -> None:
+        """
+        Asynchronous version of _dispatch_event.
+
+        Args:
+            event: the event data of the request
+        Returns:
+            None
+        """
+        run_manager = _run_manager.get()
+        if run_manager is None:
+            config = _get_runnable_config()
+            if config is None:
+                return
+            from langchain_core.runnables.config import (
+                get_async_callback_manager_for_config,
+            )
+
+            callback_manager = get_async_callback_manager_for_config(config)
+            if callback_manager.parent_run_id is not None:
+                await callback_manager.on_custom_event(
+                    "lakera_guard_request",
+                    event,
+                    run_id=callback_manager.parent_run_id,
+                )
+            return
+        from langchain_core.callbacks import (
+            AsyncCallbackManager,
+            AsyncCallbackManagerForChainRun,
+            AsyncCallbackManagerForLLMRun,
+        )
+
+        if isinstance(
+            run_manager,
+            (AsyncCallbackManagerForLLMRun, AsyncCallbackManagerForChainRun),
+        ):
+            await AsyncCallbackManager(
+                run_manager.handlers,
+                parent_run_id=run_manager.parent_run_id,
+                tags=run_manager.tags,
+                metadata=run_manager.metadata,
+            ).on_custom_event("lakera_guard_request", event, run_id=run_manager.run_id)
+        else:
+            self._dispatch_event(event)
+
+    def _submit(self, executor: ThreadPoolExecutor, fn: Callable, *args: Any) -> Future:
+        """
+        Runs fn in executor within a copy of the current context, so that the
+        checks it makes report to the callbacks of the guarded run.
+
+        Args:
+            executor: the executor to run fn in
+            fn: the function to run
+            args: the arguments of fn
+        Returns:
+            future with the result of fn
+        """
+        return executor.submit(copy_context().run, fn, *args)
+
+    def _get_chunks(
+        self, formatted_input: Union[str, GuardChatMessages]
+    ) -> Optional[List[Tuple[int, str]]]:
+        """
+        Returns the chunks of an input that is too long to be checked at once.
+
+        Args:
+            formatted_input: input in Lakera Guard's input format
+        Returns:
+            the chunks and their offsets in the input, None if the input does not
+            get split
+        """
+        if (
+            self.chunk_size is None
+            or not isinstance(formatted_input, str)
+            or len(formatted_input) <= self.chunk_size
+        ):
+            return None
+        return _split_into_chunks(formatted_input, self.chunk_size, self.chunk_overlap)
+
+    def _detect_query(
+        self, query: Union[str, GuardChatMessages], guard_endpoint: GuardEndpoint
+    ) -> dict:
+        """
+        Returns the (possibly cached) detection result of one endpoint with regard to
+        an input in Lakera Guard's input format.
+
+        Args:
+            query: User prompt or list of message containing system, user
+                and assistant roles.
+            guard_endpoint: the endpoint to call
+        Returns:
+            the endpoint's API response as dict
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._get_cache_key(query, guard_endpoint)
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                lakera_guard_response = json.loads(cached_response)
+                self._dispatch_event(
+                    self._record_request(guard_endpoint, lakera_guard_response, None)
+                )
+                return lakera_guard_response
+
+        circuit_breaker = self.circuit_breaker
+        if circuit_breaker is not None and not circuit_breaker.allow_request():
+            return self._handle_outage(guard_endpoint, None)
+
+        stats = RequestStats()
+        try:
+            lakera_guard_response = self._call_lakera_guard(
+                query, guard_endpoint, stats
+            )
+        except SchedulerTimeoutError:
+            # The request never left the process, so it says nothing about the
+            # availability of Lakera Guard
+            raise
+        except Exception as e:
+            outage = _is_outage(e)
+            if circuit_breaker is not None:
+                if outage:
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success(stats.network_seconds)
+            self._dispatch_event(self._record_request(guard_endpoint, None, stats))
+            if not outage:
+                # Invalid API keys and requests must never let inputs through
+                raise
+            return self._handle_outage(guard_endpoint, e)
+        if circuit_breaker is not None:
+            circuit_breaker.record_success(stats.network_seconds)
+        self._dispatch_event(
+            self._record_request(guard_endpoint, lakera_guard_response, stats)
+        )
+
+        if self.cache is not None and cache_key is not None:
+            self.cache.set(cache_key, json.dumps(lakera_guard_response))
+
+        return lakera_guard_response
+
+    def _detect_for_batch(self, prompt: GuardInput) -> dict:
+        """
+        Returns the detection result of one input of a batch and raises
+        LakeraGuardError right away if the input is flagged by an endpoint with
+        raise_error True, so that the batch fails fast.
+
+        Args:
+            prompt: input to check regarding AI security risk
+        Returns:
+            detection result of AI security risk specified in self.endpoint
+        """
+        lakera_guard_response = self.detect_with_response(prompt)
+
+        self._raise_if_flagged(lakera_guard_response)
+
+        return lakera_guard_response
+
+    def detect_batch(self, prompts: Sequence[GuardInput]) -> Sequence[GuardInput]:
+        """
+        Checks several inputs concurrently (at most self.max_concurrency at a time).
+        If any input contains AI security risk specified in self.endpoint, raises
+        LakeraGuardError as soon as it is detected or, if self.raise_error is False,
+        raises a LakeraGuardWarning for every flagged input. Otherwise, lets the
+        inputs through.
+
+        Args:
+            prompts: inputs to check regarding AI security risk
+        Returns:
+            prompts unchanged
+        """
+        if len(prompts) == 1 or self.mode == "audit":
+            for prompt in prompts:
+                self.detect(prompt)
+            return prompts
+
+        self._wait_for_batch(self._submit_batch(prompts))
+
+        return prompts
+
+    def _submit_batch(self, prompts: Sequence[GuardInput]) -> List[Future]:
+        """
+        Starts checking several inputs in the background.
+
+        Args:
+            prompts: inputs to check regarding AI security risk
+        Returns:
+            one future per input with its detection result
+        """
+        return [
+            self._submit(self._executor, self._detect_for_batch, prompt)
+            for prompt in prompts
+        ]
+
+    def _wait_for_batch(self, futures: List[Future]) -> None:
+        """
+        Waits for the checks started by _submit_batch, fails fast on the first
+        flagged input if self.raise_error is True and raises a LakeraGuardWarning for
+        every flagged input otherwise.
+
+        Args:
+            futures: futures returned by _submit_batch
+        Returns:
+            None
+        """
+        try:
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            # Fail fast: don't send inputs that are still waiting for a free worker
+            for future in futures:
+                future.cancel()
+
+        for future in futures:
+            self._warn_if_flagged(future.result())
+
+    def _guard_generation(
+        self, prompts: Sequence[GuardInput], generate: Callable[[], T]
+    ) -> T:
+        """
+        Checks the inputs of a model call and runs the model call according to
+        self.mode.
+
+        Args:
+            prompts: inputs of the model call to check regarding AI security risk
+            generate: runs the model call
+        Returns:
+            result of the model call
+        """
+        # In "audit" mode, detect_batch only queues the checks
+        if self.mode != "parallel":
+            self.detect_batch(prompts)
+            return generate()
+
+        # The model call stays in the calling thread (callbacks, tracing context)
+        # while the checks run in the background.
+        futures = self._submit_batch(prompts)
+        try:
+            result = generate()
+        except BaseException:
+            # A flagged input takes precedence over an error of the model call
+            self._wait_for_batch(futures)
+            raise
+        self._wait_for_batch(futures)
+
+        return result
+
+    def _get_output_texts(self, result: Union[LLMResult, ChatResult]) -> List[str]:
+        """
+        Returns the texts of all generations of a model call that need checking.
+
+        Args:
+            result: result of the model call
+        Returns:
+            the non-empty texts of the generations, including their tool calls
+        """
+        from langchain_core.outputs import LLMResult
+
+        generations: Iterable[Generation]
+        if isinstance(result, LLMResult):
+            generations = (
+                generation
+                for prompt_generations in result.generations
+                for generation in prompt_generations
+            )
+        else:
+            generations = result.generations
+        return [text for text in map(_get_generation_text, generations) if text.strip()]
+
+    def _check_output(self, result: OutputT) -> OutputT:
+        """
+        Checks all generations of a model call concurrently.
+
+        Args:
+            result: result of the model call
+        Returns:
+            result unchanged
+        """
+        texts = self._get_output_texts(result)
+        if texts:
+            self.detect_batch(texts)
+        return result
+
+    async def adetect(self, prompt: GuardInput) -> GuardInput:
+        """
+        Asynchronous version of detect that does not block the event loop.
+
+        Args:
+            prompt: input to check regarding AI security risk
+        Returns:
+            prompt unchanged
+        """
+        if self.auditor is not None and self.mode == "audit":
+            await self.auditor.asubmit(prompt, self.detect_with_response)
+            return prompt
+
+        lakera_guard_response = await self.adetect_with_response(prompt)
+
+        self._handle_lakera_guard_response(lakera_guard_response)
+
+        return prompt
+
+    async def adetect_with_response(self, prompt: GuardInput) -> dict:
+        """
+        Asynchronous version of detect_with_response that does not block the event
+        loop.
+
+        Args:
+            prompt: input to check regarding AI security risk
+        Returns:
+            detection result of AI security risk specified in self.endpoint
+        """
+        cleared_length, fingerprint = self._get_cleared_length(prompt)
+
+        if len(self.endpoints) == 1:
+            lakera_guard_response = await self._adetect_with_endpoint(
+                prompt, self.endpoints[0], cleared_length
+            )
+            self._mark_cleared(fingerprint, lakera_guard_response)
+            return lakera_guard_response
+
+        lakera_guard_responses = await asyncio.gather(
+            *(
+                self._adetect_with_endpoint(prompt, guard_endpoint, cleared_length)
+                for guard_endpoint in self.endpoints
+            )
+        )
+
+        lakera_guard_response = self._merge_responses(list(lakera_guard_responses))
+        self._mark_cleared(fingerprint, lakera_guard_response)
+        return lakera_guard_response
+
+    async def _adetect_with_endpoint(
+        self,
+        prompt: GuardInput,
+        guard_endpoint: GuardEndpoint,
+        cleared_length: Optional[int] = None,
+    ) -> dict:
+        """
+        Asynchronous version of _detect_with_endpoint.
+
+        Args:
+            prompt: input to check regarding AI security risk
+            guard_endpoint: the endpoint to call
+            cleared_length: number of messages at the start of the conversation
+                that have already been cleared, None if that's not tracked
+        Returns:
+            the endpoint's API response as dict
+        """
+        formatted_input = self._convert_for_endpoint(
+            prompt, guard_endpoint, cleared_length
+        )
+        if formatted_input is None:
+            return self._get_skipped_response(guard_endpoint)
+        prefiltered_response = self._get_prefiltered_response(
+            formatted_input, guard_endpoint
+        )
+        if prefiltered_response is not None:
+            return prefiltered_response
+
+        chunks = self._get_chunks(formatted_input)
+        if chunks is None:
+            return await self._adetect_query(formatted_input, guard_endpoint)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def adetect_chunk(chunk: str) -> dict:
+            async with semaphore:
+                return await self._adetect_query(chunk, guard_endpoint)
+
+        lakera_guard_responses = await asyncio.gather(
+            *(adetect_chunk(chunk) for _, chunk in chunks)
+        )
+
+        return _merge_chunk_responses(
+            str(formatted_input), chunks, list(lakera_guard_responses)
+        )
+
+    async def _adetect_query(
+        self, query: Union[str, GuardChatMessages], guard_endpoint: GuardEndpoint
+    ) -> dict:
+        """
+        Asynchronous version of _detect_query.
+
+        Args:
+            query: User prompt or list of message containing system, user
+                and assistant roles.
+            guard_endpoint: the endpoint to call
+        Returns:
+            the endpoint's API response as dict
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._get_cache_key(query, guard_endpoint)
+            cached_response = await self.cache.aget(cache_key)
+            if cached_response is not None:
+                lakera_guard_response = json.loads(cached_response)
+                await self._adispatch_event(
+                    self._record_request(guard_endpoint, lakera_guard_response, None)
+                )
+                return lakera_guard_response
+
+        circuit_breaker = self.circuit_breaker
+        if circuit_breaker is not None and not circuit_breaker.allow_request():
+            return self._handle_outage(guard_endpoint, None)
+
+        stats = RequestStats()
+        try:
+            lakera_guard_response = await self._acall_lakera_guard(
+                query, guard_endpoint, stats
+            )
+        except SchedulerTimeoutError:
+            # The request never left the process, so it says nothing about the
+            # availability of Lakera Guard
+            raise
+        except Exception as e:
+            outage = _is_outage(e)
+            if circuit_breaker is not None:
+                if outage:
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success(stats.network_seconds)
+            await self._adispatch_event(
+                self._record_request(guard_endpoint, None, stats)
+            )
+            if not outage:
+                # Invalid API keys and requests must never let inputs through
+                raise
+            return self._handle_outage(guard_endpoint, e)
+        if circuit_breaker is not None:
+            circuit_breaker.record_success(stats.network_seconds)
+        await self._adispatch_event(
+            self._record_request(guard_endpoint, lakera_guard_response, stats)
+        )
+
+        if self.cache is not None and cache_key is not None:
+            await self.cache.aset(cache_key, json.dumps(lakera_guard_response))
+
+        return lakera_guard_response
+
+    def _guard_stream(
+        self,
+        prompts: Sequence[GuardInput],
+        stream: Callable[[], Iterator[ChunkT]],
+        output_window: Optional[int] = None,
+        run_manager: Optional[Any] = None,
+        guard_output: bool = False,
+    ) -> Iterator[ChunkT]:
+        """
+        Checks the inputs of a streamed model call before the first chunk is
+        released and, if output_window is set, checks the output in the background
+        every output_window characters while it streams. If guard_output is True,
+        the complete output gets checked once it has streamed.
+
+        In "parallel" mode, the model starts streaming at the same time as the
+        input check and its chunks are held back until the input has been cleared.
+
+        Args:
+            prompts: inputs of the model call to check regarding AI security risk
+            stream: starts the streamed model call
+            output_window: number of characters after which the new output gets
+                checked, None to not check the output while it streams
+            run_manager: run manager of the streamed model call that the checks
+                get reported to
+            guard_output: whether to check the complete output of the streamed
+                model call
+        Returns:
+            the chunks of the streamed model call
+        """
+        with _reporting_to(run_manager):
+            if self.mode != "parallel":
+                self.detect_batch(prompts)
+                chunks = stream()
+            else:
+                chunks = self._hold_back_stream(self._submit_batch(prompts), stream())
+
+        if output_window is None and not guard_output:
+            yield from chunks
+        else:
+            yield from self._check_output_stream(
+                chunks, output_window, run_manager, guard_output
+            )
+
+    def _hold_back_stream(
+        self, input_checks: List[Future], chunks: Iterator[ChunkT]
+    ) -> Iterator[ChunkT]:
+        """
+        Holds back the chunks of a streamed model call until the input checks
+        running in the background have cleared its input. The streamed model call
+        gets closed if an input is flagged or the chunks aren't read to the end.
+
+        Args:
+            input_checks: futures of the input checks
+            chunks: chunks of the streamed model call
+        Returns:
+            the chunks of the streamed model call
+        """
+        try:
+            try:
+                held_back: List[ChunkT] = []
+                for chunk in chunks:
+                    held_back.append(chunk)
+                    if all(future.done() for future in input_checks):
+                        break
+                self._wait_for_batch(input_checks)
+            finally:
+                for future in input_checks:
+                    future.cancel()
+            yield from held_back
+            yield from chunks
+        finally:
+            # Stops the model call instead of leaving its connection open until
+            # the generator gets garbage collected
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def _check_output_stream(
+        self,
+        chunks: Iterator[ChunkT],
+        output_window: Optional[int],
+        run_manager: Optional[Any] = None,
+        guard_output: bool = False,
+    ) -> Iterator[ChunkT]:
+        """
+        Checks the output of a streamed model call in the background every
+        output_window characters and raises as soon as a check flagged it. Every
+        check only gets the output since the last one and the last chunk_overlap
+        characters before it, so that the requests don't grow with the output.
+        The rest of the output, or the complete output if guard_output is True,
+        gets checked with the tool calls of a chat model while the caller reads
+        the last chunks.
+
+        Args:
+            chunks: chunks of the streamed model call
+            output_window: number of characters after which the new output gets
+                checked, None to only check the complete output
+            run_manager: run manager of the streamed model call that the checks
+                get reported to
+            guard_output: whether to check the complete output once it has
+                streamed
+        Returns:
+            the chunks of the streamed model call
+        """
+        if self.mode == "audit":
+            # Only the complete output gets queued
+            output_window = None
+        output: List[str] = []
+        tool_calls: List[str] = []
+        # Output since the last check, sent with the end of the output before it
+        window: List[str] = []
+        overlap = ""
+        output_length = checked_length = 0
+        output_checks: List[Future] = []
+        try:
+            for chunk in chunks:
+                output.append(chunk.text)
+                window.append(chunk.text)
+                output_length += len(chunk.text)
+                tool_calls.append(_get_tool_call_chunk_text(chunk))
+                if (
+                    output_window is not None
+                    and output_length - checked_length >= output_window
+                ):
+                    window_text = overlap + "".join(window)
+                    with _reporting_to(run_manager):
+                        output_checks.append(
+                            self._submit(
+                                self._executor, self._detect_for_batch, window_text
+                            )
+                        )
+                    overlap = window_text[
+                        max(0, len(window_text) - self.chunk_overlap) :
+                    ]
+                    window = []
+                    checked_length = output_length
+                for future in output_checks:
+                    if future.done():
+                        future.result()
+                yield chunk
+
+            tool_call_text = "".join(tool_calls)
+            if guard_output or output_window is None:
+                final_text = "".join(output)
+            elif output_length > checked_length:
+                final_text = overlap + "".join(window)
+            else:
+                final_text = ""
+            output_text = "\n".join(filter(None, [final_text, tool_call_text]))
+            if self.mode == "audit":
+                if output_text:
+                    self.detect(output_text)
+            elif output_text:
+                with _reporting_to(run_manager):
+                    output_checks.append(
+                        self._submit(
+                            self._executor,
+                            self._detect_for_batch,
+                            output_text,
+                        )
+                    )
+            self._wait_for_batch(output_checks)
+        finally:
+            for future in output_checks:
+                future.cancel()
+
+    async def _adetect_for_batch(
+        self, prompt: GuardInput, semaphore: asyncio.Semaphore
+    ) -> dict:
+        """
+        Asynchronous version of _detect_for_batch that waits for the semaphore
+        before calling Lakera Guard.
+
+        Args:
+            prompt: input to check regarding AI security risk
+            semaphore: limits the number of concurrent requests of the batch
+        Returns:
+            detection result of AI security risk specified in self.endpoint
+        """
+        async with semaphore:
+            lakera_guard_response = await self.adetect_with_response(prompt)
+
+        self._raise_if_flagged(lakera_guard_response)
+
+        return lakera_guard_response
+
+    async def adetect_batch(
+        self, prompts: Sequence[GuardInput]
+    ) -> Sequence[GuardInput]:
+        """
+        Asynchronous version of detect_batch that does not block the event loop.
+
+        Args:
+            prompts: inputs to check regarding AI security risk
+        Returns:
+            prompts unchanged
+        """
+        if self.mode == "audit":
+            for prompt in prompts:
+                await self.adetect(prompt)
+            return prompts
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [
+            asyncio.ensure_future(self._adetect_for_batch(prompt, semaphore))
+            for prompt in prompts
+        ]
+        try:
+            lakera_guard_responses = await asyncio.gather(*tasks)
+        except BaseException:
+            # Fail fast: cancel the checks that are still running
+            for task in tasks:
+                task.cancel()
+            raise
+
+        for lakera_guard_response in lakera_guard_responses:
+            self._warn_if_flagged(lakera_guard_response)
+
+        return prompts
+
+    async def _aguard_generation(
+        self, prompts: Sequence[GuardInput], agenerate: Callable[[], Awaitable[T]]
+    ) -> T:
+        """
+        Asynchronous version of _guard_generation that cancels the model call if an
+        input is flagged in "parallel" mode.
+
+        Args:
+            prompts: inputs of the model call to check regarding AI security risk
+            agenerate: starts the model call
+        Returns:
+            result of the model call
+        """
+        if self.mode != "parallel":
+            await self.adetect_batch(prompts)
+            return await agenerate()
+
+        generation = asyncio.ensure_future(agenerate())
+        try:
+            await self.adetect_batch(prompts)
+        except BaseException:
+            generation.cancel()
+            # Retrieve the outcome so that asyncio doesn't log it as unhandled
+            generation.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+            raise
+
+        return await generation
+
+    async def _acheck_output(self, result: OutputT) -> OutputT:
+        """
+        Asynchronous version of _check_output.
+
+        Args:
+            result: result of the model call
+        Returns:
+            result unchanged
+        """
+        texts = self._get_output_texts(result)
+        if texts:
+            await self.adetect_batch(texts)
+        return result
+
+    async def _aguard_stream(
+        self,
+        prompts: Sequence[GuardInput],
+        astream: Callable[[], AsyncIterator[ChunkT]],
+        output_window: Optional[int] = None,
+        run_manager: Optional[Any] = None,
+        guard_output: bool = False,
+    ) -> AsyncIterator[ChunkT]:
+        """
+        Asynchronous version of _guard_stream.
+
+        Args:
+            prompts: inputs of the model call to check regarding AI security risk
+            astream: starts the streamed model call
+            output_window: number of characters after which the new output gets
+                checked, None to not check the output while it streams
+            run_manager: run manager of the streamed model call that the checks
+                get reported to
+            guard_output: whether to check the complete output of the streamed
+                model call
+        Returns:
+            the chunks of the streamed model call
+        """
+        with _reporting_to(run_manager):
+            if self.mode != "parallel":
+                await self.adetect_batch(prompts)
+                chunks = astream()
+            else:
+                chunks = self._ahold_back_stream(
+                    asyncio.ensure_future(self.adetect_batch(prompts)), astream()
+                )
+
+        if output_window is not None or guard_output:
+            chunks = self._acheck_output_stream(
+                chunks, output_window, run_manager, guard_output
+            )
+        async for chunk in chunks:
+            yield chunk
+
+    async def _ahold_back_stream(
+        self, input_check: "asyncio.Future[Any]", chunks: AsyncIterator[ChunkT]
+    ) -> AsyncIterator[ChunkT]:
+        """
+        Asynchronous version of _hold_back_stream.
+
+        Args:
+            input_check: task of the input checks
+            chunks: chunks of the streamed model call
+        Returns:
+            the chunks of the streamed model call
+        """
+        try:
+            try:
+                held_back: List[ChunkT] = []
+                async for chunk in chunks:
+                    held_back.append(chunk)
+                    if input_check.done():
+                        break
+                await input_check
+            finally:
+                input_check.cancel()
+            for chunk in held_back:
+                yield chunk
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def _acheck_output_stream(
+        self,
+        chunks: AsyncIterator[ChunkT],
+        output_window: Optional[int],
+        run_manager: Optional[Any] = None,
+        guard_output: bool = False,
+    ) -> AsyncIterator[ChunkT]:
+        """
+        Asynchronous version of _check_output_stream.
+
+        Args:
+            chunks: chunks of the streamed model call
+            output_window: number of characters after which the new output gets
+                checked, None to only check the complete output
+            run_manager: run manager of the streamed model call that the checks
+                get reported to
+            guard_output: whether to check the complete output once it has
+                streamed
+        Returns:
+            the chunks of the streamed model call
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.mode == "audit":
+            # Only the complete output gets queued
+            output_window = None
+        output: List[str] = []
+        tool_calls: List[str] = []
+        # Output since the last check, sent with the end of the output before it
+        window: List[str] = []
+        overlap = ""
+        output_length = checked_length = 0
+        output_checks: List[asyncio.Future] = []
+        try:
+            async for chunk in chunks:
+                output.append(chunk.text)
+                window.append(chunk.text)
+                output_length += len(chunk.text)
+                tool_calls.append(_get_tool_call_chunk_text(chunk))
+                if (
+                    output_window is not None
+                    and output_length - checked_length >= output_window
+                ):
+                    window_text = overlap + "".join(window)
+                    with _reporting_to(run_manager):
+                        output_checks.append(
+                            asyncio.ensure_future(
+                                self._adetect_for_batch(window_text, semaphore)
+                            )
+                        )
+                    overlap = window_text[
+                        max(0, len(window_text) - self.chunk_overlap) :
+                    ]
+                    window = []
+                    checked_length = output_length
+                for task in output_checks:
+                    if task.done():
+                        task.result()
+                yield chunk
+
+            tool_call_text = "".join(tool_calls)
+            if guard_output or output_window is None:
+                final_text = "".join(output)
+            elif output_length > checked_length:
+                final_text = overlap + "".join(window)
+            else:
+                final_text = ""
+            output_text = "\n".join(filter(None, [final_text, tool_call_text]))
+            if self.mode == "audit":
+                if output_text:
+                    await self.adetect(output_text)
+            elif output_text:
+                with _reporting_to(run_manager):
+                    output_checks.append(
+                        asyncio.ensure_future(
+                            self._adetect_for_batch(output_text, semaphore)
+                        )
+                    )
+            for lakera_guard_response in await asyncio.gather(*output_checks):
+                self._warn_if_flagged(lakera_guard_response)
+        finally:
+            for task in output_checks:
+                task.cancel()
+
+    def _get_pii_endpoint(self) -> GuardEndpoint:
+        """
+        Returns the configuration of the pii endpoint used for redaction.
+
+        Returns:
+            the pii endpoint of this LakeraLCGuard if it has one, otherwise a pii
+            endpoint with the defaults of this LakeraLCGuard
+        """
+        for guard_endpoint in self.endpoints:
+            if guard_endpoint.endpoint == "pii":
+                return guard_endpoint
+        return GuardEndpoint("pii", self.additional_json_properties, self.raise_error)
+
+    def _apply_redaction(
+        self,
+        prompt: GuardInput,
+        lakera_guard_response: dict,
+        strategy: RedactionStrategy,
+        mask_char: str,
+        mapping: Dict[str, str],
+    ) -> GuardInput:
+        """
+        Redacts the PII entities detected by the pii endpoint in the input.
+
+        Args:
+            prompt: the input that was checked
+            lakera_guard_response: the pii endpoint's API response for the input
+            strategy: how to replace the entities, see redact
+            mask_char: character used by the "mask" strategy
+            mapping: tokens of the "token" strategy and the values they replace
+        Returns:
+            the redacted input, in the same format as prompt
+        """
+        payload = lakera_guard_response["results"][0].get("payload") or {}
+        entities = payload.get("pii") or []
+
+        if isinstance(prompt, str):
+            return redact_text(prompt, entities, strategy, mask_char, mapping)
+
+        from langchain_core.messages import HumanMessage
+        from langchain_core.prompt_values import (
+            ChatPromptValue,
+            PromptValue,
+            StringPromptValue,
+        )
+
+        if isinstance(prompt, StringPromptValue):
+            return StringPromptValue(
+                text=redact_text(prompt.text, entities, strategy, mask_char, mapping)
+            )
+
+        # Like _convert_to_lakera_guard_input, the pii endpoint only gets the last
+        # user message, so that's the message the entities refer to.
+        messages = list(
+            prompt.to_messages() if isinstance(prompt, PromptValue) else prompt
+        )
+        for index in reversed(range(len(messages))):
+            message = messages[index]
+            if isinstance(message, HumanMessage) and isinstance(message.content, str):
+                messages[index] = message.copy(
+                    update={
+                        "content": redact_text(
+                            message.content, entities, strategy, mask_char, mapping
+                        )
+                    }
+                )
+                break
+
+        if isinstance(prompt, PromptValue):
+            return ChatPromptValue(messages=messages)
+        return messages
+
+    def redact_with_mapping(
+        self,
+        prompt: GuardInput,
+        strategy: RedactionStrategy = "token",
+        mask_char: str = "X",
+        mapping: Optional[Dict[str, str]] = None,
+    ) -> Tuple[GuardInput, Dict[str, str]]:
+        """
+        Redacts the PII that the pii endpoint detects in the input and returns the
+        tokens of the "token" strategy together with the values they replace, so
+        that restore can put the values back into e.g. the response of an LLM.
+
+        Args:
+            prompt: input to redact, a string, a list of messages or a PromptValue
+            strategy: how to replace the entities, see redact
+            mask_char: character used by the "mask" strategy
+            mapping: tokens from earlier redactions to reuse for equal values
+        Returns:
+            the redacted input in the same format as prompt and the tokens with the
+            values they replace
+        """
+        mapping = {} if mapping is None else mapping
+        lakera_guard_response = self._detect_with_endpoint(
+            prompt, self._get_pii_endpoint()
+        )
+        return (
+            self._apply_redaction(
+                prompt, lakera_guard_response, strategy, mask_char, mapping
+            ),
+            mapping,
+        )
+
+    def redact(
+        self,
+        prompt: GuardInput,
+        strategy: RedactionStrategy = "mask",
+        mask_char: str = "X",
+    ) -> GuardInput:
+        """
+        Redacts the PII that the pii endpoint detects in the input instead of
+        raising an error or a warning. A list of messages or a PromptValue gets
+        its last user message redacted, which is the message the pii endpoint
+        checks.
+
+        Args:
+            prompt: input to redact, a string, a list of messages or a PromptValue
+            strategy: "mask" replaces every character of an entity with mask_char,
+                "placeholder" replaces an entity with its type, e.g.
+                [EMAIL_ADDRESS], "token" replaces an entity with a numbered token,
+                e.g. [EMAIL_ADDRESS_1], see also redact_with_mapping
+            mask_char: character used by the "mask" strategy
+        Returns:
+            the redacted input in the same format as prompt
+        """
+        return self.redact_with_mapping(prompt, strategy, mask_char)[0]
+
+    async def aredact_with_mapping(
+        self,
+        prompt: GuardInput,
+        strategy: RedactionStrategy = "token",
+        mask_char: str = "X",
+        mapping: Optional[Dict[str, str]] = None,
+    ) -> Tuple[GuardInput, Dict[str, str]]:
+        """
+        Asynchronous version of redact_with_mapping.
+
+        Args:
+            prompt: input to redact, a string, a list of messages or a PromptValue
+            strategy: how to replace the entities, see redact
+            mask_char: character used by the "mask" strategy
+            mapping: tokens from earlier redactions to reuse for equal values
+        Returns:
+            the redacted input in the same format as prompt and the tokens with the
+            values they replace
+        """
+        mapping = {} if mapping is None else mapping
+        lakera_guard_response = await self._adetect_with_endpoint(
+            prompt, self._get_pii_endpoint()
+        )
+        return (
+            self._apply_redaction(
+                prompt, lakera_guard_response, strategy, mask_char, mapping
+            ),
+            mapping,
+        )
+
+    async def aredact(
+        self,
+        prompt: GuardInput,
+        strategy: RedactionStrategy = "mask",
+        mask_char: str = "X",
+    ) -> GuardInput:
+        """
+        Asynchronous version of redact.
+
+        Args:
+            prompt: input to redact, a string, a list of messages or a PromptValue
+            strategy: how to replace the entities, see redact
+            mask_char: character used by the "mask" strategy
+        Returns:
+            the redacted input in the same format as prompt
+        """
+        return (await self.aredact_with_mapping(prompt, strategy, mask_char))[0]
+
+    @staticmethod
+    def restore(text: str, mapping: Dict[str, str]) -> str:
+        """
+        Puts the values replaced by the "token" redaction strategy back into a text.
+
+        Args:
+            text: text containing tokens, e.g. the response of an LLM to a redacted
+                prompt
+            mapping: the tokens and values returned by redact_with_mapping
+        Returns:
+            the text with the original values
+        """
+        return restore_text(text, mapping)
+
+    def get_redactor(
+        self, strategy: RedactionStrategy = "mask", mask_char: str = "X"
+    ) -> Runnable[GuardInput, GuardInput]:
+        """
+        Creates a Runnable that redacts the PII in its input, to be used as a step
+        before the LLM in a chain.
+
+        Args:
+            strategy: how to replace the entities, see redact
+            mask_char: character used by the "mask" strategy
+        Returns:
+            Runnable that returns its redacted input
+        """
+        from langchain_core.runnables import RunnableLambda
+
+        return RunnableLambda(
+            partial(self.redact, strategy=strategy, mask_char=mask_char),
+            afunc=partial(self.aredact, strategy=strategy, mask_char=mask_char),
+            name="lakera_guard_redactor",
+        )
+
+    async def aclose(self) -> None:
+        """
+        Closes the pooled connections of the transport for the running event loop.
+        Call this before the event loop shuts down to release its connections
+        cleanly.
+
+        Returns:
+            None
+        """
+        await self.transport.aclose()
+
+    def get_guarded_llm(
+        self,
+        type_of_llm: Type[BaseLLMT],
+        output_window: Optional[int] = None,
+        guard_output: bool = False,
+    ) -> Type[BaseLLMT]:
+        """
+        Creates a subclass of type_of_llm where the input to the LLM always gets
+        checked w.r.t. AI security risk specified in self.endpoint. This includes
+        streaming via stream() and astream(), where the input gets checked before the
+        first chunk is released.
+
+        Args:
+            type_of_llm: any type of LangChain's LLMs
+            output_window: if set, the output of streamed generations also gets
+                checked every output_window characters while it streams, each time
+                the new output with the last chunk_overlap characters before it
+            guard_output: if True, the output of the LLM gets checked as well. All
+                generations of a call get checked concurrently, and the complete
+                output of a streamed generation gets checked while the caller reads
+                its last chunks.
+        Returns:
+            Guarded subclass of type_of_llm
+        """
+        from lakera_lcguard import integrations
+
+        return integrations.get_guarded_llm(
+            self, type_of_llm, output_window, guard_output
+        )
+
+    def get_guarded_chat_llm(
+        self,
+        type_of_chat_llm: Type[BaseChatModelT],
+        output_window: Optional[int] = None,
+        guard_output: bool = False,
+    ) -> Type[BaseChatModelT]:
+        """
+        Creates a subclass of type_of_chat_llm in which the input to the ChatLLM always
+          gets checked w.r.t. AI security risk specified in self.endpoint. This
+          includes streaming via stream() and astream(), where the input gets checked
+          before the first chunk is released.
+
+        Args:
+            type_of_llm: any type of LangChain's ChatLLMs
+            output_window: if set, the output of streamed generations also gets
+                checked every output_window characters while it streams, each time
+                the new output with the last chunk_overlap characters before it
+            guard_output: if True, the output of the ChatLLM, including the
+                arguments of its tool calls, gets checked as well. All generations
+                of a call get checked concurrently, and the complete output of a
+                streamed generation gets checked while the caller reads its last
+                chunks.
+        Returns:
+            Guarded subclass of type_of_llm
+        """
+        from lakera_lcguard import integrations
+
+        return integrations.get_guarded_chat_llm(
+            self, type_of_chat_llm, output_window, guard_output
+        )
+
+    def get_guarded_agent_executor(self) -> Type[AgentExecutor]:
+        """
+        Creates a subclass of the AgentExecutor in which the input to the LLM that the
+        AgentExecutor is initialized with gets checked w.r.t. AI security risk specified
+        in self.endpoint.
+
+        Returns:
+            Guarded AgentExecutor subclass
+        """
+        from lakera_lcguard import integrations
+
+        return integrations.get_guarded_agent_executor(self)
+
+    def get_guarded_tool(self, tool: BaseToolT) -> BaseToolT:
+        """
+        Returns a copy of tool whose observations get checked w.r.t. AI security
+        risk specified in self.endpoint as soon as the tool produces them, before
+        they get back to the agent. Parallel tool calls of one agent step, e.g. from
+        an async AgentExecutor or a LangGraph ToolNode, get checked concurrently,
+        and a guarded AgentExecutor doesn't check them a second time.
+
+        Args:
+            tool: any LangChain tool
+        Returns:
+            Guarded copy of tool
+        """
+        if getattr(tool, "_lakera_guard", None) is self:
+            return tool
+        from lakera_lcguard import integrations
+
+        guarded_tool = copy.copy(tool)
+        # The copy keeps all fields (name, schema, function) of tool
+        object.__setattr__(
+            guarded_tool,
+            "__class__",
+            integrations.get_guarded_tool_type(self, type(tool)),
+        )
+        return guarded_tool
+
+    def guard_tools(self, tools: Sequence[BaseToolT]) -> List[BaseToolT]:
+        """
+        Returns guarded copies of several tools, see get_guarded_tool.
+
+        Args:
+            tools: any LangChain tools
+        Returns:
+            Guarded copies of tools
+        """
+        return [self.get_guarded_tool(tool) for tool in tools]
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_SECONDS_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+DEFAULT_BYTES_BUCKETS = (
+    256,
+    1024,
+    4096,
+    16384,
+    65536,
+    262144,
+    1048576,
+    4194304,
+)
+
+
+class MetricsSink(ABC):
+    """
+    Receives the metrics of LakeraLCGuard, e.g. to export them to a monitoring
+    system. Counters are named *_total, histograms of durations *_seconds and
+    histograms of payload sizes *_bytes. Subclasses need to be thread-safe.
+    """
+
+    @abstractmethod
+    def increment(
+        self, name: str, labels: Mapping[str, str], value: float = 1.0
+    ) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name: name of the counter
+            labels: labels of the counter, e.g. the endpoint
+            value: amount to increment the counter by
+        Returns:
+            None
+        """
+
+    @abstractmethod
+    def observe(self, name: str, labels: Mapping[str, str], value: float) -> None:
+        """
+        Adds an observation to a histogram.
+
+        Args:
+            name: name of the histogram
+            labels: labels of the histogram, e.g. the endpoint
+            value: the observed value
+        Returns:
+            None
+        """
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = list(buckets)
+        # The last count is for observations above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class InMemoryMetrics(MetricsSink):
+    def __init__(self, buckets: Optional[Mapping[str, Sequence[float]]] = None) -> None:
+        """
+        Keeps counters and histograms in memory, e.g. for tests, benchmarks or to
+        be read by your own exporter.
+
+        Args:
+            buckets: upper bounds of the buckets of histograms by name. Defaults
+                to buckets from 1ms to 10s for *_seconds histograms and from 256B
+                to 4MiB for all others
+        Returns:
+            None
+        """
+        self.buckets = dict(buckets or {})
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Mapping[str, str]) -> Tuple[str, Labels]:
+        return name, tuple(sorted(labels.items()))
+
+    def _get_buckets(self, name: str) -> Sequence[float]:
+        if name in self.buckets:
+            return self.buckets[name]
+        if name.endswith("_seconds"):
+            return DEFAULT_SECONDS_BUCKETS
+        return DEFAULT_BYTES_BUCKETS
+
+    def increment(
+        self, name: str, labels: Mapping[str, str], value: float = 1.0
+    ) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Mapping[str, str], value: float) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self._get_buckets(name))
+            histogram.observe(value)
+
+    def get_counter(self, name: str, **labels: str) -> float:
+        """
+        Returns the value of a counter, summed over the labels that aren't given.
+
+        Args:
+            name: name of the counter
+            labels: labels to filter by, e.g. endpoint="pii"
+        Returns:
+            the value of the counter
+        """
+        with self._lock:
+            return sum(
+                value
+                for (counter_name, counter_labels), value in self._counters.items()
+                if counter_name == name
+                and labels.items() <= dict(counter_labels).items()
+            )
+
+    def get_histogram(self, name: str, **labels: str) -> Dict[str, float]:
+        """
+        Returns the number and the sum of the observations of a histogram, summed
+        over the labels that aren't given.
+
+        Args:
+            name: name of the histogram
+            labels: labels to filter by, e.g. endpoint="pii"
+        Returns:
+            dict with the count and sum of the observations
+        """
+        count, total = 0, 0.0
+        with self._lock:
+            for key, histogram in self._histograms.items():
+                histogram_name, histogram_labels = key
+                if (
+                    histogram_name == name
+                    and labels.items() <= dict(histogram_labels).items()
+                ):
+                    count += histogram.count
+                    total += histogram.sum
+        return {"count": count, "sum": total}
+
+    def clear(self) -> None:
+        """
+        Resets all counters and histograms.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in labels + extra
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class PrometheusMetrics(InMemoryMetrics):
+    def __init__(
+        self,
+        namespace: str = "lakera_lcguard",
+        buckets: Optional[Mapping[str, Sequence[float]]] = None,
+    ) -> None:
+        """
+        Keeps counters and histograms in memory and renders them in Prometheus' text
+        exposition format, e.g. to serve them on a /metrics endpoint.
+
+        Args:
+            namespace: prefix of the metric names
+            buckets: upper bounds of the buckets of histograms by name, see
+                InMemoryMetrics
+        Returns:
+            None
+        """
+        super().__init__(buckets)
+        self.namespace = namespace
+
+    def render(self) -> str:
+        """
+        Renders all counters and histograms in Prometheus' text exposition format.
+
+        Returns:
+            the metrics as text
+        """
+        prefix = f"{self.namespace}_" if self.namespace else ""
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+            previous_name = None
+            for (name, labels), value in counters:
+                if name != previous_name:
+                    lines.append(f"# TYPE {prefix}{name} counter")
+                    previous_name = name
+                lines.append(
+                    f"{prefix}{name}{_format_labels(labels)} {_format_value(value)}"
+                )
+
+            previous_name = None
+            for (name, labels), histogram in histograms:
+                if name != previous_name:
+                    lines.append(f"# TYPE {prefix}{name} histogram")
+                    previous_name = name
+                cumulative = 0
+                bounds = [_format_value(bound) for bound in histogram.buckets]
+                for bound, count in zip(bounds + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{prefix}{name}_bucket"
+                        f"{_format_labels(labels, (('le', bound),))} {cumulative}"
+                    )
+                lines.append(
+                    f"{prefix}{name}_sum{_format_labels(labels)} "
+                    f"{_format_value(histogram.sum)}"
+                )
+                lines.append(
+                    f"{prefix}{name}_count{_format_labels(labels)} {histogram.count}"
+                )
+
+        return "\n".join(lines) + "\n"
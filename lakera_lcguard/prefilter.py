@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections import deque
+from typing import Any, Collection, Dict, Iterable, List, Literal, Optional, Tuple
+
+PreFilterDecision = Literal["allow", "deny"]
+
+_WHITESPACE = re.compile(r"\s+")
+# Characters besides digits and whitespace that numeric inputs can contain
+_NUMERIC_SYMBOLS = frozenset(".,:;+-*/%()=<>$€£")
+
+
+def _is_numeric(text: str) -> bool:
+    """
+    Returns whether a text only consists of numbers, e.g. "42" or "3.50 + 12%". A
+    single pass over the text, so that long inputs can't make it backtrack.
+
+    Args:
+        text: the text to check
+    Returns:
+        True if the text contains a digit and otherwise only whitespace and
+        arithmetic symbols
+    """
+    has_digit = False
+    for char in set(text):
+        if char.isdecimal():
+            has_digit = True
+        elif not char.isspace() and char not in _NUMERIC_SYMBOLS:
+            return False
+    return has_digit
+
+
+def _normalize(text: str) -> str:
+    """
+    Normalizes a text for signature matching, so that changes in case and
+    whitespace don't hide a known attack string.
+
+    Args:
+        text: the text to normalize
+    Returns:
+        the case-folded text with runs of whitespace replaced by a single space
+    """
+    return _WHITESPACE.sub(" ", text.casefold()).strip()
+
+
+class _SignatureMatcher:
+    def __init__(self, signatures: Iterable[str]) -> None:
+        """
+        Aho-Corasick automaton that finds any of the signatures in a text in a
+        single pass over the text, however many signatures there are.
+
+        Args:
+            signatures: the (normalized) strings to find
+        Returns:
+            None
+        """
+        # State 0 is the root, every state maps characters to the next state
+        self._transitions: List[Dict[str, int]] = [{}]
+        # Index of a signature that ends in the state, -1 if none does
+        self._outputs: List[int] = [-1]
+        self.signatures = [signature for signature in signatures if signature]
+
+        for index, signature in enumerate(self.signatures):
+            state = 0
+            for char in signature:
+                next_state = self._transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self._transitions)
+                    self._transitions[state][char] = next_state
+                    self._transitions.append({})
+                    self._outputs.append(-1)
+                state = next_state
+            if self._outputs[state] == -1:
+                self._outputs[state] = index
+
+        self._fail = [0] * len(self._transitions)
+        queue = deque(self._transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._transitions[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._transitions[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._transitions[fail].get(char, 0)
+                if self._outputs[next_state] == -1:
+                    # A signature that is a suffix of this state's prefix
+                    self._outputs[next_state] = self._outputs[self._fail[next_state]]
+
+    def find(self, text: str) -> Optional[str]:
+        """
+        Returns the first signature that occurs in the text.
+
+        Args:
+            text: the (normalized) text to search
+        Returns:
+            the signature, None if the text contains none of the signatures
+        """
+        transitions, fail, outputs = self._transitions, self._fail, self._outputs
+        state = 0
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            if outputs[state] != -1:
+                return self.signatures[outputs[state]]
+        return None
+
+
+class PreFilter:
+    def __init__(
+        self,
+        deny_signatures: Iterable[str] = (),
+        allow_empty: bool = True,
+        allow_numeric: bool = True,
+        allow_texts: Iterable[str] = (),
+        trusted_roles: Collection[str] = ("system",),
+        trusted_sources: Collection[str] = (),
+        source_key: str = "source",
+        endpoints: Collection[str] = ("prompt_injection",),
+    ) -> None:
+        """
+        Local checks in front of the Lakera Guard API that decide trivially benign
+        and known-bad inputs without a network round-trip, so that these inputs
+        never leave the process.
+
+        Every decision is counted per decision and rule (see get_counts and the
+        prefiltered_total metric of LakeraLCGuard), so that the short-circuits can
+        be audited.
+
+        Args:
+            deny_signatures: known attack strings, e.g. published jailbreaks. Inputs
+                that contain one of them (ignoring case and whitespace) are flagged
+                without calling Lakera Guard.
+            allow_empty: whether to let empty and whitespace-only inputs through
+            allow_numeric: whether to let inputs through that only consist of
+                numbers, e.g. "42" or "3.50 + 12%"
+            allow_texts: known benign inputs, e.g. greetings like "Hello" or
+                "Thanks!". Single-message inputs that are equal to one of them
+                (ignoring case and whitespace) are let through.
+            trusted_roles: roles of messages that never get sent to Lakera Guard,
+                by default the system prompt, which the application controls
+            trusted_sources: sources of messages that never get sent to Lakera
+                Guard, with the source of a message in its additional_kwargs
+            source_key: key of the source of a message in its additional_kwargs
+            endpoints: endpoints the pre-filter decides for, the other endpoints
+                get every input. Numbers and short texts can be PII, so by
+                default only prompt_injection is pre-filtered.
+        Returns:
+            None
+        """
+        self.allow_empty = allow_empty
+        self.allow_numeric = allow_numeric
+        self.allow_texts = frozenset(_normalize(text) for text in allow_texts)
+        self.trusted_roles = frozenset(trusted_roles)
+        self.trusted_sources = frozenset(trusted_sources)
+        self.source_key = source_key
+        self.endpoints = frozenset(endpoints)
+        self._matcher = _SignatureMatcher(
+            dict.fromkeys(_normalize(signature) for signature in deny_signatures)
+        )
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def applies_to(self, endpoint: str) -> bool:
+        """
+        Returns whether the pre-filter decides for an endpoint.
+
+        Args:
+            endpoint: name of the endpoint, e.g. prompt_injection
+        Returns:
+            True if the pre-filter decides for the endpoint
+        """
+        return endpoint in self.endpoints
+
+    def is_trusted(self, role: str, message: Any) -> bool:
+        """
+        Returns whether a message of a conversation comes from a trusted source
+        and therefore doesn't need to be checked.
+
+        Args:
+            role: the Lakera Guard role of the message
+            message: a message of a LangChain ChatLLM input
+        Returns:
+            True if the message is trusted
+        """
+        if role in self.trusted_roles:
+            return True
+        if not self.trusted_sources:
+            return False
+        additional_kwargs = getattr(message, "additional_kwargs", None) or {}
+        return additional_kwargs.get(self.source_key) in self.trusted_sources
+
+    def _get_allow_rule(self, text: str, single: bool) -> Optional[str]:
+        """
+        Returns the allow rule that lets a text through.
+
+        Args:
+            text: the text to check
+            single: whether the text is the whole input, as opposed to one of the
+                messages of a conversation
+        Returns:
+            the name of the rule, None if no rule lets the text through
+        """
+        if not text.strip():
+            return "empty" if self.allow_empty else None
+        if self.allow_numeric and _is_numeric(text):
+            return "numeric"
+        # Benign messages can add up to an attack across a conversation
+        if single and self.allow_texts and _normalize(text) in self.allow_texts:
+            return "allow_text"
+        return None
+
+    def check(self, texts: List[str]) -> Optional[Tuple[PreFilterDecision, str]]:
+        """
+        Decides an input locally if possible and counts the decision.
+
+        Args:
+            texts: the texts of the input, e.g. the contents of its messages
+        Returns:
+            "deny" and the rule if the input contains a known attack string,
+            "allow" and the rule(s) if every text is trivially benign, None if
+            Lakera Guard needs to decide
+        """
+        decision: Optional[Tuple[PreFilterDecision, str]] = None
+        if self._matcher.signatures and any(
+            self._matcher.find(_normalize(text)) is not None for text in texts
+        ):
+            decision = ("deny", "signature")
+        else:
+            rules = [self._get_allow_rule(text, len(texts) == 1) for text in texts]
+            if texts and None not in rules:
+                decision = ("allow", "+".join(sorted(set(map(str, rules)))))
+        if decision is not None:
+            self.count(*decision)
+        return decision
+
+    def count(self, decision: PreFilterDecision, rule: str) -> None:
+        """
+        Counts a decision of the pre-filter.
+
+        Args:
+            decision: "allow" or "deny"
+            rule: the rule that decided
+        Returns:
+            None
+        """
+        with self._lock:
+            self._counts[decision, rule] = self._counts.get((decision, rule), 0) + 1
+
+    def get_counts(self) -> Dict[Tuple[str, str], int]:
+        """
+        Returns how often the pre-filter decided, per decision and rule.
+
+        Returns:
+            the number of decisions by (decision, rule), e.g. ("allow", "numeric")
+        """
+        with self._lock:
+            return dict(self._counts)
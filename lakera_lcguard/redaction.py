@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Literal, Optional
+
+RedactionStrategy = Literal["mask", "placeholder", "token"]
+
+
+def redact_text(
+    text: str,
+    entities: List[dict],
+    strategy: RedactionStrategy = "mask",
+    mask_char: str = "X",
+    mapping: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Replaces the spans of the detected entities in text, building the redacted text
+    in a single pass.
+
+    Args:
+        text: the text the entities were detected in
+        entities: entities with start and end offsets into text and an entity_type,
+            as in the payload of Lakera Guard's pii endpoint. Overlapping
+            entities get redacted as one span.
+        strategy: "mask" replaces every character of an entity with mask_char,
+            "placeholder" replaces an entity with its type, e.g. [EMAIL_ADDRESS],
+            "token" replaces an entity with a numbered token, e.g. [EMAIL_ADDRESS_1],
+            that can be reversed with restore_text
+        mask_char: character used by the "mask" strategy
+        mapping: tokens and the values they replace, extended with the tokens of
+            the "token" strategy, so that equal values get the same token
+    Returns:
+        the redacted text
+    """
+    if strategy not in ("mask", "placeholder", "token"):
+        raise ValueError(f"Unknown redaction strategy {strategy!r}.")
+    if mapping is None:
+        mapping = {}
+    tokens = {value: token for token, value in mapping.items()}
+
+    # Overlapping entities are merged into one span of the type of the first one
+    spans: List[List] = []
+    for entity in sorted(entities, key=lambda entity: entity["start"]):
+        if entity["end"] <= entity["start"]:
+            continue
+        if spans and entity["start"] < spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], entity["end"])
+        else:
+            spans.append(
+                [entity["start"], entity["end"], entity.get("entity_type", "PII")]
+            )
+
+    pieces: List[str] = []
+    position = 0
+    for start, end, entity_type in spans:
+        pieces.append(text[position:start])
+        if strategy == "mask":
+            pieces.append(mask_char * (end - start))
+        elif strategy == "placeholder":
+            pieces.append(f"[{entity_type}]")
+        else:
+            value = text[start:end]
+            token = tokens.get(value)
+            if token is None:
+                number = 1
+                while f"[{entity_type}_{number}]" in mapping:
+                    number += 1
+                token = f"[{entity_type}_{number}]"
+                tokens[value] = token
+                mapping[token] = value
+            pieces.append(token)
+        position = end
+    pieces.append(text[position:])
+
+    return "".join(pieces)
+
+
+def restore_text(text: str, mapping: Dict[str, str]) -> str:
+    """
+    Replaces the tokens of the "token" redaction strategy with the values they
+    replaced, in a single pass.
+
+    Args:
+        text: text containing tokens, e.g. the response of an LLM to a redacted
+            prompt
+        mapping: tokens and the values they replace
+    Returns:
+        the text with the original values
+    """
+    if not mapping:
+        return text
+    pattern = "|".join(
+        re.escape(token) for token in sorted(mapping, key=len, reverse=True)
+    )
+    return re.sub(pattern, lambda match: mapping[match.group()], text)
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import get_config_list
+
+from lakera_lcguard.lakera_lcguard import GuardInput, LakeraLCGuard
+
+
+class LakeraGuardRunnable(Runnable[GuardInput, GuardInput]):
+    def __init__(
+        self, lakera_guard: LakeraLCGuard, max_concurrency: Optional[int] = None
+    ) -> None:
+        """
+        Runnable that checks its input w.r.t. the AI security risk specified in the
+        endpoint of lakera_guard and passes it through unchanged, e.g. to guard a
+        step of an LCEL chain with guard | llm.
+
+        Unlike a RunnableLambda around detect, it checks the inputs of batch and
+        abatch concurrently, does not block the event loop in ainvoke, abatch and
+        astream and reports each check to the chain's callbacks.
+
+        Args:
+            lakera_guard: the LakeraLCGuard to check the inputs with
+            max_concurrency: maximum number of inputs of a batch that get checked at
+                the same time, defaults to the max_concurrency of the run's config
+                and then to the max_concurrency of lakera_guard
+        Returns:
+            None
+        """
+        self.lakera_guard = lakera_guard
+        self.max_concurrency = max_concurrency
+
+    def _get_max_concurrency(self, config: RunnableConfig) -> int:
+        """
+        Returns how many inputs of a batch get checked at the same time.
+
+        Args:
+            config: config of the batch
+        Returns:
+            maximum number of concurrent checks
+        """
+        return (
+            self.max_concurrency
+            or config.get("max_concurrency")
+            or self.lakera_guard.max_concurrency
+        )
+
+    def invoke(
+        self, input: GuardInput, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> GuardInput:
+        return self._call_with_config(self.lakera_guard.detect, input, config)
+
+    async def ainvoke(
+        self, input: GuardInput, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> GuardInput:
+        return await self._acall_with_config(self.lakera_guard.adetect, input, config)
+
+    def batch(
+        self,
+        inputs: List[GuardInput],
+        config: Optional[Union[RunnableConfig, List[RunnableConfig]]] = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Optional[Any],
+    ) -> List[GuardInput]:
+        if not inputs:
+            return []
+
+        max_concurrency = self._get_max_concurrency(
+            get_config_list(config, len(inputs))[0]
+        )
+        return self._batch_with_config(
+            partial(
+                self._detect_batch,
+                max_concurrency=max_concurrency,
+                return_exceptions=return_exceptions,
+            ),
+            inputs,
+            config,
+            return_exceptions=return_exceptions,
+        )
+
+    def _detect_batch(
+        self,
+        inputs: List[GuardInput],
+        max_concurrency: int,
+        return_exceptions: bool,
+    ) -> List[Union[Exception, GuardInput]]:
+        """
+        Checks the inputs of a batch concurrently, at most max_concurrency at a
+        time. Unless return_exceptions is True, raises as soon as an input is
+        flagged and does not check the remaining inputs.
+
+        Args:
+            inputs: inputs to check regarding AI security risk
+            max_concurrency: maximum number of concurrent checks
+            return_exceptions: whether to return the error of a flagged input
+                instead of raising it
+        Returns:
+            the inputs unchanged or, if return_exceptions is True, the errors of the
+            flagged inputs
+        """
+        lakera_guard = self.lakera_guard
+        if lakera_guard.mode == "audit":
+            # Only queues the checks, like invoke
+            return list(lakera_guard.detect_batch(inputs))
+
+        outputs: List[Union[Exception, GuardInput]] = list(inputs)
+        responses: Dict[int, dict] = {}
+        pending = iter(enumerate(inputs))
+        running: Dict[Future, int] = {}
+        try:
+            while True:
+                for index, prompt in pending:
+                    running[
+                        lakera_guard._submit(
+                            lakera_guard._executor,
+                            lakera_guard._detect_for_batch,
+                            prompt,
+                        )
+                    ] = index
+                    if len(running) >= max_concurrency:
+                        break
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    try:
+                        responses[index] = future.result()
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise
+                        outputs[index] = e
+        finally:
+            for future in running:
+                future.cancel()
+
+        for index in sorted(responses):
+            lakera_guard._warn_if_flagged(responses[index])
+
+        return outputs
+
+    async def abatch(
+        self,
+        inputs: List[GuardInput],
+        config: Optional[Union[RunnableConfig, List[RunnableConfig]]] = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Optional[Any],
+    ) -> List[GuardInput]:
+        if not inputs:
+            return []
+
+        max_concurrency = self._get_max_concurrency(
+            get_config_list(config, len(inputs))[0]
+        )
+        return await self._abatch_with_config(
+            partial(
+                self._adetect_batch,
+                max_concurrency=max_concurrency,
+                return_exceptions=return_exceptions,
+            ),
+            inputs,
+            config,
+            return_exceptions=return_exceptions,
+        )
+
+    async def _adetect_batch(
+        self,
+        inputs: List[GuardInput],
+        max_concurrency: int,
+        return_exceptions: bool,
+    ) -> List[Union[Exception, GuardInput]]:
+        """
+        Asynchronous version of _detect_batch.
+
+        Args:
+            inputs: inputs to check regarding AI security risk
+            max_concurrency: maximum number of concurrent checks
+            return_exceptions: whether to return the error of a flagged input
+                instead of raising it
+        Returns:
+            the inputs unchanged or, if return_exceptions is True, the errors of the
+            flagged inputs
+        """
+        if self.lakera_guard.mode == "audit":
+            return list(await self.lakera_guard.adetect_batch(inputs))
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        tasks = [
+            asyncio.ensure_future(
+                self.lakera_guard._adetect_for_batch(prompt, semaphore)
+            )
+            for prompt in inputs
+        ]
+        try:
+            responses = await asyncio.gather(
+                *tasks, return_exceptions=return_exceptions
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        outputs: List[Union[Exception, GuardInput]] = []
+        for prompt, response in zip(inputs, responses):
+            if isinstance(response, Exception):
+                outputs.append(response)
+            elif isinstance(response, BaseException):
+                raise response
+            else:
+                self.lakera_guard._warn_if_flagged(response)
+                outputs.append(prompt)
+        return outputs
+
+    def _collect_and_detect(self, input: Iterator[GuardInput]) -> Iterator[GuardInput]:
+        """
+        Collects the streamed input, checks it once it is complete and only then
+        passes it on, so that no part of a flagged input reaches the next step.
+
+        Args:
+            input: chunks of the input
+        Returns:
+            the complete input
+        """
+        final: Any = None
+        for chunk in input:
+            final = chunk if final is None else final + chunk
+        if final is not None:
+            yield self.lakera_guard.detect(final)
+
+    async def _acollect_and_detect(
+        self, input: AsyncIterator[GuardInput]
+    ) -> AsyncIterator[GuardInput]:
+        """
+        Asynchronous version of _collect_and_detect.
+
+        Args:
+            input: chunks of the input
+        Returns:
+            the complete input
+        """
+        final: Any = None
+        async for chunk in input:
+            final = chunk if final is None else final + chunk
+        if final is not None:
+            yield await self.lakera_guard.adetect(final)
+
+    def transform(
+        self,
+        input: Iterator[GuardInput],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> Iterator[GuardInput]:
+        yield from self._transform_stream_with_config(
+            input, self._collect_and_detect, config
+        )
+
+    async def atransform(
+        self,
+        input: AsyncIterator[GuardInput],
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GuardInput]:
+        async for output in self._atransform_stream_with_config(
+            input, self._acollect_and_detect, config
+        ):
+            yield output
+
+    def stream(
+        self,
+        input: GuardInput,
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Optional[Any],
+    ) -> Iterator[GuardInput]:
+        yield from self.transform(iter([input]), config)
+
+    async def astream(
+        self,
+        input: GuardInput,
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Optional[Any],
+    ) -> AsyncIterator[GuardInput]:
+        async def input_aiter() -> AsyncIterator[GuardInput]:
+            yield input
+
+        async for output in self.atransform(input_aiter(), config):
+            yield output
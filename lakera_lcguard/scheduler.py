@@ -0,0 +1,442 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from lakera_lcguard.metrics import MetricsSink
+
+# Longest an asynchronous caller sleeps before it looks at the queue again, as it
+# can't be woken up by the callers ahead of it
+_ASYNC_POLL_SECONDS = 0.05
+
+# Rate-limit reset headers above this value are Unix timestamps, not seconds
+_MIN_TIMESTAMP = 1e9
+
+# Priority and tenant of the requests made in the current context
+_scheduling: ContextVar[Tuple[Optional[str], Optional[str]]] = ContextVar(
+    "_scheduling", default=(None, None)
+)
+
+# (rank of the priority, sequence number, tenant) of a caller waiting for a token
+_Waiter = Tuple[int, int, Optional[str]]
+
+
+class SchedulerTimeoutError(RuntimeError):
+    """
+    Raised if a request waited longer than the maximum wait of its priority for
+    the rate limit.
+    """
+
+
+@contextmanager
+def scheduling(
+    priority: Optional[str] = None, tenant: Optional[str] = None
+) -> Iterator[None]:
+    """
+    Sets the priority and the tenant of the Lakera Guard requests made in the
+    context, e.g. to let a RAG-ingestion job queue behind interactive chat checks.
+    Contexts can be nested, a context that leaves the priority or the tenant out
+    keeps the one of the enclosing context.
+
+    Args:
+        priority: one of the priorities of the RateLimitScheduler
+        tenant: tenant whose quota the requests count against
+    Returns:
+        None
+    """
+    outer_priority, outer_tenant = _scheduling.get()
+    token = _scheduling.set((priority or outer_priority, tenant or outer_tenant))
+    try:
+        yield
+    finally:
+        _scheduling.reset(token)
+
+
+def get_scheduling() -> Tuple[Optional[str], Optional[str]]:
+    """
+    Returns the priority and the tenant set by the enclosing scheduling context.
+
+    Returns:
+        the priority and the tenant, None for each that isn't set
+    """
+    return _scheduling.get()
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        """
+        Bucket that fills up with rate tokens per second up to burst tokens.
+
+        Args:
+            rate: number of tokens added per second
+            burst: maximum number of tokens in the bucket
+        Returns:
+            None
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.perf_counter()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until_token(self) -> float:
+        """
+        Returns how long it takes until the bucket holds a whole token, as of its
+        last refill.
+
+        Returns:
+            seconds until the next token, 0 if there is one
+        """
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+
+class RateLimitScheduler:
+    def __init__(
+        self,
+        rate: float = 50.0,
+        burst: Optional[int] = None,
+        min_rate: float = 1.0,
+        recovery: float = 1.0,
+        decrease_factor: float = 0.5,
+        tenant_quotas: Optional[Mapping[str, float]] = None,
+        priorities: Sequence[str] = ("interactive", "default", "batch"),
+        default_priority: str = "default",
+        max_wait: Optional[Mapping[str, float]] = None,
+        max_pause: float = 60.0,
+        metrics: Optional[MetricsSink] = None,
+    ) -> None:
+        """
+        Client-side rate limiter of the requests of a LakeraTransport, so that
+        callers sharing an API key queue in order of priority instead of all
+        running into rate-limit (429) responses.
+
+        Every request (and every retry) takes a token from a bucket that refills
+        with rate tokens per second. The bucket learns from the API: a 429
+        response cuts the rate by decrease_factor (down to min_rate), after which
+        it grows back by recovery requests per second every second, and a
+        Retry-After header or an exhausted RateLimit-Remaining (or
+        X-RateLimit-Remaining) header with its reset time pauses all requests
+        until the API accepts requests again.
+
+        Waiting requests get the next token in order of priority and, within a
+        priority, in order of arrival, so interactive checks go ahead of batch
+        checks, which absorb the backpressure. Requests of a tenant with a quota
+        also need a token of the tenant's own bucket, so one tenant can't use up
+        the shared rate; a tenant over its quota doesn't hold up the others.
+
+        Set the priority and the tenant of requests with the scheduling context
+        manager. The time requests spend waiting is reported as queue_seconds,
+        separately from network_seconds.
+
+        Args:
+            rate: maximum number of requests per second, e.g. the rate limit of
+                the API key
+            burst: maximum number of requests sent at once after a quiet period,
+                defaults to rate
+            min_rate: the rate never drops below min_rate requests per second
+            recovery: requests per second the rate grows by every second until
+                it is back at rate
+            decrease_factor: factor the rate gets multiplied with on a 429
+                response
+            tenant_quotas: maximum number of requests per second of a tenant
+            priorities: names of the priorities, from highest to lowest
+            default_priority: priority of requests made outside of a scheduling
+                context
+            max_wait: maximum number of seconds a request of a priority waits
+                for a token before a SchedulerTimeoutError gets raised, e.g.
+                {"interactive": 2.0}, priorities that are left out wait as long as
+                it takes
+            max_pause: maximum number of seconds rate-limit headers can pause the
+                requests for
+            metrics: sink for the histogram of the time requests waited by
+                priority and the counters of 429 responses and timed out requests
+        Returns:
+            None
+        """
+        if rate <= 0 or not 0 < min_rate <= rate or not 0 < decrease_factor < 1:
+            raise ValueError(
+                f"rate and min_rate must be positive with min_rate at most rate and "
+                f"decrease_factor must be between 0 and 1, got rate={rate}, "
+                f"min_rate={min_rate} and decrease_factor={decrease_factor}."
+            )
+        if default_priority not in priorities:
+            raise ValueError(
+                f"default_priority must be one of {list(priorities)}, got "
+                f"{default_priority!r}."
+            )
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.decrease_factor = decrease_factor
+        self.priorities = list(priorities)
+        self.default_priority = default_priority
+        self.max_wait = dict(max_wait or {})
+        self.max_pause = max_pause
+        self.metrics = metrics
+        self.throttled = 0
+
+        self._bucket = _TokenBucket(rate, burst or max(1.0, rate))
+        self._tenant_buckets: Dict[Optional[str], _TokenBucket] = {
+            tenant: _TokenBucket(quota, max(1.0, quota))
+            for tenant, quota in (tenant_quotas or {}).items()
+        }
+        # Sorted by priority and arrival, the next token goes to the first waiter
+        # whose tenant has a token
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def rate(self) -> float:
+        """
+        The number of requests per second the scheduler currently lets through.
+        """
+        with self._condition:
+            self._refill(time.perf_counter())
+            return self._bucket.rate
+
+    def _refill(self, now: float) -> None:
+        """
+        Refills the buckets and lets the rate recover. Must be called with
+        self._condition held.
+
+        Args:
+            now: the current time.perf_counter()
+        Returns:
+            None
+        """
+        if self._bucket.rate < self.max_rate:
+            self._bucket.rate = min(
+                self.max_rate,
+                self._bucket.rate + self.recovery * (now - self._bucket.updated),
+            )
+        self._bucket.refill(now)
+        for tenant_bucket in self._tenant_buckets.values():
+            tenant_bucket.refill(now)
+
+    def _try_acquire(self, waiter: _Waiter, now: float) -> float:
+        """
+        Gives a token to a waiter if it is its turn. Must be called with
+        self._condition held.
+
+        Args:
+            waiter: the waiter that wants a token
+            now: the current time.perf_counter()
+        Returns:
+            0 if the waiter got a token, else the number of seconds to wait before
+            trying again
+        """
+        self._refill(now)
+        wait = max(self._paused_until - now, self._bucket.time_until_token())
+        for candidate in self._waiters:
+            tenant_bucket = self._tenant_buckets.get(candidate[2])
+            if tenant_bucket is not None and tenant_bucket.tokens < 1:
+                if candidate is waiter:
+                    return max(wait, tenant_bucket.time_until_token())
+                continue
+            if candidate is not waiter:
+                # A waiter ahead gets the next token
+                return max(wait, 1.0 / self._bucket.rate)
+            break
+
+        if wait > 0:
+            return wait
+        self._bucket.tokens -= 1
+        tenant_bucket = self._tenant_buckets.get(waiter[2])
+        if tenant_bucket is not None:
+            tenant_bucket.tokens -= 1
+        self._waiters.remove(waiter)
+        self._condition.notify_all()
+        return 0.0
+
+    def _enqueue(self, priority: Optional[str], tenant: Optional[str]) -> _Waiter:
+        """
+        Adds a waiter to the queue. Must be called with self._condition held.
+
+        Args:
+            priority: priority of the request, None for the default priority
+            tenant: tenant of the request
+        Returns:
+            the waiter
+        """
+        priority = priority or self.default_priority
+        if priority not in self.priorities:
+            raise ValueError(
+                f"priority must be one of {self.priorities}, got {priority!r}."
+            )
+        waiter = (self.priorities.index(priority), next(self._sequence), tenant)
+        bisect.insort(self._waiters, waiter)
+        return waiter
+
+    def _get_wait(self, waiter: _Waiter, start: float) -> float:
+        """
+        Gives a token to a waiter if it is its turn and enforces the maximum wait
+        of its priority. Must be called with self._condition held.
+
+        Args:
+            waiter: the waiter that wants a token
+            start: the time.perf_counter() the waiter arrived at
+        Returns:
+            0 if the waiter got a token, else the number of seconds to wait before
+            trying again
+        """
+        now = time.perf_counter()
+        wait = self._try_acquire(waiter, now)
+        priority = self.priorities[waiter[0]]
+        max_wait = self.max_wait.get(priority)
+        if wait and max_wait is not None:
+            if now - start >= max_wait:
+                if self.metrics is not None:
+                    self.metrics.increment(
+                        "scheduler_timeouts_total", {"priority": priority}
+                    )
+                raise SchedulerTimeoutError(
+                    f"A {priority} request waited more than {max_wait} s for the "
+                    f"Lakera Guard rate limit."
+                )
+            wait = min(wait, start + max_wait - now)
+        return wait
+
+    def _leave(self, waiter: _Waiter) -> None:
+        """
+        Removes a waiter that gave up, so that it doesn't hold up the waiters
+        behind it. Must be called with self._condition held.
+
+        Args:
+            waiter: the waiter
+        Returns:
+            None
+        """
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            self._condition.notify_all()
+
+    def _record_wait(self, waiter: _Waiter, seconds: float) -> None:
+        if self.metrics is not None:
+            self.metrics.observe(
+                "scheduler_queue_seconds",
+                {"priority": self.priorities[waiter[0]]},
+                seconds,
+            )
+
+    def acquire(
+        self, priority: Optional[str] = None, tenant: Optional[str] = None
+    ) -> float:
+        """
+        Waits until a request may be sent.
+
+        Args:
+            priority: priority of the request, None for the default priority
+            tenant: tenant whose quota the request counts against
+        Returns:
+            the number of seconds the request waited
+        """
+        start = time.perf_counter()
+        with self._condition:
+            waiter = self._enqueue(priority, tenant)
+            try:
+                wait = self._get_wait(waiter, start)
+                while wait:
+                    self._condition.wait(wait)
+                    wait = self._get_wait(waiter, start)
+            except BaseException:
+                self._leave(waiter)
+                raise
+        seconds = time.perf_counter() - start
+        self._record_wait(waiter, seconds)
+        return seconds
+
+    async def aacquire(
+        self, priority: Optional[str] = None, tenant: Optional[str] = None
+    ) -> float:
+        """
+        Asynchronous version of acquire that waits without blocking the event
+        loop.
+
+        Args:
+            priority: priority of the request, None for the default priority
+            tenant: tenant whose quota the request counts against
+        Returns:
+            the number of seconds the request waited
+        """
+        start = time.perf_counter()
+        with self._condition:
+            waiter = self._enqueue(priority, tenant)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._get_wait(waiter, start)
+                if not wait:
+                    break
+                await asyncio.sleep(min(wait, _ASYNC_POLL_SECONDS))
+        except BaseException:
+            with self._condition:
+                self._leave(waiter)
+            raise
+        seconds = time.perf_counter() - start
+        self._record_wait(waiter, seconds)
+        return seconds
+
+    def _get_pause(self, status: int, headers: Mapping[str, str]) -> float:
+        """
+        Returns how long the rate-limit headers of a response ask to pause.
+
+        Args:
+            status: HTTP status code of the response
+            headers: headers of the response
+        Returns:
+            seconds to pause, 0 if the headers don't ask for a pause
+        """
+        pause = 0.0
+        try:
+            if status == 429 and headers.get("Retry-After") is not None:
+                pause = float(headers["Retry-After"])
+            remaining = headers.get("RateLimit-Remaining") or headers.get(
+                "X-RateLimit-Remaining"
+            )
+            reset = headers.get("RateLimit-Reset") or headers.get("X-RateLimit-Reset")
+            if remaining is not None and reset is not None and float(remaining) < 1:
+                seconds = float(reset)
+                if seconds > _MIN_TIMESTAMP:
+                    seconds -= time.time()
+                pause = max(pause, seconds)
+        except ValueError:
+            # Retry-After can also be an HTTP date, then the lowered rate has to do
+            pass
+        return min(self.max_pause, max(0.0, pause))
+
+    def record_response(self, status: int, headers: Mapping[str, str]) -> None:
+        """
+        Learns the rate limit of the API from a response.
+
+        Args:
+            status: HTTP status code of the response
+            headers: headers of the response
+        Returns:
+            None
+        """
+        pause = self._get_pause(status, headers)
+        with self._condition:
+            now = time.perf_counter()
+            if status == 429:
+                self.throttled += 1
+                self._refill(now)
+                self._bucket.rate = max(
+                    self.min_rate, self._bucket.rate * self.decrease_factor
+                )
+                # The API got more requests than it accepts, so start over empty
+                self._bucket.tokens = min(self._bucket.tokens, 0.0)
+                if self.metrics is not None:
+                    self.metrics.increment("scheduler_throttled_total", {})
+            if pause:
+                self._paused_until = max(self._paused_until, now + pause)
@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Collection, Optional, Tuple
+
+from lakera_lcguard.scheduler import RateLimitScheduler, get_scheduling
+
+if TYPE_CHECKING:
+    # requests and aiohttp only get imported once they are used
+    import aiohttp
+    import requests
+
+DEFAULT_BASE_URL = "https://api.lakera.ai"
+
+
+class LakeraGuardServerError(ValueError):
+    """
+    Raised if Lakera Guard still responds with a server error (5xx) after the
+    retries, i.e. if it is unavailable rather than rejecting the request.
+    """
+
+
+@dataclass
+class RequestStats:
+    """
+    Statistics of an API request, filled in by LakeraTransport.post and apost.
+    """
+
+    request_bytes: int = 0
+    response_bytes: int = 0
+    retries: int = 0
+    queue_seconds: float = 0.0
+    network_seconds: float = 0.0
+    parsing_seconds: float = 0.0
+
+
+class LakeraTransport:
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        max_retries: int = 2,
+        backoff_factor: float = 0.25,
+        backoff_max: float = 5.0,
+        retry_statuses: Collection[int] = (429, 500, 502, 503, 504),
+        scheduler: Optional[RateLimitScheduler] = None,
+    ) -> None:
+        """
+        HTTP transport that LakeraLCGuard uses to call the Lakera Guard API. It
+        keeps persistent connections in a pool for synchronous (requests) and
+        asynchronous (aiohttp) calls, bounds every call with timeouts and retries
+        rate-limited (429), failed (5xx) and timed out calls with jittered
+        exponential backoff.
+
+        Args:
+            base_url: URL of the Lakera Guard API, e.g. of a self-hosted Lakera
+                Guard deployment or a local mock server
+            pool_size: maximum number of connections kept open to the API
+            connect_timeout: seconds to wait for a connection to the API
+            read_timeout: seconds to wait for the API to send a response
+            max_retries: maximum number of retries of a failed call, 0 to disable
+            backoff_factor: the n-th retry waits a random time between 0 and
+                backoff_factor * 2 ** n seconds (but at most backoff_max seconds)
+            backoff_max: maximum number of seconds to wait before a retry
+            retry_statuses: HTTP status codes of responses that get retried
+            scheduler: queues the calls (and retries) by priority to stay within
+                the rate limit of the API key, None to send them right away
+        Returns:
+            None
+        """
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.retry_statuses = frozenset(retry_statuses)
+        self.scheduler = scheduler
+
+        # Allows persistent connections (created lazily, only once)
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+
+        # aiohttp sessions are bound to the event loop they were created in, so we
+        # keep one pooled session per running loop (created lazily, once per loop).
+        self._async_sessions: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, aiohttp.ClientSession
+        ] = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        The pooled requests session of synchronous calls, created on first use.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def _get_url(self, endpoint: str) -> str:
+        return f"{self.base_url}/v1/{endpoint}"
+
+    def _get_backoff(self, retry: int, retry_after: Optional[str]) -> float:
+        """
+        Returns how long to wait before a retry.
+
+        Args:
+            retry: number of the retry, starting at 0
+            retry_after: value of the Retry-After header of the failed response
+        Returns:
+            seconds to wait
+        """
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                # Retry-After can also be an HTTP date, fall back to the backoff
+                pass
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_factor * 2**retry)
+        )
+
+    def _is_paced(self, status: int) -> bool:
+        """
+        Returns whether the scheduler paces the retry of a failed response, so
+        that the retry doesn't need to back off itself.
+
+        Args:
+            status: HTTP status code of the failed response
+        Returns:
+            True if the retry waits for the scheduler
+        """
+        return self.scheduler is not None and status == 429
+
+    @staticmethod
+    def _decode_response(status: int, text: str) -> dict:
+        """
+        Decodes the json body of a response of the Lakera Guard API.
+
+        Args:
+            status: HTTP status code of the response
+            text: body of the response
+        Returns:
+            The decoded response body
+        """
+        if status >= 500:
+            raise LakeraGuardServerError(
+                f"Lakera Guard responded with status {status}: {text[:200]!r}"
+            )
+        try:
+            response_body = json.loads(text)
+        except ValueError:
+            raise ValueError(
+                f"Lakera Guard responded with status {status} and a body that is "
+                f"not valid json: {text[:200]!r}"
+            ) from None
+        if not isinstance(response_body, dict):
+            raise ValueError(str(response_body))
+        return response_body
+
+    def post(
+        self,
+        endpoint: str,
+        request_body: dict,
+        api_key: str,
+        stats: Optional[RequestStats] = None,
+    ) -> dict:
+        """
+        Calls a Lakera Guard API endpoint.
+
+        Args:
+            endpoint: name of the endpoint, e.g. prompt_injection
+            request_body: json body of the request
+            api_key: API key for Lakera Guard
+            stats: gets filled in with the sizes, retries and timings of the request
+        Returns:
+            The endpoint's API response as dict
+        """
+        stats = stats or RequestStats()
+        data = json.dumps(request_body).encode()
+        stats.request_bytes = len(data)
+
+        start = time.perf_counter()
+        status, text = self._post_with_retries(endpoint, data, api_key, stats)
+        decoding_start = time.perf_counter()
+        # Time spent waiting for the scheduler is queueing, not network time
+        stats.network_seconds = decoding_start - start - stats.queue_seconds
+        try:
+            return self._decode_response(status, text)
+        finally:
+            stats.parsing_seconds = time.perf_counter() - decoding_start
+
+    def _get_headers(self, api_key: str) -> dict:
+        return {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _post_with_retries(
+        self, endpoint: str, data: bytes, api_key: str, stats: RequestStats
+    ) -> Tuple[int, str]:
+        import requests
+
+        retry = 0
+        while True:
+            if self.scheduler is not None:
+                stats.queue_seconds += self.scheduler.acquire(*get_scheduling())
+            try:
+                response = self.session.post(
+                    self._get_url(endpoint),
+                    data=data,
+                    headers=self._get_headers(api_key),
+                    timeout=(self.connect_timeout, self.read_timeout),
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if retry >= self.max_retries:
+                    raise
+                time.sleep(self._get_backoff(retry, None))
+            else:
+                if self.scheduler is not None:
+                    self.scheduler.record_response(
+                        response.status_code, response.headers
+                    )
+                if (
+                    response.status_code not in self.retry_statuses
+                    or retry >= self.max_retries
+                ):
+                    stats.response_bytes = len(response.content)
+                    return response.status_code, response.text
+                if not self._is_paced(response.status_code):
+                    time.sleep(
+                        self._get_backoff(retry, response.headers.get("Retry-After"))
+                    )
+            retry += 1
+            stats.retries = retry
+
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the pooled aiohttp session of the running event loop and creates it
+        if it does not exist yet.
+
+        Returns:
+            aiohttp session that allows persistent connections
+        """
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        async_session = self._async_sessions.get(loop)
+        if async_session is None or async_session.closed:
+            async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.connect_timeout, sock_read=self.read_timeout
+                ),
+            )
+            self._async_sessions[loop] = async_session
+        return async_session
+
+    async def apost(
+        self,
+        endpoint: str,
+        request_body: dict,
+        api_key: str,
+        stats: Optional[RequestStats] = None,
+    ) -> dict:
+        """
+        Asynchronous version of post that does not block the event loop.
+
+        Args:
+            endpoint: name of the endpoint, e.g. prompt_injection
+            request_body: json body of the request
+            api_key: API key for Lakera Guard
+            stats: gets filled in with the sizes, retries and timings of the request
+        Returns:
+            The endpoint's API response as dict
+        """
+        stats = stats or RequestStats()
+        data = json.dumps(request_body).encode()
+        stats.request_bytes = len(data)
+
+        start = time.perf_counter()
+        status, text = await self._apost_with_retries(endpoint, data, api_key, stats)
+        decoding_start = time.perf_counter()
+        # Time spent waiting for the scheduler is queueing, not network time
+        stats.network_seconds = decoding_start - start - stats.queue_seconds
+        try:
+            return self._decode_response(status, text)
+        finally:
+            stats.parsing_seconds = time.perf_counter() - decoding_start
+
+    async def _apost_with_retries(
+        self, endpoint: str, data: bytes, api_key: str, stats: RequestStats
+    ) -> Tuple[int, str]:
+        import aiohttp
+
+        retry = 0
+        while True:
+            if self.scheduler is not None:
+                stats.queue_seconds += await self.scheduler.aacquire(*get_scheduling())
+            try:
+                async with self._get_async_session().post(
+                    self._get_url(endpoint),
+                    data=data,
+                    headers=self._get_headers(api_key),
+                ) as response:
+                    body = await response.read()
+                    text = body.decode(response.get_encoding())
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if retry >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._get_backoff(retry, None))
+            else:
+                if self.scheduler is not None:
+                    self.scheduler.record_response(response.status, response.headers)
+                if response.status not in self.retry_statuses or (
+                    retry >= self.max_retries
+                ):
+                    stats.response_bytes = len(body)
+                    return response.status, text
+                if not self._is_paced(response.status):
+                    await asyncio.sleep(
+                        self._get_backoff(retry, response.headers.get("Retry-After"))
+                    )
+            retry += 1
+            stats.retries = retry
+
+    async def aclose(self) -> None:
+        """
+        Closes the pooled aiohttp session of the running event loop. Call this
+        before the event loop shuts down to release its connections cleanly.
+
+        Returns:
+            None
+        """
+        async_session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if async_session is not None:
+            await async_session.close()
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections of synchronous calls.
+
+        Returns:
+            None
+        """
+        if self._session is not None:
+            self._session.close()
+
+
+# Shared by all LakeraLCGuard instances that don't get their own transport, so that
+# they reuse the same persistent connections.
+default_transport = LakeraTransport()
@@ -0,0 +1,92 @@
+import re
+import threading
+
+import pytest
+
+from lakera_lcguard import LakeraTransport
+
+
+class PIITransport(LakeraTransport):
+    """
+    Answers like the pii endpoint of Lakera Guard and flags every email address.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.queries: list = []
+
+    def post(self, endpoint: str, request_body: dict, api_key: str, stats=None) -> dict:
+        self.queries.append(request_body["input"])
+        entities = [
+            {
+                "start": match.start(),
+                "end": match.end(),
+                "entity_type": "EMAIL_ADDRESS",
+                "text": match.group(),
+            }
+            for match in re.finditer(r"\S+@\S+\.com", request_body["input"])
+        ]
+        return {
+            "model": "pii",
+            "results": [
+                {
+                    "categories": {"pii": bool(entities)},
+                    "category_scores": {"pii": float(bool(entities))},
+                    "flagged": bool(entities),
+                    "payload": {"pii": entities},
+                }
+            ],
+            "dev_info": {},
+        }
+
+    async def apost(
+        self, endpoint: str, request_body: dict, api_key: str, stats=None
+    ) -> dict:
+        return self.post(endpoint, request_body, api_key, stats)
+
+
+class InjectionTransport(LakeraTransport):
+    """
+    Answers like a Lakera Guard endpoint that accepts a list of inputs and flags
+    inputs (or chat messages) that contain "ignore".
+    """
+
+    def __init__(self, multi_input: bool = True) -> None:
+        super().__init__()
+        self.multi_input = multi_input
+        self.request_bodies: list = []
+        self.lock = threading.Lock()
+
+    def post(self, endpoint: str, request_body: dict, api_key: str, stats=None) -> dict:
+        with self.lock:
+            self.request_bodies.append(request_body)
+        inputs = request_body["input"]
+        if not isinstance(inputs, list) or isinstance(inputs[0], dict):
+            inputs = [inputs]
+        elif not self.multi_input:
+            return {"error": "Invalid Request"}
+        return {
+            "model": endpoint,
+            "results": [
+                {
+                    "categories": {endpoint: "ignore" in str(query)},
+                    "flagged": "ignore" in str(query),
+                }
+                for query in inputs
+            ],
+        }
+
+    async def apost(
+        self, endpoint: str, request_body: dict, api_key: str, stats=None
+    ) -> dict:
+        return self.post(endpoint, request_body, api_key, stats)
+
+
+@pytest.fixture
+def pii_transport():
+    return PIITransport()
+
+
+@pytest.fixture
+def injection_transport():
+    return InjectionTransport()
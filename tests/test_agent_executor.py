@@ -0,0 +1,64 @@
+import asyncio
+
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+
+from lakera_lcguard import LakeraLCGuard
+from lakera_lcguard.integrations import _cleared_steps, _get_unchecked_steps
+
+
+@tool
+def define(query: str) -> str:
+    """Defines a term."""
+    return f"{query} is a word."
+
+
+def _get_step(query: str) -> tuple:
+    return AgentAction(tool="define", tool_input={"query": query}, log=""), query
+
+
+def test_unchecked_steps():
+    steps = [_get_step("cat"), _get_step("dog")]
+    assert _get_unchecked_steps(steps) == (True, steps)
+
+    token = _cleared_steps.set((steps, list(steps)))
+    try:
+        # cleared steps aren't checked again
+        assert _get_unchecked_steps(steps) == (False, [])
+        steps.append(_get_step("bird"))
+        assert _get_unchecked_steps(steps) == (False, steps[2:])
+
+        # a step that replaced a cleared one gets checked
+        _cleared_steps.set((steps, list(steps)))
+        del steps[1:]
+        steps.extend([_get_step("fish"), _get_step("bird")])
+        assert _get_unchecked_steps(steps) == (False, steps[1:])
+
+        # a new list is a new run
+        assert _get_unchecked_steps(list(steps)) == (True, steps)
+    finally:
+        _cleared_steps.reset(token)
+
+
+def test_guarded_agent_executor_checks_new_steps_once(injection_transport):
+    chain_guard = LakeraLCGuard(api_key="test", transport=injection_transport)
+
+    def agent(inputs):
+        steps = inputs["intermediate_steps"]
+        if len(steps) < 2:
+            query = ["cat", "dog"][len(steps)]
+            return AgentAction(tool="define", tool_input={"query": query}, log="")
+        return AgentFinish(return_values={"output": "done"}, log="")
+
+    GuardedAgentExecutor = chain_guard.get_guarded_agent_executor()
+    agent_executor = GuardedAgentExecutor(agent=RunnableLambda(agent), tools=[define])
+
+    assert agent_executor.invoke({"input": "Define two animals"})["output"] == "done"
+    # the steps of the run don't outlive it
+    assert _cleared_steps.get() is None
+    checked = [body["input"] for body in injection_transport.request_bodies]
+    assert checked == ["Define two animals", "cat is a word.", "dog is a word."]
+
+    asyncio.run(agent_executor.ainvoke({"input": "Define two animals"}))
+    assert len(injection_transport.request_bodies) == 6
@@ -0,0 +1,38 @@
+import json
+
+from benchmarks.import_time import IMPORT_TIME_BUDGET, measure_import_time
+from benchmarks.run import SCENARIOS, main, run_benchmarks
+
+
+def test_benchmarks_run_offline():
+    report = run_benchmarks(iterations=4, concurrency=2, agent_steps=[2])
+
+    names = [result["name"] for result in report["results"]]
+    assert len(names) == len(SCENARIOS) + 1
+    assert "agent_executor_2_steps" in names
+    assert "chat_conversation_incremental" in names
+
+    results = {result["name"]: result for result in report["results"]}
+    assert results["detect"]["operations"] == 4
+    assert results["detect"]["requests"] == 4
+    # Repeated inputs are answered from the cache
+    assert results["detect_cached"]["requests"] == 4
+    assert results["agent_executor_2_steps"]["requests"] == 4 * 3
+    for result in report["results"]:
+        assert 0 < result["latency"]["p50"] <= result["latency"]["max"]
+
+
+def test_benchmarks_write_json(tmp_path):
+    output = tmp_path / "results.json"
+    main(["--iterations", "2", "--scenario", "detect", "--output", str(output)])
+
+    report = json.loads(output.read_text())
+    assert [result["name"] for result in report["results"]] == ["detect"]
+    assert report["config"]["iterations"] == 2
+
+
+def test_import_time_within_budget():
+    result = measure_import_time(runs=1)
+
+    assert result["loaded"] == []
+    assert result["median"] <= IMPORT_TIME_BUDGET
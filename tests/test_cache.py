@@ -0,0 +1,178 @@
+import asyncio
+import socketserver
+import threading
+import time
+
+import pytest
+
+from lakera_lcguard import (
+    CacheBackend,
+    InMemoryCache,
+    LakeraLCGuard,
+    RedisCache,
+    SQLiteCache,
+)
+
+
+class _RedisStandIn(socketserver.ThreadingTCPServer):
+    """
+    In-process stand-in for a Redis server that understands the handful of commands
+    used by RedisCache.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _RedisStandInHandler)
+        self.data: dict = {}
+        self.lock = threading.Lock()
+
+
+class _RedisStandInHandler(socketserver.StreamRequestHandler):
+    server: _RedisStandIn
+
+    def handle(self) -> None:
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            self.wfile.write(self._execute(args[0].upper(), args[1:]))
+
+    def _execute(self, command: str, args: list) -> bytes:
+        data = self.server.data
+        with self.server.lock:
+            if command == "GET":
+                value, expires_at = data.get(args[0], (None, None))
+                if value is None or (expires_at and expires_at < time.time()):
+                    return b"$-1\r\n"
+                return b"$%d\r\n%s\r\n" % (len(value.encode()), value.encode())
+            if command == "SET":
+                expires_at = None
+                if len(args) == 4 and args[2].upper() == "PX":
+                    expires_at = time.time() + int(args[3]) / 1000
+                data[args[0]] = (args[1], expires_at)
+                return b"+OK\r\n"
+            if command == "SCAN":
+                prefix = args[2].rstrip("*")
+                keys = [key.encode() for key in data if key.startswith(prefix)]
+                reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys)
+                return reply + b"".join(
+                    b"$%d\r\n%s\r\n" % (len(key), key) for key in keys
+                )
+            if command == "DEL":
+                for key in args:
+                    data.pop(key, None)
+                return b":%d\r\n" % len(args)
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture
+def redis_stand_in():
+    server = _RedisStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_in_memory_cache_lru_and_ttl():
+    cache = InMemoryCache(max_size=2, ttl=0.2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    time.sleep(0.3)
+    assert cache.get("a") is None
+
+
+def test_sqlite_cache_is_shared(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    cache = SQLiteCache(path, ttl=0.2)
+    other_cache = SQLiteCache(path)
+
+    cache.set("a", "1")
+    assert other_cache.get("a") == "1"
+    assert other_cache.get("b") is None
+    assert (other_cache.hits, other_cache.misses) == (1, 1)
+
+    time.sleep(0.3)
+    assert other_cache.get("a") is None
+
+    other_cache.clear()
+    assert len(cache) == 0
+
+
+def test_redis_cache(redis_stand_in):
+    port = redis_stand_in.server_address[1]
+    cache = RedisCache.from_url(f"redis://127.0.0.1:{port}/0", ttl=0.2)
+    other_cache = RedisCache(host="127.0.0.1", port=port)
+
+    cache.set("a", "1")
+    assert other_cache.get("a") == "1"
+    assert redis_stand_in.data["lakera_lcguard:a"][0] == "1"
+
+    time.sleep(0.3)
+    assert cache.get("a") is None
+
+    other_cache.set("b", "2")
+    other_cache.clear()
+    assert cache.get("b") is None
+    cache.close()
+
+
+def test_unreachable_redis_cache_is_a_miss():
+    redis_stand_in = _RedisStandIn()
+    port = redis_stand_in.server_address[1]
+    redis_stand_in.server_close()
+
+    cache = RedisCache(host="127.0.0.1", port=port)
+    cache.set("a", "1")
+    assert cache.get("a") is None
+    assert cache.misses == 1
+
+
+class _ThreadRecordingCache(CacheBackend):
+    """
+    Cache that records the threads its blocking calls are made in.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.entries: dict = {}
+        self.threads: set = set()
+
+    def _get(self, key):
+        self.threads.add(threading.get_ident())
+        return self.entries.get(key)
+
+    def _set(self, key, value):
+        self.threads.add(threading.get_ident())
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+
+
+def test_async_checks_dont_block_the_event_loop(injection_transport):
+    cache = _ThreadRecordingCache()
+    chain_guard = LakeraLCGuard(
+        api_key="test", transport=injection_transport, cache=cache
+    )
+
+    async def adetect_twice():
+        await chain_guard.adetect("Hello")
+        await chain_guard.adetect("Hello")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(adetect_twice())
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.threads and loop_thread not in cache.threads
@@ -0,0 +1,51 @@
+import asyncio
+
+from lakera_lcguard import LakeraLCGuard
+from lakera_lcguard.lakera_lcguard import _split_into_chunks
+
+TEXT = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20
+    + "Reach me at jane.doe@example.com anytime.\n\n"
+) * 10
+
+
+def test_split_into_chunks():
+    chunks = _split_into_chunks(TEXT, 1000, 100)
+
+    assert all(len(chunk) <= 1000 for _, chunk in chunks)
+    assert all(TEXT[offset : offset + len(chunk)] == chunk for offset, chunk in chunks)
+    assert chunks[0][0] == 0
+    assert chunks[-1][0] + len(chunks[-1][1]) == len(TEXT)
+    # consecutive chunks overlap and start at a word boundary
+    for (offset, chunk), (next_offset, _) in zip(chunks, chunks[1:]):
+        assert offset < next_offset <= offset + len(chunk)
+        assert TEXT[next_offset - 1].isspace()
+
+
+def test_chunked_pii_offsets_refer_to_the_whole_input(pii_transport):
+    transport = pii_transport
+    chain_guard = LakeraLCGuard(
+        api_key="test",
+        endpoint="pii",
+        raise_error=False,
+        transport=transport,
+        chunk_size=1000,
+        chunk_overlap=100,
+    )
+
+    response = chain_guard.detect_with_response(TEXT)
+
+    assert len(transport.queries) == len(response["chunks"]) > 1
+    assert response["results"][0]["flagged"]
+    entities = response["results"][0]["payload"]["pii"]
+    assert len(entities) == TEXT.count("jane.doe@example.com")
+    for entity in entities:
+        assert TEXT[entity["start"] : entity["end"]] == "jane.doe@example.com"
+
+    assert asyncio.run(chain_guard.adetect_with_response(TEXT)) == response
+
+    # short inputs are sent as they are
+    assert chain_guard.detect_with_response("Hello")["results"][0]["payload"] == {
+        "pii": []
+    }
+    assert transport.queries[-1] == "Hello"
@@ -0,0 +1,79 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from lakera_lcguard import LakeraLCGuard
+from lakera_lcguard.redaction import redact_text, restore_text
+
+TEXT = "Write to jd@example.com or cs@example.com, but not jd@example.com."
+
+
+def _entities(text: str, value: str) -> list:
+    start = text.index(value)
+    return [{"start": start, "end": start + len(value), "entity_type": "EMAIL"}]
+
+
+def test_redact_text():
+    entities = _entities(TEXT, "cs@example.com") + [
+        {"start": 9, "end": 23, "entity_type": "EMAIL_ADDRESS"},
+        # overlapping entities get redacted as one span
+        {"start": 12, "end": 20, "entity_type": "EMAIL_ADDRESS"},
+    ]
+
+    assert redact_text(TEXT, entities) == (
+        "Write to XXXXXXXXXXXXXX or XXXXXXXXXXXXXX, but not jd@example.com."
+    )
+    assert redact_text(TEXT, entities, "placeholder") == (
+        "Write to [EMAIL_ADDRESS] or [EMAIL], but not jd@example.com."
+    )
+
+    mapping: dict = {}
+    redacted = redact_text(TEXT, entities, "token", mapping=mapping)
+    assert (
+        redacted == "Write to [EMAIL_ADDRESS_1] or [EMAIL_1], but not jd@example.com."
+    )
+    assert restore_text(redacted, mapping) == TEXT
+
+
+def test_redact_text_merges_partially_overlapping_entities():
+    text = "Call John Smith Jr. at 555-0100."
+    entities = [
+        {"start": 5, "end": 15, "entity_type": "PERSON"},
+        {"start": 10, "end": 19, "entity_type": "NAME"},
+    ]
+
+    assert redact_text(text, entities) == "Call XXXXXXXXXXXXXX at 555-0100."
+    assert redact_text(text, entities, "placeholder") == "Call [PERSON] at 555-0100."
+
+    mapping: dict = {}
+    redacted = redact_text(text, entities, "token", mapping=mapping)
+    assert redacted == "Call [PERSON_1] at 555-0100."
+    assert mapping == {"[PERSON_1]": "John Smith Jr."}
+    assert restore_text(redacted, mapping) == text
+
+
+def test_redact(pii_transport):
+    chain_guard = LakeraLCGuard(api_key="test", transport=pii_transport)
+
+    assert chain_guard.redact(TEXT, "placeholder") == (
+        "Write to [EMAIL_ADDRESS] or [EMAIL_ADDRESS], but not [EMAIL_ADDRESS]."
+    )
+    assert pii_transport.queries == [TEXT]
+
+    redacted, mapping = chain_guard.redact_with_mapping(TEXT)
+    assert redacted.count("[EMAIL_ADDRESS_1]") == 2
+    assert chain_guard.restore(redacted, mapping) == TEXT
+
+    messages = [
+        SystemMessage(content="Contact admin@example.com for help."),
+        HumanMessage(content=TEXT),
+    ]
+    redacted_messages = chain_guard.redact(messages)
+    assert redacted_messages[0] == messages[0]
+    assert "@" not in redacted_messages[1].content
+
+    prompt = ChatPromptTemplate.from_messages([("human", "{question}")])
+    redactor = prompt | chain_guard.get_redactor("placeholder")
+    redacted_prompt = asyncio.run(redactor.ainvoke({"question": TEXT}))
+    assert "@" not in redacted_prompt.to_messages()[0].content
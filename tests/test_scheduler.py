@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from lakera_lcguard import (
+    InMemoryMetrics,
+    RateLimitScheduler,
+    SchedulerTimeoutError,
+    scheduling,
+)
+from lakera_lcguard.scheduler import get_scheduling
+
+
+def test_priorities_and_tenant_quotas():
+    scheduler = RateLimitScheduler(rate=20, burst=1, tenant_quotas={"acme": 0.01})
+    # the first request of acme gets through right away
+    assert scheduler.acquire("interactive", "acme") < 0.01
+    order = []
+
+    def acquire(name, priority, tenant=None):
+        scheduler.acquire(priority, tenant)
+        order.append(name)
+
+    threads = [
+        threading.Thread(target=acquire, args=args, daemon=True)
+        for args in [
+            ("batch", "batch"),
+            ("acme", "interactive", "acme"),
+            ("interactive", "interactive"),
+        ]
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    threads[0].join(5)
+    threads[2].join(5)
+
+    # acme used up its quota but doesn't hold up the others
+    assert order == ["interactive", "batch"]
+
+    with pytest.raises(ValueError):
+        scheduler.acquire("urgent")
+
+
+def test_learns_from_rate_limit_responses():
+    metrics = InMemoryMetrics()
+    scheduler = RateLimitScheduler(
+        rate=100, recovery=0, max_wait={"interactive": 0.05}, metrics=metrics
+    )
+    scheduler.record_response(429, {"Retry-After": "0.2"})
+    assert scheduler.rate == 50
+    assert metrics.get_counter("scheduler_throttled_total") == 1
+
+    # paused by Retry-After
+    with pytest.raises(SchedulerTimeoutError):
+        scheduler.acquire("interactive")
+    assert metrics.get_counter("scheduler_timeouts_total", priority="interactive") == 1
+    assert asyncio.run(scheduler.aacquire("batch")) >= 0.1
+    assert not scheduler._waiters
+
+    scheduler.record_response(
+        200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0.1"}
+    )
+    assert scheduler.acquire() >= 0.05
+
+
+def test_scheduling_context():
+    assert get_scheduling() == (None, None)
+    with scheduling("batch", tenant="acme"):
+        with scheduling("interactive"):
+            assert get_scheduling() == ("interactive", "acme")
+        assert get_scheduling() == ("batch", "acme")
+    assert get_scheduling() == (None, None)
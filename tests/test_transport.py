@@ -0,0 +1,189 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+import pytest
+import requests
+
+from lakera_lcguard import (
+    CircuitBreaker,
+    InMemoryMetrics,
+    LakeraLCGuard,
+    LakeraTransport,
+    RateLimitScheduler,
+    SchedulerTimeoutError,
+    scheduling,
+)
+from lakera_lcguard.lakera_lcguard import GuardInput
+from lakera_lcguard.transport import RequestStats, default_transport
+
+
+class _FlakyServer(ThreadingHTTPServer):
+    """
+    Mock Lakera Guard server that records the requests it gets.
+    """
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _FlakyHandler)
+        self.requests: List[Tuple[str, dict]] = []
+        self.responses: List[Tuple[int, str]] = []
+        self.delay = 0.0
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Answers with the queued (status, body) responses of the server, then with a
+    benign Lakera Guard response.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: _FlakyServer
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        request_body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, request_body))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        status, body = (
+            self.server.responses.pop(0)
+            if self.server.responses
+            else (200, json.dumps({"results": [{"flagged": False}]}))
+        )
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def flaky_server():
+    server = _FlakyServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get_guard(server, **kwargs) -> LakeraLCGuard:
+    transport = LakeraTransport(
+        base_url=f"http://127.0.0.1:{server.server_address[1]}", **kwargs
+    )
+    return LakeraLCGuard(api_key="test", transport=transport)
+
+
+async def _adetect(chain_guard: LakeraLCGuard, prompt: str) -> GuardInput:
+    try:
+        return await chain_guard.adetect(prompt)
+    finally:
+        await chain_guard.aclose()
+
+
+def test_base_url_and_retries(flaky_server):
+    flaky_server.responses = [(503, "<html>unavailable</html>"), (429, "{}")]
+    chain_guard = _get_guard(flaky_server)
+
+    assert chain_guard.detect("Hello") == "Hello"
+    assert len(flaky_server.requests) == 3
+    assert flaky_server.requests[0] == ("/v1/prompt_injection", {"input": "Hello"})
+
+    flaky_server.responses = [(503, "{}"), (429, "{}")]
+    assert asyncio.run(_adetect(chain_guard, "Hello")) == "Hello"
+    assert len(flaky_server.requests) == 6
+
+
+def test_retries_are_bounded(flaky_server):
+    flaky_server.responses = [(503, "<html>unavailable</html>")] * 2
+    chain_guard = _get_guard(flaky_server, max_retries=1)
+
+    with pytest.raises(ValueError, match=r".*status 503.*"):
+        chain_guard.detect("Hello")
+    assert len(flaky_server.requests) == 2
+
+
+def test_read_timeout(flaky_server):
+    flaky_server.delay = 1.0
+    chain_guard = _get_guard(flaky_server, read_timeout=0.1, max_retries=0)
+
+    with pytest.raises(requests.Timeout):
+        chain_guard.detect("Hello")
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(_adetect(chain_guard, "Hello"))
+
+
+def test_scheduler_paces_retries(flaky_server):
+    flaky_server.responses = [(429, "{}")]
+    scheduler = RateLimitScheduler(rate=10, burst=1, recovery=0)
+    metrics = InMemoryMetrics()
+    transport = LakeraTransport(
+        base_url=f"http://127.0.0.1:{flaky_server.server_address[1]}",
+        scheduler=scheduler,
+    )
+    chain_guard = LakeraLCGuard(api_key="test", transport=transport, metrics=metrics)
+
+    assert chain_guard.detect("Hello") == "Hello"
+    assert len(flaky_server.requests) == 2
+    assert scheduler.throttled == 1
+    # the retry waited for a token of the lowered rate
+    histogram = metrics.get_histogram("queue_seconds", endpoint="prompt_injection")
+    assert histogram["count"] == 1 and histogram["sum"] >= 0.15
+
+    async def apost(stats):
+        try:
+            await transport.apost("prompt_injection", {"input": "Hi"}, "test", stats)
+        finally:
+            await transport.aclose()
+
+    stats = RequestStats()
+    asyncio.run(apost(stats))
+    assert stats.queue_seconds >= 0.15
+
+
+def test_queueing_is_not_a_slow_call(flaky_server):
+    scheduler = RateLimitScheduler(
+        rate=4, burst=1, recovery=0, max_wait={"interactive": 0.01}
+    )
+    breaker = CircuitBreaker(minimum_calls=3, slow_call_threshold=0.15)
+    transport = LakeraTransport(
+        base_url=f"http://127.0.0.1:{flaky_server.server_address[1]}",
+        scheduler=scheduler,
+    )
+    chain_guard = LakeraLCGuard(
+        api_key="test",
+        transport=transport,
+        circuit_breaker=breaker,
+        outage_policy="fail_open",
+    )
+
+    # every check waits about 0.25 s for the scheduler, but Lakera Guard is fast
+    for _ in range(4):
+        assert chain_guard.detect("Hello") == "Hello"
+    assert breaker.state == "closed"
+
+    # a request that times out in the queue raises instead of failing open
+    with scheduling("interactive"):
+        with pytest.raises(SchedulerTimeoutError):
+            chain_guard.detect("Hello")
+    assert breaker.state == "closed"
+    assert len(flaky_server.requests) == 4
+
+
+def test_module_session_is_kept_for_compatibility():
+    import lakera_lcguard.lakera_lcguard as lakera_lcguard_module
+
+    with pytest.warns(DeprecationWarning):
+        from lakera_lcguard.lakera_lcguard import session
+    assert session is default_transport.session
+    with pytest.warns(DeprecationWarning):
+        assert lakera_lcguard_module.session is session
+    with pytest.raises(AttributeError):
+        lakera_lcguard_module.no_such_attribute